@@ -0,0 +1,96 @@
+'''
+Asynchronous generation for asyncio services.
+
+    async for batch in agenerate(schema, 10_000, batch_size=500):
+        for obj in batch:
+            await queue.put(obj)
+
+Generating objects doesn't wait on anything, so a loop calling
+generate_object() never lets other coroutines run. agenerate() yields
+batches instead: small batches are generated in the event loop, which
+gets control back after each one, and batches of at least OFFLOAD_VALUES
+values are generated in an executor while the loop keeps running.
+The next batch is prepared while the current one is being consumed.
+
+The default executor of the loop is a thread pool. Generation holds the
+GIL, so the loop only runs every few milliseconds (see sys.getswitchinterval)
+while a thread generates a batch; a ProcessPoolExecutor avoids that,
+but then the schema must be passed as a string.
+'''
+import asyncio
+import concurrent.futures
+from typing import AsyncIterator, Union
+
+from interpreter import CompiledSchema, FakeObj, Columns, compile_schema, generate_columns
+
+# batches with at least this many values (rows times fields) go to the executor
+OFFLOAD_VALUES = 10_000
+
+
+def generate_rows(schema: Union[str, CompiledSchema], n: int, columnar: bool = False,
+                  first_row: int = 0, key=None) -> Union[list[FakeObj], Columns]:
+    '''n objects as a list, or as columns, from the row first_row on.
+    key chooses the permutations of unique fields. Runs in the executor.'''
+    if isinstance(schema, str):
+        schema = compile_schema(schema)
+    if columnar:
+        return generate_columns(schema, n, first_row=first_row, key=key)
+    generate = schema.bind(first_row=first_row, key=key)
+    return [generate() for _ in range(n)]
+
+
+async def agenerate(schema: Union[str, CompiledSchema], n: int = None, batch_size: int = 1000,
+                    executor: concurrent.futures.Executor = None,
+                    columnar: bool = False) -> AsyncIterator[Union[list[FakeObj], Columns]]:
+    '''Yields n objects in batches of batch_size, as lists of objects
+    (or dicts of columns if columnar is True). Never stops if n is None.
+
+    executor is used for the large batches, None means the loop's default executor.
+    The rows of seq and unique fields continue from batch to batch.
+    '''
+    if batch_size < 1:
+        raise ValueError('Batch size must be a positive number')
+
+    processes = isinstance(executor, concurrent.futures.ProcessPoolExecutor)
+    if processes and not isinstance(schema, str):
+        raise TypeError('The schema must be a string to be generated in other processes')
+
+    compiled = compile_schema(schema) if isinstance(schema, str) else schema
+    offload = batch_size * max(1, len(compiled.ast)) >= OFFLOAD_VALUES
+    # processes get the schema string, which is compiled once per process
+    task_schema = schema if processes else compiled
+    # the same permutations of unique fields in every batch, even in other processes
+    key = compiled.key
+    loop = asyncio.get_running_loop()
+
+    def batches():
+        '''Yields the size and the first row of every batch'''
+        row = 0
+        while n is None or row < n:
+            size = batch_size if n is None else min(batch_size, n - row)
+            yield size, row
+            row += size
+
+    if not offload:
+        for size, row in batches():
+            yield generate_rows(compiled, size, columnar, row, key)
+            # let the other coroutines run
+            await asyncio.sleep(0)
+        return
+
+    # one batch at a time is generated, while the previous one is consumed
+    pending = None
+    try:
+        for size, row in batches():
+            batch = None if pending is None else await pending
+            pending = loop.run_in_executor(executor, generate_rows, task_schema, size,
+                                           columnar, row, key)
+            if batch is not None:
+                yield batch
+        if pending is not None:
+            batch, pending = await pending, None
+            yield batch
+    finally:
+        # the consumer stopped early
+        if pending is not None:
+            pending.cancel()
@@ -0,0 +1,466 @@
+'''
+Benchmarks for the hot paths of the interpreter and of the myfaker CLI.
+
+Run with `python benchmark.py` from the capstone directory.
+
+Every benchmark measures a rate (higher is better) and is run a few times,
+keeping the best result. The results can be saved as JSON with --output,
+and compared with a saved run with --compare: benchmarks slower than the
+baseline by more than --threshold are reported as regressions, and the
+exit status is 1 if there are any.
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --compare baseline.json --threshold 0.1
+
+--quick runs every benchmark on less data, --filter selects benchmarks
+whose name contains the given text.
+
+The evaluate and compiled benchmarks compare the tree-walking evaluate()
+with the compiled generators, and the "file output" ones writing through
+a FileSink with reopening the file for every line (see bench_file_output).
+
+The "parse large" benchmarks measure the bytes of schema parsed per second
+on large generated schemas (see large_schemas), which the CLI parses
+again at every run. The "parse vs json" ones give the speed of parse
+as a percentage of the speed of json.loads on the same schemas: they don't
+depend much on the machine, so a slower parser shows up even next to a
+baseline from another one.
+
+The startup benchmarks measure `import myfaker` with python -X importtime
+in a fresh interpreter, and fail the run if it takes more than IMPORT_BUDGET_MS
+(the unit tests don't measure it, the times of a loaded machine vary too much):
+
+    python benchmark.py -k startup/import
+'''
+import argparse
+import json
+import os
+import pathlib
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Callable, Union
+
+from interpreter import parse, evaluate, compile_schema, generate_batch, generate_object
+from serializers import make_serializer, SERIALIZERS, SerializerError
+from sinks import FileSink
+
+
+SCHEMA = '''
+    {
+    "date": "timestamp:",
+    "name": "str:rand",
+    "type": "str:['client', 'partner', 'government']",
+    "age": "int:rand(1, 90)",
+    "str": "str:cat1",
+    "num": "int:1"
+    }
+    '''
+
+# schema shapes, next to the mixed SCHEMA above
+SHAPES = {
+    'mixed': SCHEMA,
+    # a few fields with long values
+    'wide': json.dumps({
+        'id': 'str:rand',
+        'text': 'str:' + 'loremipsumdolorsitamet' * 20,
+        'kind': "str:['" + "', '".join('category_' + 'x' * 40 + str(i) for i in range(5)) + "']",
+    }),
+    # many small fields
+    'narrow': json.dumps({f'f{i}': 'int:rand(0, 9)' for i in range(50)}),
+    # a field choosing from a long list
+    'choices': json.dumps({
+        'id': 'int:rand',
+        'city': 'str:[' + ', '.join(f"'city{i}'" for i in range(1000)) + ']',
+        'code': 'int:[' + ', '.join(str(i) for i in range(1000)) + ']',
+    }),
+    # an event payload with nested objects and arrays
+    'nested': json.dumps({
+        'id': 'str:rand',
+        'user': {'id': 'int:rand', 'name': 'name:', 'address': {'city': 'str:Paris', 'zip': 'int:rand'}},
+        'items': 'array(1..5) of {"sku": "int:rand", "qty": "int:rand(1, 9)"}',
+        'tags': "array(0..3) of enum:['new', 'gift', 'promo']",
+    }),
+    # the types drawn from lookup tables
+    'types': json.dumps({
+        'score': 'float:rand(0, 5)',
+        'active': 'bool:',
+        'born': 'date:rand(1950-01-01, 2005-12-31)',
+        'email': 'email:',
+        'name': 'name:',
+        'plan': "enum:['free':80, 'pro':15, 'enterprise':5]",
+    }),
+}
+
+
+def large_schemas(scale: float = 1.0) -> dict[str, str]:
+    '''Schemas with thousands of fields or long lists, by name'''
+    fields = max(1000, int(10_000 * scale))
+    items = max(1000, int(100_000 * scale))
+    specs = ['int:rand(1, 90)', 'str:rand', "str:['a', 'b', 'c']", 'float:rand(0, 5)', 'int:42',
+             'str:cat1', 'timestamp:', "enum:['free':80, 'pro':15]", 'int:seq', 'date:']
+    return {
+        # the same few field specs
+        'fields': json.dumps({f'field{i}': specs[i % len(specs)] for i in range(fields)}),
+        # a different field spec in every field
+        'distinct fields': json.dumps({
+            f'field{i}': [f'int:rand({i}, {i + 9})', f"str:['a{i}', 'b{i}']", f'float:{i}.5'][i % 3]
+            for i in range(fields)}),
+        'lists': json.dumps({
+            'city': 'str:[' + ', '.join(f"'city{i}'" for i in range(items)) + ']',
+            'code': 'int:[' + ', '.join(str(i) for i in range(items)) + ']',
+        }),
+        'weighted list': json.dumps({
+            'plan': 'enum:[' + ', '.join(f"'plan{i}':{i % 7 + 1}" for i in range(items // 2)) + ']',
+        }),
+    }
+
+
+MYFAKER = pathlib.Path(__file__).with_name('myfaker.py')
+
+# budget for importing myfaker, with the bytecode cached
+IMPORT_BUDGET_MS = 50
+
+
+def rows_per_second(fn, rows: int) -> float:
+    '''Calls fn() `rows` times and returns the achieved rate'''
+    start = time.perf_counter()
+    for _ in range(rows):
+        fn()
+    return rows / (time.perf_counter() - start)
+
+
+def bench_batch(schema: str = SCHEMA, rows: int = 100_000, batch_size: int = 10_000) -> dict:
+    '''Rate of columnar generation, and of turning the columns back into rows'''
+    compiled = compile_schema(schema)
+    batches = rows // batch_size
+
+    start = time.perf_counter()
+    for _ in range(batches):
+        generate_batch(compiled, batch_size)
+    columnar = rows / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    for _ in range(batches):
+        for _ in generate_batch(compiled, batch_size, columnar=False):
+            pass
+    return {
+        'batch (columns)': columnar,
+        'batch (rows)': rows / (time.perf_counter() - start),
+    }
+
+
+def bench_serializers(schema: str = SCHEMA, rows: int = 100_000) -> dict:
+    '''Serialization rate of every available serializer'''
+    compiled = compile_schema(schema)
+    objects = [compiled() for _ in range(1000)]
+    results = {}
+    for kind in SERIALIZERS:
+        try:
+            serialize = make_serializer(compiled, kind)
+        except SerializerError:
+            continue
+        start = time.perf_counter()
+        for i in range(rows):
+            serialize(objects[i % 1000])
+        results[f'serializer {kind}'] = rows / (time.perf_counter() - start)
+    return results
+
+
+def write_syscalls() -> Union[int, None]:
+    '''Number of write syscalls made by this process so far,
+    from /proc/self/io (None where there isn't one, e.g. outside Linux)'''
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if key == 'syscw':
+                    return int(value)
+    except OSError:
+        pass
+    return None
+
+
+def bench_file_output(schema: str = SCHEMA, lines: int = 1_000_000,
+                      legacy_lines: int = 20_000, chunk_rows: int = 1000) -> dict:
+    '''Compares writing through a FileSink with reopening the file for every line.
+
+    The legacy loop does an open, a write and a close per line,
+    so it is run on fewer lines and its rate and write syscalls are scaled up.
+    The write syscalls are measured with write_syscalls, they are None
+    where it can't count them.
+    '''
+    compiled = compile_schema(schema)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = pathlib.Path(tmp) / 'legacy.jsonl'
+        before = write_syscalls()
+        start = time.perf_counter()
+        for _ in range(legacy_lines):
+            with path.open('a') as f:
+                f.write(json.dumps(compiled()) + '\n')
+        legacy_rate = legacy_lines / (time.perf_counter() - start)
+        after = write_syscalls()
+        legacy_calls = None if before is None else (after - before) * lines // legacy_lines
+
+        before = write_syscalls()
+        start = time.perf_counter()
+        with FileSink(pathlib.Path(tmp) / 'sink.jsonl') as sink:
+            for done in range(0, lines, chunk_rows):
+                count = min(chunk_rows, lines - done)
+                sink.write_rows([json.dumps(compiled()) for _ in range(count)])
+        sink_rate = lines / (time.perf_counter() - start)
+        after = write_syscalls()
+        sink_calls = None if before is None else after - before
+
+    return {
+        'legacy rows/s': legacy_rate,
+        'legacy write syscalls': legacy_calls,
+        'sink rows/s': sink_rate,
+        'sink write syscalls': sink_calls,
+    }
+
+
+# The suite
+
+def bench_parse(schema: str, rows: int) -> float:
+    '''Schemas parsed per second'''
+    return rows_per_second(lambda: parse(schema), max(1, rows // 100))
+
+
+def bench_parse_bytes(schema: str) -> float:
+    '''Bytes of schema parsed per second'''
+    start = time.perf_counter()
+    parse(schema)
+    return len(schema) / (time.perf_counter() - start)
+
+
+def bench_parse_vs_json(schema: str) -> float:
+    '''Speed of parse as a percentage of the speed of json.loads on the same schema,
+    100 would be a parser as fast as decoding the schema's JSON'''
+    start = time.perf_counter()
+    json.loads(schema)
+    decoded = time.perf_counter()
+    parse(schema)
+    return 100 * (decoded - start) / (time.perf_counter() - decoded)
+
+
+def bench_generate_object(schema: str, rows: int) -> float:
+    '''generate_object(), including the lookup of the compiled schema in the cache'''
+    return rows_per_second(lambda: generate_object(schema), rows)
+
+
+def run_myfaker(args: list[str], lines: int, files: int = 0) -> float:
+    '''Runs the CLI in a subprocess, writing `lines` lines in total to stdout
+    or to `files` files, and returns the lines per second including the start-up time'''
+    data_lines = lines // max(files, 1)
+    lines = data_lines * max(files, 1)
+    with tempfile.TemporaryDirectory() as tmp:
+        argv = [sys.executable, str(MYFAKER), tmp, '--files-count', str(files),
+                '--data-lines', str(data_lines), *args]
+        start = time.perf_counter()
+        subprocess.run(argv, check=True, cwd=MYFAKER.parent,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return lines / (time.perf_counter() - start)
+
+
+def import_time(module: str = 'myfaker', repeat: int = 5) -> float:
+    '''Best cumulative import time of the module in a fresh interpreter, in seconds.
+
+    The bytecode is cached in a temporary directory (even if PYTHONDONTWRITEBYTECODE
+    is set) so that compiling the sources isn't measured, like in an installed package.
+    '''
+    with tempfile.TemporaryDirectory() as cache:
+        env = {**os.environ, 'PYTHONPYCACHEPREFIX': cache}
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+        argv = [sys.executable, '-X', 'importtime', '-c', f'import {module}']
+        times = []
+        # the first run fills the cache
+        for _ in range(repeat + 1):
+            proc = subprocess.run(argv, check=True, cwd=MYFAKER.parent, env=env,
+                                  capture_output=True, text=True)
+            # import time: self [us] | cumulative | imported package
+            for line in proc.stderr.splitlines():
+                _, cumulative, name = line.rsplit('|', 2)
+                if name.strip() == module:
+                    times.append(int(cumulative) / 1e6)
+        return min(times[1:])
+
+
+def has_module(name: str) -> bool:
+    try:
+        __import__(name)
+    except ImportError:
+        return False
+    return True
+
+
+# CLI output modes, as the number of files (0 for stdout) and arguments of myfaker
+OUTPUT_MODES = {
+    'stdout jsonl': (0, []),
+    'stdout csv': (0, ['--format', 'csv']),
+    'files jsonl': (4, []),
+    'files jsonl gzip': (4, ['--compression', 'gzip']),
+    'files csv': (4, ['--format', 'csv']),
+    'files parquet': (4, ['--format', 'parquet']),
+    'files arrow': (4, ['--format', 'arrow']),
+}
+
+
+def job_counts() -> list[int]:
+    '''Values of -j for the scaling benchmarks, up to the number of cores'''
+    cores = os.cpu_count() or 1
+    return [j for j in (1, 2, 4, 8, 16) if j <= cores] or [1]
+
+
+def benchmarks(scale: float = 1.0) -> dict[str, Callable[[], float]]:
+    '''All the benchmarks by name. Each one returns a rate in rows (or schemas, or bytes)
+    per second.
+    scale multiplies the amount of work done by every benchmark.'''
+    rows = max(1000, int(100_000 * scale))
+    lines = max(1000, int(1_000_000 * scale))
+    suite = {}
+
+    for shape, schema in SHAPES.items():
+        ast = parse(schema)
+        compiled = compile_schema(schema)
+        suite[f'parse/{shape}'] = lambda schema=schema: bench_parse(schema, rows)
+        suite[f'evaluate/{shape}'] = lambda ast=ast: rows_per_second(lambda: evaluate(ast), rows)
+        suite[f'generate_object/{shape}'] = \
+            lambda schema=schema: bench_generate_object(schema, rows)
+        suite[f'compiled/{shape}'] = lambda compiled=compiled: rows_per_second(compiled, rows)
+        suite[f'batch/{shape}'] = \
+            lambda schema=schema: bench_batch(schema, rows, min(rows, 10_000))['batch (columns)']
+        suite[f'serialize/{shape}'] = \
+            lambda schema=schema: bench_serializers(schema, rows)['serializer schema']
+
+    # the legacy loop reopens the file for every line, the sink writes its buffer
+    legacy = max(1000, int(20_000 * scale))
+    suite['file output/legacy'] = \
+        lambda: bench_file_output(lines=legacy, legacy_lines=legacy)['legacy rows/s']
+    suite['file output/sink'] = \
+        lambda: bench_file_output(lines=lines, legacy_lines=1)['sink rows/s']
+    if write_syscalls() is not None:
+        suite['file output/sink lines per write'] = lambda: lines / max(
+            1, bench_file_output(lines=lines, legacy_lines=1)['sink write syscalls'])
+
+    for name, schema in large_schemas(scale).items():
+        suite[f'parse large/{name}'] = lambda schema=schema: bench_parse_bytes(schema)
+        suite[f'parse vs json/{name}'] = lambda schema=schema: bench_parse_vs_json(schema)
+
+    schema = ['--data-schema', SCHEMA]
+    arrow = has_module('pyarrow')
+    for mode, (files, args) in OUTPUT_MODES.items():
+        if not arrow and ('parquet' in args or 'arrow' in args):
+            continue
+        suite[f'cli/{mode}'] = \
+            lambda files=files, args=args: run_myfaker([*schema, *args], lines, files)
+
+    for jobs in job_counts():
+        args = [*schema, '-j', str(jobs)]
+        suite[f'cli/jobs {jobs}'] = lambda args=args: run_myfaker(args, lines, 8)
+
+    # imports and runs per second
+    suite['startup/import myfaker'] = lambda: 1 / import_time('myfaker', repeat=1)
+    suite['startup/cli 10 lines'] = lambda: run_myfaker(schema, 10) / 10
+
+    return suite
+
+
+def unit(name: str) -> str:
+    '''The unit of the results of a benchmark'''
+    if name.startswith('parse vs json/'):
+        return '%'
+    if name.endswith(' per write'):
+        return 'lines'
+    return '/s'
+
+
+def run_suite(suite: dict[str, Callable[[], float]], repeat: int = 3,
+              log: Callable[[str], None] = None) -> dict[str, float]:
+    '''Runs every benchmark `repeat` times and keeps the best rate'''
+    results = {}
+    for name, bench in suite.items():
+        results[name] = max(bench() for _ in range(repeat))
+        if log:
+            log(f'{name:<32} {results[name]:>14,.0f} {unit(name)}')
+    return results
+
+
+def machine_info() -> dict:
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+    }
+
+
+def save_results(path: pathlib.Path, results: dict[str, float]) -> None:
+    data = {'machine': machine_info(), 'unit': 'per second', 'results': results}
+    path.write_text(json.dumps(data, indent=2) + '\n')
+
+
+def load_results(path: pathlib.Path) -> dict[str, float]:
+    return json.loads(path.read_text())['results']
+
+
+def compare(results: dict[str, float], baseline: dict[str, float],
+            threshold: float = 0.1) -> list[tuple[str, float, float, float, bool]]:
+    '''Compares the results with a baseline. Returns (name, baseline rate, rate,
+    relative change, regression) for every benchmark in both,
+    where a regression is a rate lower than the baseline by more than threshold.'''
+    rows = []
+    for name, rate in results.items():
+        if name not in baseline:
+            continue
+        change = rate / baseline[name] - 1 if baseline[name] else 0.0
+        rows.append((name, baseline[name], rate, change, change < -threshold))
+    return rows
+
+
+def main(argv=None) -> int:
+    argparser = argparse.ArgumentParser(description='Benchmarks of the interpreter and myfaker')
+    argparser.add_argument('--output', '-o', type=pathlib.Path,
+                           help='Save the results as JSON to this file')
+    argparser.add_argument('--compare', '-c', type=pathlib.Path,
+                           help='Compare the results with a saved JSON file')
+    argparser.add_argument('--threshold', type=float, default=0.1,
+                           help='Relative slowdown reported as a regression')
+    argparser.add_argument('--filter', '-k', default='',
+                           help='Only run benchmarks whose name contains this text')
+    argparser.add_argument('--repeat', type=int, default=3,
+                           help='Runs of every benchmark, the best one is kept')
+    argparser.add_argument('--quick', action='store_true',
+                           help='Run every benchmark on a tenth of the data')
+    args = argparser.parse_args(argv)
+
+    suite = benchmarks(0.1 if args.quick else 1.0)
+    suite = {name: bench for name, bench in suite.items() if args.filter in name}
+    results = run_suite(suite, args.repeat, log=print)
+
+    if args.output:
+        save_results(args.output, results)
+
+    if args.compare:
+        rows = compare(results, load_results(args.compare), args.threshold)
+        print(f'\n{"benchmark":<32} {"baseline":>14} {"current":>14} {"change":>8}')
+        for name, before, after, change, regression in rows:
+            mark = '  REGRESSION' if regression else ''
+            print(f'{name:<32} {before:>14,.0f} {after:>14,.0f} {change:>+8.1%}{mark}')
+        if any(row[4] for row in rows):
+            return 1
+
+    if 'startup/import myfaker' in results:
+        import_ms = 1000 / results['startup/import myfaker']
+        print(f'\nimport myfaker: {import_ms:.1f} ms (budget {IMPORT_BUDGET_MS} ms)')
+        if import_ms > IMPORT_BUDGET_MS:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,97 @@
+'''
+Thin client for `myfaker serve`, taking the same arguments as myfaker.py:
+
+    python client.py out -s schema.json --data-lines 100 > data.jsonl
+
+The arguments are sent to the server, which parses them, generates the
+lines and streams them back, so the client only pays for starting the
+interpreter. Only writing to stdout is done by the server. For files,
+--stats, or when no server is listening, the client runs myfaker.py itself.
+
+The socket is MYFAKER_SOCKET, or myfaker-<uid>.sock in the temp directory.
+
+Protocol, over a Unix socket:
+  client: one JSON line {"argv": [...], "cwd": "..."}
+  server: one JSON line {"status": "ok" | "local" | "error", "message": ...},
+          then if ok frames of data, each prefixed with its length as a
+          4 byte big-endian integer, an empty frame, and a final JSON line
+          {"status": "done" | "error", "message": ...}
+'''
+import json
+import os
+import socket
+import struct
+import sys
+import tempfile
+
+FRAME_HEADER = struct.Struct('>I')
+
+MYFAKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'myfaker.py')
+
+
+def default_socket() -> str:
+    return os.environ.get('MYFAKER_SOCKET') or \
+        os.path.join(tempfile.gettempdir(), f'myfaker-{os.getuid()}.sock')
+
+
+def _read_exactly(f, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) < size:
+        raise ConnectionError('Connection to the server closed')
+    return data
+
+
+def request(argv: list[str], path: str = None, out=None, cwd: str = None):
+    '''Sends the arguments to the server and copies the generated lines to out
+    (stdout by default). Returns the exit status, or None if the command
+    has to be run locally. Raises OSError if there is no server.'''
+    out = out or sys.stdout.buffer
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(path or default_socket())
+        message = {'argv': argv, 'cwd': cwd or os.getcwd()}
+        sock.sendall(json.dumps(message).encode() + b'\n')
+
+        with sock.makefile('rb') as f:
+            reply = json.loads(f.readline() or b'{"status": "error"}')
+            if reply['status'] == 'local':
+                return None
+            if reply['status'] == 'ok':
+                while True:
+                    size, = FRAME_HEADER.unpack(_read_exactly(f, FRAME_HEADER.size))
+                    if size == 0:
+                        break
+                    out.write(_read_exactly(f, size))
+                out.flush()
+                reply = json.loads(f.readline())
+
+    if reply['status'] != 'done':
+        print(reply.get('message', 'The server failed'), file=sys.stderr)
+        return 1
+    return 0
+
+
+def run_locally(argv: list[str]):
+    os.execv(sys.executable, [sys.executable, MYFAKER, *argv])
+
+
+def main(argv=None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    try:
+        status = request(argv)
+    except (FileNotFoundError, ConnectionRefusedError):
+        status = None
+    except BrokenPipeError:
+        # the reader of stdout went away
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        return 0
+    except KeyboardInterrupt:
+        return 130
+
+    if status is None:
+        sys.stdout.flush()
+        run_locally(argv)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,173 @@
+'''
+Output formats other than JSON lines.
+
+The rows are generated in batches of columns (see interpreter.generate_columns)
+and every batch is written at once: as a block of CSV lines, a Parquet
+row group or an Arrow IPC record batch. No dict is built per row.
+
+Field types are mapped to column types:
+  int       -> int64 (null for "int:")
+  float     -> float64 (null for "float:")
+  bool      -> bool
+  date      -> date32
+  str, email, name, enum -> string
+  timestamp -> timestamp with microseconds, UTC
+  datetime  -> string (ISO 8601)
+  object    -> struct
+  array     -> list
+
+In CSV files, nested objects and arrays are written as JSON.
+
+Parquet and Arrow require the pyarrow package. They use the compression
+codecs of the format instead of compressing the whole file, and can't be
+appended to, so existing files with the same name are replaced.
+'''
+import csv
+import io
+import json
+import pathlib
+from typing import Iterator
+
+from interpreter import CompiledSchema, Columns, ListColumn, column_values
+
+FORMATS = ('jsonl', 'csv', 'parquet', 'arrow')
+
+EXTENSIONS = {'jsonl': '.jsonl', 'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+
+# formats written by pyarrow, which can't be written in parts or to stdout
+ARROW_FORMATS = ('parquet', 'arrow')
+
+# codecs of the --compression option supported inside the files
+_CODECS = {
+    'parquet': {'none': 'none', 'gzip': 'gzip', 'zstd': 'zstd'},
+    'arrow': {'none': None, 'zstd': 'zstd'},
+}
+
+
+class FormatError(Exception):
+    """Raised when an output format can't be used."""
+    pass
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+    except ImportError:
+        raise FormatError('Parquet and Arrow output require the pyarrow package')
+    return pyarrow
+
+
+def check_format(fmt: str, compression: str = 'none') -> None:
+    '''Raises FormatError if the format can't be written with the compression'''
+    if fmt not in FORMATS:
+        raise FormatError(f'Unknown format: {fmt}')
+    if fmt in ARROW_FORMATS:
+        _pyarrow()
+        if compression not in _CODECS[fmt]:
+            raise FormatError(f"{fmt} files don't support {compression} compression")
+
+
+def _csv_values(column) -> list:
+    values = column_values(column)
+    if isinstance(column, (dict, ListColumn)):
+        return [json.dumps(value) for value in values]
+    return values
+
+
+# CSV
+
+def csv_header(compiled: CompiledSchema) -> bytes:
+    out = io.StringIO()
+    csv.writer(out, lineterminator='\n').writerow(compiled.ast)
+    return out.getvalue().encode()
+
+
+def csv_rows(columns: Columns) -> bytes:
+    out = io.StringIO()
+    csv.writer(out, lineterminator='\n').writerows(
+        zip(*(_csv_values(column) for column in columns.values())))
+    return out.getvalue().encode()
+
+
+# Parquet and Arrow IPC
+
+def _arrow_type(pa, spec: tuple):
+    typ, modi = spec
+    if typ == 'object':
+        return pa.struct([pa.field(name, _arrow_type(pa, child)) for name, child in modi.items()])
+    if typ == 'array':
+        return pa.list_(_arrow_type(pa, modi[2]))
+    types = {
+        'int': pa.int64(),
+        'str': pa.string(),
+        'timestamp': pa.timestamp('us', tz='UTC'),
+        'datetime': pa.string(),
+        'float': pa.float64(),
+        'bool': pa.bool_(),
+        'date': pa.date32(),
+        'email': pa.string(),
+        'name': pa.string(),
+        'enum': pa.string(),
+    }
+    return types[typ]
+
+
+def arrow_schema(compiled: CompiledSchema):
+    pa = _pyarrow()
+    return pa.schema([pa.field(name, _arrow_type(pa, spec)) for name, spec in compiled.ast.items()])
+
+
+def _arrow_array(pa, typ, column):
+    if pa.types.is_struct(typ):
+        children = [_arrow_array(pa, typ.field(i).type, child)
+                    for i, child in enumerate(column.values())]
+        return pa.StructArray.from_arrays(children, fields=list(typ))
+    if pa.types.is_list(typ):
+        offsets = pa.array(column.offsets, pa.int32())
+        return pa.ListArray.from_arrays(offsets, _arrow_array(pa, typ.value_type, column.values),
+                                        type=typ)
+    if pa.types.is_timestamp(typ):
+        # seconds as floats to integer microseconds
+        if hasattr(column, 'astype'):
+            micros = (column * 1e6).round().astype('int64')
+        else:
+            micros = [round(t * 1e6) for t in column]
+        return pa.array(micros, pa.int64()).cast(typ)
+    if pa.types.is_date(typ):
+        # ISO dates
+        return pa.array(column, pa.string()).cast(typ)
+    return pa.array(column, typ)
+
+
+def arrow_batch(schema, columns: Columns):
+    pa = _pyarrow()
+    arrays = [_arrow_array(pa, field.type, column)
+              for field, column in zip(schema, columns.values())]
+    return pa.RecordBatch.from_arrays(arrays, schema=schema)
+
+
+def write_arrow_file(path: pathlib.Path, compiled: CompiledSchema, batches: Iterator[Columns],
+                     fmt: str, compression: str = 'none') -> int:
+    '''Writes every batch of columns (or record batch) as a Parquet row group
+    or an Arrow record batch.
+    Returns the size of the file.'''
+    check_format(fmt, compression)
+    pa = _pyarrow()
+    schema = arrow_schema(compiled)
+    codec = _CODECS[fmt][compression]
+
+    if fmt == 'parquet':
+        import pyarrow.parquet
+        writer = pyarrow.parquet.ParquetWriter(path, schema, compression=codec)
+    else:
+        import pyarrow.ipc
+        options = pyarrow.ipc.IpcWriteOptions(compression=codec)
+        writer = pa.ipc.new_file(path, schema, options=options)
+
+    with writer:
+        for batch in batches:
+            # batches may already be converted to record batches
+            if isinstance(batch, dict):
+                batch = arrow_batch(schema, batch)
+            writer.write_batch(batch)
+    return path.stat().st_size
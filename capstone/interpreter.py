@@ -1,10 +1,18 @@
 import time
-import uuid
 import json
 import re
 import random
 import logging
-from typing import Union
+import functools
+import os
+import itertools
+import math
+import sys
+from typing import Callable, Iterator, NamedTuple, Sequence, Union
+
+from uuidgen import next_uuid, random_uuids, uuid_stream
+from permutation import Permutation, permutation
+import words
 
 '''
 Something like the python Faker package.
@@ -15,6 +23,9 @@ with fields according to the spec, and with random values.
 
 ---
 
+Use compile_schema(spec) to parse a spec once and generate many objects,
+and generate_batch(spec, n) to generate whole columns of values at once.
+
 The interpretation of a schema string happens in two steps:
 1. Parsing the string into an AST
 2. Evaluating the AST and returning the generated python object
@@ -30,9 +41,24 @@ The AST is represented with a python dict that looks like this:
     'num': ('int', 1),
 }
 
-I didn't write a specification for the AST on purpose,
-because in a real scenario the AST would change very often.
-However, i did write unit tests for the parser which act as a specification.
+The parser checks the whole schema, so the AST only contains these
+modifiers, with values of the type of the field (the unit tests of
+the parser give more examples):
+  int        None, an int, ('rand',), ('rand', a, b) with a <= b,
+             ('seq',), ('seq', start, step), ('unique', a, b)
+  str        None, a string, ('rand',)
+  float      None, a float, ('rand',), ('rand', a, b)
+  date       ('rand', start, end) with ISO dates
+  timestamp, datetime
+             None, ('rand',), ('rand', a, b), ('seq', start, step)
+             with floats (seconds since the epoch)
+  bool, email, name
+             ('rand',)
+  int, str, float, enum
+             a non-empty list, ('weighted', values, weights, alias table)
+  all but bool, timestamp and datetime
+             ('ref', pattern, field)
+The evaluators rely on it and don't check the AST again.
 
 Syntax of the shema string:
   Schema is a valid JSON object where values are strings called "field specifiers".
@@ -41,89 +67,746 @@ Syntax of the shema string:
   The field specifier has the following syntax:
   field_spec := \" field_type ":" field_modifier \"
 
+  A field_type is one of int, str, timestamp, datetime, float, bool,
+  date, email, name and enum.
+
   A field_modifier is one of:
   - "rand"
-  - "rand(<int1>, <int2>)"
-    (e.g. "rand(1, 2)")
-  - list of strings/ints
+  - "rand(<a>, <b>)" with two integers, two numbers (float fields)
+    or two ISO dates (date fields)
+    (e.g. "rand(1, 2)", "rand(0.5, 1.5)", "rand(2020-01-01, 2020-12-31)")
+  - list of strings/numbers, of the type of the field
     (e.g. ['a', 'b'])
+  - list of value:weight items, drawn in constant time with alias tables
+    (e.g. ['client':5, 'partner':1])
   - string literal (starting with a letter, only alphanumerics)
-  - integer
+  - number
   - an empty string ("")
 
-On any syntax error, the parser raises the custom ParsingError exception.
-Some syntax errors are only detected during evaluation,
-which is a trade-off made to simplify the parser.
-(Not that it makes any difference in this simple program)
+  timestamp values are seconds since the epoch and datetime values the
+  same times as ISO strings in UTC (e.g. "2024-05-01T12:30:00.000000Z").
+  Both are the current time when empty or "rand", and also support
+  "rand(<start>, <end>)" and "seq(<start>, <step>)" (start + step * row),
+  where start and end are numbers of seconds or ISO dates and times
+  (UTC unless they have a time zone) and step is a number of seconds,
+  e.g. "timestamp:seq(2024-01-01T00:00, 60)". Other modifiers are
+  ignored, with a warning while parsing. datetime values must be between
+  the years 1 and 9999: rand ranges outside are rejected while parsing,
+  and a seq leaving them raises OverflowError.
+
+  The other new types are random whenever they are empty or "rand":
+  bool is true or false, date is an ISO date between 1970 and 2037,
+  email and name are drawn from the word lists in words.py.
+  float:rand is between 0 and 1. enum fields require a list.
+
+  Instead of a field specifier, a value can be a nested object of field
+  specifiers, e.g. {"user": {"id": "int:rand", "name": "name:"}},
+  or an array:
+  array_spec := \"array(" n ".." m ") of " element \"
+  with between n and m elements (or exactly n with "array(n)"),
+  where the element is a field specifier, an array_spec or an object
+  written as JSON, e.g. "array(1..3) of {\\"sku\\": \\"int:rand\\"}".
+
+  Nested values are ('object', AST) and ('array', (n, m, element)) in the AST.
+
+  Fields of relational datasets (int fields, outside of arrays):
+  - "seq" or "seq(<start>, <step>)": start + step * row, starting at 1
+  - "unique(<a>, <b>)": every value of [a, b] at most once, in random order
+  - "ref(<pattern>.<field>)": a value of the field in the JSON lines
+    or CSV files matching the pattern, e.g. "int:ref(users/*.jsonl.id)"
+    (ref works for str and float fields too, see refs.py)
+  row is the index of the line among all the generated lines, in every
+  file and every worker (file index * lines per file + line in the file).
+
+On any syntax error, and on any modifier the type of the field doesn't
+support, the parser raises the custom ParsingError exception, before
+anything is generated. Its message gives the field and the column of the
+field spec where the parser stopped, e.g.
+  Field "age": Expected "," at column 12 (near "10)")
 '''
 
 
 class ParsingError(Exception):
-    """Raised when the input string does not match the expected grammar."""
-    pass
+    """Raised when the input string does not match the expected grammar.
+
+    position is the index in text (the schema or a field spec) where the
+    parser stopped, if known, and field the name of the field, with dots
+    for nested fields.
+    """
+
+    def __init__(self, message: str, position: int = None, text: str = None):
+        super().__init__(message)
+        self.message = message
+        self.position = position
+        self.text = text
+        self.field = None
+
+    def __str__(self) -> str:
+        s = self.message
+        if self.position is not None and self.text is not None:
+            s += ' ' + _location(self.text, self.position)
+        if self.field is not None:
+            s = f'Field "{self.field}": {s}'
+        return s
+
+
+def _location(text: str, position: int) -> str:
+    '''E.g. 'at column 10 (near "x)")', with the line too in multiline texts'''
+    line_start = text.rfind('\n', 0, position) + 1
+    where = f'column {position - line_start + 1}'
+    if '\n' in text:
+        line = text.count('\n', 0, position) + 1
+        where = f'line {line}, {where}'
+    near = text[position:position + 20].split('\n')[0]
+    return f'at {where} ' + (f'(near "{near}")' if near else '(at the end)')
+
 
 FieldModifier = Union[int, str, float]
 
-def parse_field_modifier(s: str) -> FieldModifier:
-    '''The field modifier is parsed separately from the field type for simplicity,
-    but this also means we can't detect some syntax errors during parsing.
-    They will be detected during evaluation instead.
-    '''
-    if s == '':
+FIELD_TYPES = ('int', 'str', 'timestamp', 'datetime', 'float', 'bool', 'date', 'email',
+               'name', 'enum')
+
+# fields with times, as seconds since the epoch and as ISO strings
+TIME_TYPES = ('timestamp', 'datetime')
+
+# date:rand without a range
+DEFAULT_DATE_RANGE = ('1970-01-01', '2037-12-31')
+
+# ints are 64-bit, like the columns of batches and of Parquet and Arrow files
+INT64_MIN, INT64_MAX = -2 ** 63, 2 ** 63 - 1
+
+# seconds since the epoch of datetime values, from 0001-01-01 to 9999-12-31T23:59:59
+TIME_MIN, TIME_MAX = -62135596800, 253402300799
+
+
+def _is_number(value) -> bool:
+    # bools are ints too
+    return type(value) in (int, float)
+
+
+class AliasTable(NamedTuple):
+    '''Vose's alias tables for drawing one of n values with weights
+    in constant time: draw u uniformly from [0, n), take i = int(u),
+    then values[i] if u - i < prob[i], otherwise values[alias[i]].'''
+    prob: tuple[float, ...]
+    alias: tuple[int, ...]
+
+
+def alias_table(weights: Sequence[float]) -> AliasTable:
+    '''Builds the alias tables of the weights, in O(n)'''
+    n = len(weights)
+    total = math.fsum(weights)
+    # weights scaled so that the average is 1
+    scaled = [w * n / total for w in weights]
+    prob = [1.0] * n
+    alias = list(range(n))
+
+    small = [i for i, w in enumerate(scaled) if w < 1]
+    large = [i for i, w in enumerate(scaled) if w >= 1]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        # the column of `less` is topped up by `more`
+        prob[less] = scaled[less]
+        alias[less] = more
+        scaled[more] -= 1 - scaled[less]
+        (small if scaled[more] < 1 else large).append(more)
+    # the remaining columns are full, up to rounding errors
+
+    return AliasTable(tuple(prob), tuple(alias))
+
+
+def _check_int64(*values: int) -> None:
+    if min(values) < INT64_MIN or max(values) > INT64_MAX:
+        raise ParsingError(f'Int values must be between {INT64_MIN} and {INT64_MAX}')
+
+
+def _check_list(typ: str, items: Sequence) -> list:
+    '''Checks the items of a list modifier, returns them normalized'''
+    # the checks run in C, lists can have many thousands of items
+    types = set(map(type, items))
+    if typ == 'str':
+        if types != {str}:
+            raise ParsingError('List items of a string field must be strings')
+    elif typ == 'enum':
+        if types != {str}:
+            raise ParsingError('List items of an enum field must be strings')
+    elif typ == 'int':
+        # bools are ints too
+        if types != {int}:
+            raise ParsingError('List items of an int field must be ints')
+        _check_int64(*items)
+    elif typ == 'float':
+        if not types <= {int, float} or not all(map(math.isfinite, items)):
+            raise ParsingError('List items of a float field must be finite numbers')
+        return list(map(float, items))
+    else:
+        raise ParsingError(f"{typ.capitalize()} fields don't support lists")
+    return list(items)
+
+
+def _check_int_str(typ: str, modi: FieldModifier) -> None:
+    '''Checks the modifier of an int or str field, besides lists and row modifiers'''
+    if modi is None or modi == ('rand',):
+        return
+    if isinstance(modi, tuple) and modi[0] == 'ref':
+        return
+
+    if typ == 'int':
+        if type(modi) is int:
+            _check_int64(modi)
+            return
+        if isinstance(modi, tuple) and modi[0] == 'rand':
+            _, start, end = modi
+            if type(start) is not int or type(end) is not int:
+                raise ParsingError('Arguments to rand must be two integers')
+            if start > end:
+                raise ParsingError('The range of rand is empty')
+            _check_int64(start, end)
+            return
+        raise ParsingError('Int fields support rand, rand with a range of integers, '
+                           'integers and lists of integers')
+
+    if isinstance(modi, str):
+        return
+    if isinstance(modi, tuple) and modi[0] == 'rand':
+        raise ParsingError("String fields don't support rand with range")
+    raise ParsingError('String fields support rand, alphanumeric strings and lists of strings')
+
+
+def _check_new_type(typ: str, modi: FieldModifier) -> FieldModifier:
+    '''Checks the modifier of the types which are validated while parsing,
+    returns it normalized (e.g. float literals as floats)'''
+    if isinstance(modi, tuple) and modi[0] == 'ref' and typ != 'bool':
+        return modi
+
+    if typ == 'float':
+        if modi is None or modi == ('rand',):
+            return modi
+        if _is_number(modi):
+            return float(modi)
+        if isinstance(modi, tuple) and all(_is_number(arg) for arg in modi[1:]):
+            _, start, end = modi
+            if start > end:
+                raise ParsingError('The range of rand is empty')
+            if not math.isfinite(end - start):
+                raise ParsingError('The range of rand is too wide for floats')
+            return ('rand', float(start), float(end))
+        raise ParsingError('Float fields support rand, rand with a range of numbers, '
+                           'numbers and lists of numbers')
+
+    if typ == 'date':
+        if modi is None or modi == ('rand',):
+            return ('rand', *DEFAULT_DATE_RANGE)
+        # ISO dates without a time have 10 characters
+        if isinstance(modi, tuple) and all(isinstance(arg, str) and len(arg) == 10
+                                           for arg in modi[1:]):
+            if modi[1] > modi[2]:
+                raise ParsingError('The range of rand is empty')
+            return modi
+        raise ParsingError('Date fields support rand and rand with a range of dates')
+
+    if typ == 'enum':
+        raise ParsingError('Enum fields require a list of values')
+
+    # bool, email and name
+    if modi is None or modi == ('rand',):
+        return ('rand',)
+    raise ParsingError(f'{typ.capitalize()} fields only support rand')
+
+
+def _epoch_seconds(arg: Union[int, float, str]) -> float:
+    '''Numbers are seconds since the epoch, ISO dates and times without a time zone are UTC'''
+    if _is_number(arg):
+        return float(arg)
+    import datetime
+    t = datetime.datetime.fromisoformat(arg)
+    if t.tzinfo is None:
+        t = t.replace(tzinfo=datetime.timezone.utc)
+    return t.timestamp()
+
+
+def _check_time(typ: str, modi: FieldModifier) -> FieldModifier:
+    '''Returns the modifier of a timestamp or datetime field with the times
+    as seconds since the epoch, e.g. ('rand', 1704067200.0, 1735689600.0)'''
+    if modi is None or modi == ('rand',):
+        return modi
+    if not isinstance(modi, tuple) or modi[0] not in ('rand', 'seq'):
+        # these used to be ignored at every row
+        logging.warning(f'Modifiers other than rand and seq are ignored in {typ} fields')
         return None
 
-    if s[0] == '[':
-        # convert single quotes to double quotes to parse as json
-        s = s.replace("'", '"')
+    if len(modi) == 1:
+        raise ParsingError(f'seq of {typ} fields requires a start and a step, e.g. seq(0, 60)')
+    keyword, start, end = modi
+    if keyword == 'seq':
+        if not _is_number(end) or end == 0:
+            raise ParsingError('The step of seq must be a number of seconds other than zero')
+        modi = ('seq', _epoch_seconds(start), float(end))
+        times = modi[1:2]
+    else:
+        modi = ('rand', _epoch_seconds(start), _epoch_seconds(end))
+        if modi[1] > modi[2]:
+            raise ParsingError('The range of rand is empty')
+        if not math.isfinite(modi[2] - modi[1]):
+            raise ParsingError('The range of rand is too wide for floats')
+        times = modi[1:]
+
+    if typ == 'datetime' and not all(TIME_MIN <= t <= TIME_MAX for t in times):
+        raise ParsingError('datetime values must be between the years 1 and 9999')
+    return modi
+
+
+
+def _is_row_modifier(modi: FieldModifier) -> bool:
+    '''seq and unique values depend on the index of the row'''
+    return isinstance(modi, tuple) and modi[0] in ('seq', 'unique')
+
+
+def _check_row_modifier(typ: str, modi: tuple) -> None:
+    if typ != 'int':
+        raise ParsingError(f'Only int fields support {modi[0]}')
+    if not all(type(arg) is int for arg in modi[1:]):
+        raise ParsingError(f'Arguments to {modi[0]} must be two integers')
+    if len(modi) == 3:
+        _check_int64(*modi[1:])
+    if modi[0] == 'unique':
+        if len(modi) == 1:
+            raise ParsingError('unique requires a range, e.g. unique(1, 1000)')
+        if modi[1] > modi[2]:
+            raise ParsingError('The range of unique is empty')
+    elif len(modi) == 3 and modi[2] == 0:
+        raise ParsingError('The step of seq must not be zero')
+
+
+def _has_row_modifier(spec: tuple) -> bool:
+    typ, modi = spec
+    if typ == 'object':
+        return any(_has_row_modifier(child) for child in modi.values())
+    if typ == 'array':
+        return _has_row_modifier(modi[2])
+    return _is_row_modifier(modi)
+
+
+def _check_field(field_type: str, field_modifier: FieldModifier) -> FieldModifier:
+    '''Checks that the type supports the modifier, returns it normalized.
+    Weighted lists are returned as ('weighted', values, weights, alias tables).'''
+    if field_type in TIME_TYPES:
+        return _check_time(field_type, field_modifier)
+    if isinstance(field_modifier, list):
+        return _check_list(field_type, field_modifier)
+    if isinstance(field_modifier, tuple):
+        keyword = field_modifier[0]
+        if keyword == 'weighted':
+            _, values, weights = field_modifier
+            values = tuple(_check_list(field_type, values))
+            return ('weighted', values, weights, alias_table(weights))
+        if keyword in ('seq', 'unique'):
+            _check_row_modifier(field_type, field_modifier)
+            return field_modifier
+
+    if field_type in ('int', 'str'):
+        _check_int_str(field_type, field_modifier)
+        return field_modifier
+    return _check_new_type(field_type, field_modifier)
+
+
+# Field spec parser
+#
+# Field specs are parsed in a single pass by a recursive descent parser.
+# Every token is matched by a regular expression anchored at the current
+# position, and errors point at the position where the parser stopped.
+# The most common specs skip it: simple specs are matched by one regular
+# expression, and lists of plain items are decoded by the json module.
+
+
+class _Patterns(NamedTuple):
+    spaces: re.Pattern
+    integer: re.Pattern
+    of: re.Pattern
+    # arguments of rand, seq and unique: numbers, ISO dates and times
+    argument: re.Pattern
+    arguments: re.Pattern
+    # the file pattern and the field of ref, the field may be nested (user.id)
+    ref: re.Pattern
+    # an item of a list up to the next "," or "]": a string in single or double
+    # quotes or a bare value (number, true, false or null), with an optional :weight
+    list_item: re.Pattern
+    # a whole field spec with no modifier, rand or seq, a call with int arguments,
+    # a decimal number or a string starting with a letter: the specs of most fields
+    simple_spec: re.Pattern
+
+
+@functools.cache
+def _patterns() -> _Patterns:
+    '''Compiled with the first field spec, compiling them takes a few
+    milliseconds of the import time budget (see benchmark.py)'''
+    bare = r'''[^\s,:\[\]'"]+'''
+    return _Patterns(
+        spaces=re.compile(r'\s*'),
+        integer=re.compile(r'\d+'),
+        of=re.compile(r'\s+of\s+'),
+        argument=re.compile(r'[^\s,()]+'),
+        arguments=re.compile(r'\s*([^\s,()]+)\s*,\s*([^\s,()]+)\s*\)'),
+        ref=re.compile(r'\s*([^()]+?\.(?:jsonl|csv)(?:\.gz|\.bz2)?)\.([^()\s]+)\s*\)'),
+        list_item=re.compile(
+            rf'''\s*(?:'([^'\\]*(?:\\.[^'\\]*)*)'|"([^"\\]*(?:\\.[^"\\]*)*)"|({bare}))'''
+            rf'''\s*(?::\s*({bare})\s*)?([,\]]?)''', re.DOTALL),
+        simple_spec=re.compile(
+            rf'''({'|'.join(FIELD_TYPES)}):(?:(rand|seq)|(rand|seq|unique)\(\s*(-?\d+)\s*,'''
+            rf'''\s*(-?\d+)\s*\)|(-?\d+(?:\.\d+)?)|([A-Za-z][^\W_]*))?\s*'''),
+    )
+
+
+_CONSTANTS = {'true': True, 'false': False, 'null': None}
+
+# rand, seq, unique and ref followed by their arguments
+_CALLS = ('rand(', 'seq(', 'unique(', 'ref(')
+
+
+def _number(s: str) -> Union[int, float]:
+    '''Raises ValueError if s isn't a finite number'''
+    try:
+        return int(s)
+    except ValueError:
+        pass
+    n = float(s)
+    if not math.isfinite(n):
+        raise ValueError(f'{s} is not a finite number')
+    return n
+
+
+def _unescape(body: str, quote: str) -> str:
+    '''The string in quotes with the escapes of JSON strings, and \\' '''
+    if quote == "'":
+        body = body.replace("\\'", "'").replace('"', '\\"')
+    return json.loads(f'"{body}"')
+
+
+def _reject_constant(name: str):
+    '''NaN and Infinity aren't list items'''
+    raise ValueError(name)
+
+
+def _rand_argument(s: str) -> Union[int, float, str]:
+    '''A number or an ISO date (with a time for timestamp and datetime fields),
+    raises ValueError otherwise'''
+    try:
+        return _number(s)
+    except ValueError:
+        pass
+    import datetime
+    try:
+        return datetime.date.fromisoformat(s).isoformat()
+    except ValueError:
+        pass
+    return datetime.datetime.fromisoformat(s).isoformat()
+
+
+class _SpecParser:
+    '''Parser of a field spec, the methods read the rules of the grammar
+    at the current position and move it past them'''
+
+    def __init__(self, text: str):
+        # trailing whitespace is ignored, as it always was
+        self.text = text.rstrip()
+        self.pos = 0
+        self.patterns = _patterns()
+
+    def error(self, message: str, position: int = None) -> ParsingError:
+        return ParsingError(message, self.pos if position is None else position, self.text)
+
+    def skip_spaces(self) -> None:
+        self.pos = self.patterns.spaces.match(self.text, self.pos).end()
+
+    def expect(self, token: str) -> None:
+        if not self.text.startswith(token, self.pos):
+            raise self.error(f'Expected "{token}"')
+        self.pos += len(token)
 
+    def match(self, pattern: re.Pattern, expected: str) -> re.Match:
+        match = pattern.match(self.text, self.pos)
+        if not match:
+            raise self.error(f'Expected {expected}')
+        self.pos = match.end()
+        return match
+
+    def end(self) -> None:
+        if self.pos != len(self.text):
+            raise self.error('Unexpected text after the field spec')
+
+    def field_spec(self) -> tuple[str, FieldModifier]:
+        '''field_spec := array_spec | field_type ":" field_modifier'''
+        if self.text.startswith('array(', self.pos):
+            return self.array_spec()
+
+        start = self.pos
+        colon = self.text.find(':', start)
+        if colon < 0:
+            raise self.error('Field spec must have a type and a modifier separated by ":"')
+        field_type = self.text[start:colon]
+        if field_type not in FIELD_TYPES:
+            raise self.error('Invalid field type')
+
+        self.pos = start = colon + 1
+        field_modifier = self.field_modifier()
         try:
-            ls = json.loads(s)
-            assert isinstance(ls, list)
-        except:
-            raise ParsingError('Malformed list in field spec')
+            return (field_type, _check_field(field_type, field_modifier))
+        except ParsingError as e:
+            raise self.error(e.message, start) from None
 
-        if len(ls) == 0:
-            raise ParsingError('List must have at least one element')
+    def field_modifier(self) -> FieldModifier:
+        '''field_modifier := "" | list | call | ref | "rand" | "seq" | number | string'''
+        text, start = self.text, self.pos
+        if start == len(text):
+            return None
+        if text[start] == '[':
+            return self.item_list()
 
-        return ls
+        if text.startswith(_CALLS, start):
+            paren = text.index('(', start)
+            keyword = text[start:paren]
+            self.pos = paren + 1
+            return self.ref() if keyword == 'ref' else self.call(keyword)
 
-    if s == 'rand':
-        return ('rand',)
+        # the rest of the field spec is a keyword or a literal
+        self.pos = len(text)
+        literal = text[start:]
+        if literal in ('rand', 'seq'):
+            return (literal,)
 
-    match = re.search(r"rand\((\w+),\s*(\w+)\)", s)
-    if match:
+        if literal[0].isdigit() or literal[0] == '-':
+            try:
+                return _number(literal)
+            except ValueError:
+                raise self.error('Malformed number value', start) from None
+
+        if not literal.isalnum():
+            bad = next(i for i, c in enumerate(literal) if not c.isalnum())
+            raise self.error('String value must be alphanumeric', start + bad)
+        return literal
+
+    def item_list(self) -> Union[list, tuple]:
+        '''list := "[" item ("," item)* "]", item := value (":" weight)?
+
+        Returns ('weighted', values, weights) for a list of value:weight items.
+        Lists without weights, double quotes or escapes are read by json.loads
+        with the quotes swapped, the others (and malformed lists, to find the
+        error) by a scanner matching an item at a time.
+        '''
+        text = self.text
+        rest = text[self.pos:]
+        if '"' not in rest and '\\' not in rest:
+            try:
+                items = _LIST_JSON.decode(rest.replace("'", '"'))
+            except ValueError:
+                pass
+            else:
+                if items:
+                    self.pos = len(text)
+                    return items
+
+        self.pos += 1
+        self.skip_spaces()
+        if text.startswith(']', self.pos):
+            raise self.error('List must have at least one element')
+
+        values, weights = [], []
+        append = values.append
+        weighted = None
+        # every match starts where the previous one ended
+        scan = self.patterns.list_item.scanner(text, self.pos).match
+        match = None
+        while True:
+            item = scan()
+            if item is None:
+                if match is not None:
+                    self.pos = match.end()
+                raise self.error('Malformed list item')
+            match = item
+            single, double, bare, weight, separator = match.groups()
+            if single is not None:
+                append(single if '\\' not in single else self.unescape(match, 1, "'"))
+            elif double is not None:
+                append(double if '\\' not in double else self.unescape(match, 2, '"'))
+            else:
+                try:
+                    append(int(bare))
+                except ValueError:
+                    append(self.bare_value(match))
+
+            if weighted is None:
+                weighted = weight is not None
+            elif weighted != (weight is not None):
+                raise self.error('Either every item of a list has a weight or none',
+                                 self.item_start(match))
+            if weighted:
+                weights.append(self.weight(match))
+            if separator != ',':
+                break
+
+        self.pos = match.end()
+        if not separator:
+            raise self.error('Expected "," or "]"')
+        if weighted:
+            return ('weighted', tuple(values), tuple(weights))
+        return values
+
+    def item_start(self, match: re.Match) -> int:
+        '''Position of the value of a list item, with its quote'''
+        if match[3] is not None:
+            return match.start(3)
+        return match.start(1 if match[1] is not None else 2) - 1
+
+    def unescape(self, match: re.Match, group: int, quote: str) -> str:
         try:
-            int1, int2 = (int(n) for n in match.groups())
-        except:
-            raise ParsingError('Arguments to rand must be two integers')
-        return ('rand', int1, int2)
+            return _unescape(match[group], quote)
+        except ValueError:
+            raise self.error('Invalid escape in string', match.start(group)) from None
+
+    def bare_value(self, match: re.Match) -> Union[int, float, bool, None]:
+        '''An unquoted list value other than an int'''
+        if match[3] in _CONSTANTS:
+            return _CONSTANTS[match[3]]
+        try:
+            return _number(match[3])
+        except ValueError:
+            raise self.error('List items must be quoted strings or numbers',
+                             match.start(3)) from None
+
+    def weight(self, match: re.Match) -> Union[int, float]:
+        try:
+            weight = _number(match[4])
+        except ValueError:
+            weight = 0
+        if weight <= 0:
+            raise self.error('Weights must be positive numbers', match.start(4))
+        return weight
 
-    # as a last resort, it must be either a string or an int value
+    def call(self, keyword: str) -> tuple:
+        '''call := keyword "(" argument "," argument ")", the keyword is read'''
+        match = self.patterns.arguments.match(self.text, self.pos)
+        if match:
+            self.pos = match.end()
+            try:
+                # most arguments are ints
+                return (keyword, int(match[1]), int(match[2]))
+            except ValueError:
+                return (keyword, self.argument(keyword, match, 1),
+                        self.argument(keyword, match, 2))
 
-    if s[0].isdigit():
+        # find where it goes wrong
+        self.skip_spaces()
+        start = self.argument(keyword)
+        self.skip_spaces()
+        self.expect(',')
+        self.skip_spaces()
+        end = self.argument(keyword)
+        self.skip_spaces()
+        self.expect(')')
+        return (keyword, start, end)
+
+    def argument(self, keyword: str, match: re.Match = None,
+                 group: int = 0) -> Union[int, float, str]:
+        '''Reads an argument, or converts the group of a match of the arguments'''
+        if match is None:
+            match = self.match(self.patterns.argument, f'an argument of {keyword}')
         try:
-            n = int(s)
-            return n
+            return _rand_argument(match[group])
         except ValueError:
-            raise ParsingError('Malformed integer value')
+            raise self.error(f'Arguments to {keyword} must be two numbers or two dates',
+                             match.start(group)) from None
+
+    def ref(self) -> tuple:
+        '''ref := "ref(" file_pattern "." field ")", "ref(" is read'''
+        match = self.match(self.patterns.ref,
+                           'a file pattern and a field, e.g. ref(users/*.jsonl.id)')
+        return ('ref', match[1], match[2])
+
+    def array_spec(self) -> tuple[str, tuple]:
+        '''array_spec := "array(" n (".." m)? ") of " (field_spec | JSON object)
+
+        E.g. "array(1..3) of int:rand" returns ('array', (1, 3, ('int', ('rand',)))).
+        '''
+        self.pos += len('array(')
+        self.skip_spaces()
+        length_start = self.pos
+        start = end = int(self.match(self.patterns.integer, 'the length of the array')[0])
+        self.skip_spaces()
+        if self.text.startswith('..', self.pos):
+            self.pos += 2
+            self.skip_spaces()
+            end = int(self.match(self.patterns.integer, 'the maximum length of the array')[0])
+            self.skip_spaces()
+        self.expect(')')
+        if start > end:
+            raise self.error('The range of the array length is empty', length_start)
+        self.match(self.patterns.of, '" of " and the element of the array')
+
+        element_start = self.pos
+        if self.text.startswith('{', self.pos):
+            element = ('object', self.json_object())
+        else:
+            element = self.field_spec()
 
-    if not s.isalnum():
-        raise ParsingError('String value must be alphanumeric')
+        # the elements of an array all belong to the same row
+        if _has_row_modifier(element):
+            raise self.error("Arrays can't contain seq and unique fields", element_start)
+        return ('array', (start, end, element))
 
-    return s
+    def json_object(self) -> 'AST':
+        '''An object of field specs written as JSON'''
+        try:
+            obj, self.pos = _JSON.raw_decode(self.text, self.pos)
+        except json.JSONDecodeError as e:
+            raise self.error(f'Malformed object in array field spec: {e.msg}', e.pos) from None
+        self.skip_spaces()
+        return _parse_object(obj, {})
+
+
+_JSON = json.JSONDecoder()
+_LIST_JSON = json.JSONDecoder(parse_constant=_reject_constant)
+
+
+def parse_field_modifier(s: str) -> FieldModifier:
+    '''The field modifier is parsed separately from the field type for simplicity,
+    parse_field_spec then checks that the type supports it.
+    '''
+    parser = _SpecParser(s)
+    field_modifier = parser.field_modifier()
+    parser.end()
+    return field_modifier
 
 
 def parse_field_spec(s: str) -> tuple[str, FieldModifier]:
     '''E.g. "int:rand(1, 10)" returns ('int', ('rand', 1, 10))
-    '''
-    field_type, field_modifier_s = s.split(':')
 
-    if field_type not in ('int', 'str', 'timestamp'):
-        raise ParsingError('Invalid field type')
+    Weighted lists are returned as ('weighted', values, weights, alias tables).
+    '''
+    if not isinstance(s, str):
+        raise ParsingError('Field spec must be a string or an object')
 
-    field_modifier = parse_field_modifier(field_modifier_s)
+    # the simple specs are matched at once, the parser reads the others
+    # and finds the position of the errors
+    match = _patterns().simple_spec.fullmatch(s)
+    if match:
+        field_type, keyword, call, start, end, number, string = match.groups()
+        if keyword:
+            field_modifier = (keyword,)
+        elif call:
+            field_modifier = (call, int(start), int(end))
+        elif number:
+            field_modifier = _number(number)
+        else:
+            field_modifier = string
+        try:
+            return (field_type, _check_field(field_type, field_modifier))
+        except ParsingError:
+            pass
 
-    return (field_type, field_modifier)
+    parser = _SpecParser(s)
+    spec = parser.field_spec()
+    parser.end()
+    return spec
 
 
 AST = dict[str, tuple]
@@ -132,79 +815,887 @@ def parse(s: str) -> AST:
     '''Takes a spec string and returns an AST'''
     try:
         obj = json.loads(s)
-        assert isinstance(obj, dict)
-    except:
-        raise ParsingError('Wrong syntax of the key-value mapping')
+    except json.JSONDecodeError as e:
+        raise ParsingError(f'Wrong syntax of the key-value mapping: {e.msg}', e.pos, s) from None
+    except (TypeError, ValueError):
+        raise ParsingError('Wrong syntax of the key-value mapping') from None
+    if not isinstance(obj, dict):
+        raise ParsingError('Wrong syntax of the key-value mapping: the schema must be an object')
 
+    return _parse_object(obj, {})
+
+
+def _parse_object(obj: dict, specs: dict[str, tuple]) -> AST:
+    '''specs are the field specs already parsed in the schema, large schemas
+    often repeat the same few specs'''
     if len(obj) == 0:
         raise ParsingError("At least one field spec is required")
 
-    AST = {name: parse_field_spec(v) for name, v in obj.items()}
-    return AST
+    ast = {}
+    for name, v in obj.items():
+        try:
+            if isinstance(v, dict):
+                ast[name] = ('object', _parse_object(v, specs))
+            elif isinstance(v, str) and v in specs:
+                ast[name] = specs[v]
+            else:
+                ast[name] = specs[v] = parse_field_spec(v)
+        except ParsingError as e:
+            # the path of the field from the outermost object
+            e.field = name if e.field is None else f'{name}.{e.field}'
+            raise
+    return ast
+
+
 
+# Lookup tables
+#
+# The values of name, email, enum and date fields are drawn from tables
+# built once per field, so drawing one costs the same as drawing an integer.
+# Weighted lists are drawn with their alias tables, built while parsing.
 
-def evaluate_field_spec(spec: tuple[str, any]) -> any:
+# date ranges of up to this many days are drawn from a table of ISO dates,
+# larger ones as day numbers converted one by one
+DATE_TABLE_DAYS = 100_000
+
+def _date_ordinals(modi: tuple) -> tuple[int, int]:
+    import datetime
+    _, start, end = modi
+    return (datetime.date.fromisoformat(start).toordinal(),
+            datetime.date.fromisoformat(end).toordinal())
+
+
+def _iso_date(ordinal: int) -> str:
+    import datetime
+    return datetime.date.fromordinal(ordinal).isoformat()
+
+
+@functools.lru_cache(maxsize=None)
+def _date_table(first: int, last: int) -> tuple[str, ...]:
+    return tuple(_iso_date(day) for day in range(first, last + 1))
+
+
+def _field_table(spec: tuple[str, any]) -> Sequence:
+    '''Returns the table the values of the field are drawn from uniformly,
+    or None if the field isn't drawn from a table'''
     typ, modi = spec
+    if typ == 'name':
+        return words.name_table()
+    if typ == 'email':
+        return words.email_table()
+    if typ == 'enum' and isinstance(modi, list):
+        return modi
+    if typ == 'date':
+        first, last = _date_ordinals(modi)
+        if last - first < DATE_TABLE_DAYS:
+            return _date_table(first, last)
+    return None
 
-    # timestamp is the same no matter the modifier
-    if typ == 'timestamp':
-        if modi != None:
-            logging.warning('Modifiers are ignored in timestamp field')
-        return time.time()
+
+def _is_weighted(spec: tuple[str, any]) -> bool:
+    typ, modi = spec
+    return isinstance(modi, tuple) and modi[0] == 'weighted'
+
+
+def _alias_choice(modi: tuple, random_: Callable[[], float]) -> any:
+    '''Draws a value of a weighted list with a single random number'''
+    _, values, _, (prob, alias) = modi
+    u = random_() * len(values)
+    i = int(u)
+    return values[i] if u - i < prob[i] else values[alias[i]]
+
+
+# Times
+#
+# timestamp and datetime values are computed as seconds since the epoch,
+# datetime values are then formatted. Without a range or a sequence they
+# are the current time, read once per batch in batch generation.
+# The datetime module is imported by the functions using it, only
+# date and time fields need it.
+
+@functools.cache
+def _epoch():
+    import datetime
+    return datetime.datetime(1970, 1, 1)
+
+
+def _check_iso_times(low: float, high: float) -> None:
+    '''datetime values are ISO times with 4 digit years, datetime:seq
+    can leave them after many rows'''
+    if low < TIME_MIN or high > TIME_MAX:
+        raise OverflowError('datetime values must be between the years 1 and 9999')
+
+
+def _iso_time(seconds: float) -> str:
+    '''ISO time in UTC with microseconds, rounded like NumPy'''
+    _check_iso_times(seconds, seconds)
+    import datetime
+    time_ = _epoch() + datetime.timedelta(microseconds=round(seconds * 1e6))
+    return time_.isoformat(timespec='microseconds') + 'Z'
+
+
+def _is_time_range(modi: FieldModifier) -> bool:
+    return isinstance(modi, tuple) and len(modi) == 3
+
+
+def _evaluate_time(spec: tuple[str, any], row: int) -> Union[float, str]:
+    typ, modi = spec
+    if not _is_time_range(modi):
+        seconds = time.time()
+    elif modi[0] == 'rand':
+        _, start, end = modi
+        seconds = start + (end - start) * random.random()
+    else:
+        _, start, step = modi
+        seconds = start + step * row
+    return _iso_time(seconds) if typ == 'datetime' else seconds
+
+
+def _evaluate_new_type(spec: tuple[str, any]) -> any:
+    typ, modi = spec
+
+    table = _field_table(spec)
+    if table is not None:
+        return random.choice(table)
+
+    if typ == 'date':
+        return _iso_date(random.randint(*_date_ordinals(modi)))
+
+    if typ == 'bool':
+        return random.random() < 0.5
+
+    # float
+    if modi is None or isinstance(modi, float):
+        return modi
+    if isinstance(modi, list):
+        return random.choice(modi)
+    if modi == ('rand',):
+        return random.random()
+    _, start, end = modi
+    return start + (end - start) * random.random()
+
+
+# Fields depending on the row
+#
+# seq and unique values are computed from the index of the row, and unique
+# values are a permutation of their range chosen by a key (see permutation.py).
+# Rows with the same index and key have the same values, whichever
+# process generates them. ref values are drawn from an index of the values
+# of an earlier output (see refs.py).
+
+def _leaves(ast: AST, prefix: str = '') -> Iterator[tuple[str, tuple]]:
+    '''Yields (path, spec) for every field which isn't an object or an array,
+    e.g. ('user.id', ('int', ('rand',))). Array elements have the path of the array.'''
+    for name, spec in ast.items():
+        path = prefix + name
+        typ, modi = spec
+        while typ == 'array':
+            typ, modi = spec = modi[2]
+        if typ == 'object':
+            yield from _leaves(modi, path + '.')
+        else:
+            yield path, spec
+
+
+def _unique_fields(ast: AST) -> list[tuple[str, tuple]]:
+    return [(path, modi) for path, (typ, modi) in _leaves(ast)
+            if typ == 'int' and isinstance(modi, tuple) and modi[0] == 'unique']
+
+
+def _unique_permutation(modi: tuple, key, path: str) -> Permutation:
+    _, start, end = modi
+    return permutation(end - start + 1, f'{key}/{path}')
+
+
+def _is_ref(spec: tuple[str, any]) -> bool:
+    typ, modi = spec
+    return isinstance(modi, tuple) and modi[0] == 'ref'
+
+
+def has_refs(ast: AST) -> bool:
+    '''Whether the schema reads the values of ref fields from files'''
+    return any(_is_ref(spec) for _, spec in _leaves(ast))
+
+
+def _ref_index(spec: tuple[str, any]):
+    '''Opens the index of a ref field, which is compiled with its values'''
+    # imported on first use, reading files takes a few modules
+    import refs
+    typ, (_, pattern, field) = spec
+    try:
+        return refs.open_index(pattern, field, typ)
+    except refs.RefError as e:
+        raise ParsingError(f'Can\'t read ref({pattern}.{field}): {e}')
+
+
+# the indexes of the ref fields of evaluate, by working directory and spec
+_evaluated_refs = {}
+
+
+def _evaluated_ref_index(spec: tuple[str, any]):
+    '''The index of a ref field for evaluate, opened once like in compiled schemas
+    instead of globbing and hashing the files at every row'''
+    key = (os.getcwd(), spec)
+    if key not in _evaluated_refs:
+        _evaluated_refs[key] = _ref_index(spec)
+    return _evaluated_refs[key]
+
+
+def _int_range(modi: tuple) -> tuple[int, int]:
+    '''The range of int:rand, from 0 to 10000 by default'''
+    return modi[1:] if len(modi) == 3 else (0, 10000)
+
+
+def _seq_arguments(modi: tuple) -> tuple[int, int]:
+    '''start and step, seq starts at 1 by default'''
+    return modi[1:] if len(modi) == 3 else (1, 1)
+
+
+def evaluate_field_spec(spec: tuple[str, any], row: int = 0, key=0, path: str = '') -> any:
+    '''Evaluates the spec of the field at path (e.g. "user.id") for the row
+    with the given index. key chooses the permutation of unique fields.'''
+    typ, modi = spec
+
+    if typ == 'object':
+        return evaluate(modi, row, key, path + '.')
+    if typ == 'array':
+        start, end, element = modi
+        length = start if start == end else random.randint(start, end)
+        return [evaluate_field_spec(element, row, key, path) for _ in range(length)]
+
+    if typ in TIME_TYPES:
+        return _evaluate_time(spec, row)
+
+    if _is_weighted(spec):
+        return _alias_choice(modi, random.random)
+
+    if _is_row_modifier(modi):
+        if modi[0] == 'seq':
+            start, step = _seq_arguments(modi)
+            return start + step * row
+        return modi[1] + _unique_permutation(modi, key, path)(row)
+
+    if _is_ref(spec):
+        index = _evaluated_ref_index(spec)
+        return index[random.randint(0, len(index) - 1)]
+
+    if typ not in ('int', 'str'):
+        return _evaluate_new_type(spec)
+
+    # int and str fields, checked by the parser
 
     # empty spec after type
     if modi is None:
         return '' if typ == 'str' else None
 
-    # literal values are returned as-is (int and str)
-    if isinstance(modi, int):
-        if typ != 'int':
-            raise ParsingError("Field type doesn't support integer literal")
-        return modi
-    if isinstance(modi, str):
-        if typ != 'str':
-            raise ParsingError("Field type doesn't support string literal")
+    # literal values are returned as-is
+    if isinstance(modi, (int, str)):
         return modi
 
+    if isinstance(modi, list):
+        return random.choice(modi)
+
     # random
-    if isinstance(modi, tuple) and modi[0] == 'rand':
-        if typ == 'str':
-            if len(modi) != 1:
-                raise ParsingError(
-                    'String fields don\'t support rand with range')
-            return str(uuid.uuid4())
-
-        # random ints
-        if typ == 'int' and modi == ('rand',):
-            return random.randint(0, 10000)
-        # wish i could use the match block here
-        if typ == 'int' and modi[0] == 'rand' and len(modi) == 3:
-            _, start, end = modi
-            return random.randint(start, end)
+    if typ == 'str':
+        return next_uuid()
+    start, end = _int_range(modi)
+    return random.randint(start, end)
+
+FakeObj = dict[str, any]
+
+def evaluate(ast: AST, row: int = 0, key=0, prefix: str = '') -> FakeObj:
+    return {name: evaluate_field_spec(spec, row, key, prefix + name)
+            for name, spec in ast.items()}
 
-    # lists
+
+def _new_type_source(spec: tuple[str, any], consts: dict) -> str:
+    typ, modi = spec
+
+    table = _field_table(spec)
+    if table is not None:
+        name = f'_values{len(consts)}'
+        consts[name] = tuple(table)
+        return f'_choice({name})'
+
+    if typ == 'date':
+        first, last = _date_ordinals(modi)
+        return f'_iso_date(_randint({first}, {last}))'
+
+    if typ == 'bool':
+        return '_random() < 0.5'
+
+    # float
+    if modi is None or isinstance(modi, float):
+        return repr(modi)
     if isinstance(modi, list):
-        if typ == 'str':
-            if not all(isinstance(item, str) for item in modi):
-                raise ParsingError(
-                    'List items of a string field must be strings')
+        name = f'_choices{len(consts)}'
+        consts[name] = tuple(modi)
+        return f'_choice({name})'
+    if modi == ('rand',):
+        return '_random()'
+    _, start, end = modi
+    return f'{start!r} + {end - start!r} * _random()'
 
-        if typ == 'int':
-            if not all(isinstance(item, int) for item in modi):
-                raise ParsingError('List items of a string field must be ints')
 
-        return random.choice(modi)
+def _time_source(spec: tuple[str, any]) -> str:
+    typ, modi = spec
+    if not _is_time_range(modi):
+        source = '_time()'
+    elif modi[0] == 'rand':
+        _, start, end = modi
+        source = f'{start!r} + {end - start!r} * _random()'
+    else:
+        _, start, step = modi
+        source = f'{start!r} + {step!r} * _n'
+    return f'_iso_time({source})' if typ == 'datetime' else source
 
-    return None
 
-FakeObj = dict[str, any]
+def _alias_source(modi: tuple, consts: dict) -> str:
+    '''Same draw as _alias_choice, with the values of both columns
+    of the alias tables looked up directly'''
+    _, values, _, (prob, alias) = modi
+    k = len(consts)
+    consts[f'_prob{k}'] = prob
+    consts[f'_keep{k}'] = tuple(values)
+    consts[f'_other{k}'] = tuple(values[i] for i in alias)
+    return (f'(_keep{k}[_i] if (_u := _random() * {len(values)}) - (_i := int(_u)) < _prob{k}[_i]'
+            f' else _other{k}[_i])')
+
 
-def evaluate(ast: AST) -> FakeObj:
-    return {name: evaluate_field_spec(spec) for name, spec in ast.items()}
+def _field_source(spec: tuple[str, any], consts: dict,
+                  permutations: dict = None, path: str = '') -> str:
+    '''Returns a python expression that generates a value for the field spec.
+
+    This mirrors evaluate_field_spec, but all the checks happen here once,
+    so the expression itself doesn't branch. Values that can't be written
+    as literals (e.g. choice lists) are stored in consts.
+    '''
+    typ, modi = spec
+
+    if typ == 'object':
+        return _object_source(modi, consts, permutations, path + '.')
+    if typ == 'array':
+        start, end, element = modi
+        length = start if start == end else f'_randint({start}, {end})'
+        return f'[{_field_source(element, consts, permutations, path)} for _ in range({length})]'
+
+    if typ in TIME_TYPES:
+        return _time_source(spec)
+
+    if _is_weighted(spec):
+        return _alias_source(modi, consts)
+
+    # _n is the index of the row
+    if _is_row_modifier(modi):
+        if modi[0] == 'seq':
+            start, step = _seq_arguments(modi)
+            return f'{start} + {step} * _n'
+        return f'{modi[1]} + {permutations[path]}(_n)'
+
+    if _is_ref(spec):
+        index = _ref_index(spec)
+        name = f'_ref{len(consts)}'
+        consts[name] = index
+        return f'{name}[_randint(0, {len(index) - 1})]'
+
+    if typ not in ('int', 'str'):
+        return _new_type_source(spec, consts)
+
+    if modi is None:
+        return "''" if typ == 'str' else 'None'
+
+    if isinstance(modi, (int, str)):
+        return repr(modi)
+
+    if isinstance(modi, list):
+        name = f'_choices{len(consts)}'
+        consts[name] = tuple(modi)
+        return f'_choice({name})'
+
+    if typ == 'str':
+        return '_uuid()'
+    start, end = _int_range(modi)
+    return f'_randint({start!r}, {end!r})'
+
+
+def _object_source(ast: AST, consts: dict, permutations: dict, prefix: str) -> str:
+    items = ', '.join(f'{name!r}: {_field_source(spec, consts, permutations, prefix + name)}'
+                      for name, spec in ast.items())
+    return f'{{{items}}}'
+
+
+def compile_ast(ast: AST):
+    '''Generates the source code of a function specialised for the AST.
+
+    Returns a factory which takes the random sources
+    (randint, choice, uuid, time, random), a function returning the index
+    of the next row and the permutations of the unique fields,
+    and returns a function that builds one fake object,
+    e.g. for {"age": "int:rand(1, 90)"}:
+
+        def _generate():
+            return {'age': _randint(1, 90)}
+
+    Nested objects and arrays are nested displays and list comprehensions
+    in the same expression, so every value costs one leaf expression.
+    '''
+    consts = {}
+    permutations = {path: f'_perm{i}' for i, (path, _) in enumerate(_unique_fields(ast))}
+    items = ''.join(f'\n            {name!r}: {_field_source(spec, consts, permutations, name)},'
+                    for name, spec in ast.items())
+
+    unpack = f'    {", ".join(permutations.values())}, = _permutations\n' if permutations else ''
+    next_row = '        _n = _next_row()\n' if _has_row_modifier(('object', ast)) else ''
+    src = (
+        'def _factory(_randint, _choice, _uuid, _time, _random, _next_row, _permutations):\n'
+        + unpack +
+        '    def _generate():\n'
+        + next_row +
+        f'        return {{{items}\n        }}\n'
+        '    return _generate\n'
+    )
+
+    namespace = dict(consts, _iso_date=_iso_date, _iso_time=_iso_time)
+    exec(compile(src, '<schema>', 'exec'), namespace)
+    return namespace['_factory']
+
+
+class CompiledSchema:
+    '''A schema that has already been parsed and compiled.
+
+    Calling the object generates a new fake object, so the parsing cost
+    is paid once instead of once per generated object.
+    Successive objects are the rows 0, 1, 2, ... of seq and unique fields.
+    '''
+
+    def __init__(self, ast: AST):
+        self.ast = ast
+        self.factory = compile_ast(ast)
+        self.unique_fields = _unique_fields(ast)
+        # chooses the permutations of unique fields when no key is given
+        self.key = random.getrandbits(64)
+        self._generate = self.bind()
+
+    def __call__(self) -> FakeObj:
+        return self._generate()
+
+    @property
+    def max_rows(self) -> Union[int, None]:
+        '''Number of rows after which unique fields run out of values'''
+        sizes = [end - start + 1 for _, (_, start, end) in self.unique_fields]
+        return min(sizes) if sizes else None
+
+    @property
+    def seq_rows(self) -> Union[int, None]:
+        '''Number of rows after which seq fields leave the 64-bit ints,
+        or the years 1 to 9999 for datetime fields'''
+        rows = []
+        for _, (typ, modi) in _leaves(self.ast):
+            if typ == 'int' and isinstance(modi, tuple) and modi[0] == 'seq':
+                start, step = _seq_arguments(modi)
+                limit = INT64_MAX if step > 0 else INT64_MIN
+                rows.append((limit - start) // step + 1)
+            elif typ == 'datetime' and isinstance(modi, tuple) and modi[0] == 'seq':
+                _, start, step = modi
+                limit = TIME_MAX if step > 0 else TIME_MIN
+                rows.append(math.floor((limit - start) / step) + 1)
+        return min(rows) if rows else None
+
+    def permutations(self, key=None) -> dict[str, Permutation]:
+        '''The permutations of the unique fields by path'''
+        key = self.key if key is None else key
+        return {path: _unique_permutation(modi, key, path) for path, modi in self.unique_fields}
+
+    def bind(self, rng: random.Random = None, clock=time.time,
+             first_row: int = 0, key=None) -> Callable[[], FakeObj]:
+        '''Returns a generator function which draws all the random values
+        (including the bytes of random strings) from rng, or from the random
+        module if rng is None. Its rows start at index first_row.'''
+        next_row = itertools.count(first_row).__next__
+        permutations = tuple(self.permutations(key).values())
+        if rng is None:
+            return self.factory(random.randint, random.choice, next_uuid, clock, random.random,
+                                next_row, permutations)
+        return self.factory(rng.randint, rng.choice, uuid_stream(rng.randbytes).__next__,
+                            clock, rng.random, next_row, permutations)
+
+
+@functools.lru_cache(maxsize=128)
+def compile_schema(spec_str: str) -> CompiledSchema:
+    '''Parse the spec string once and return a reusable generator.
+    Results are cached by the spec string.'''
+    return CompiledSchema(parse(spec_str))
 
 
 def generate_object(spec_str: str) -> FakeObj:
-    return evaluate(parse(spec_str))
+    return compile_schema(spec_str)()
+
+
+# Batch generation
+#
+# Instead of building one dict at a time, a whole column of values is
+# generated for each field. With NumPy installed the columns are arrays
+# produced by vectorised draws, otherwise they are plain lists.
+#
+# The column of a nested object is a dict of columns, the column of an
+# array a ListColumn with the elements of all the rows in one column.
+
+Columns = dict[str, Sequence]
+
+
+class ListColumn(NamedTuple):
+    '''Column of an array field: the elements of row i are
+    values[offsets[i]:offsets[i + 1]]'''
+    offsets: Sequence[int]
+    values: Union[Sequence, Columns, 'ListColumn']
+
+
+def column_length(column) -> int:
+    '''Number of rows in a column'''
+    if isinstance(column, dict):
+        return column_length(next(iter(column.values())))
+    if isinstance(column, ListColumn):
+        return len(column.offsets) - 1
+    return len(column)
+
+
+def slice_columns(column, start: int, end: int):
+    '''The rows start, ..., end - 1 of a column, or of a dict of columns'''
+    if isinstance(column, dict):
+        return {name: slice_columns(child, start, end) for name, child in column.items()}
+    if isinstance(column, ListColumn):
+        offsets = column.offsets[start:end + 1]
+        first, last = offsets[0], offsets[-1]
+        if isinstance(offsets, list):
+            offsets = [offset - first for offset in offsets]
+        else:
+            offsets = offsets - first
+        return ListColumn(offsets, slice_columns(column.values, first, last))
+    return column[start:end]
+
+
+def column_values(column) -> list:
+    '''The values of a column as python objects, e.g. dicts for nested objects'''
+    if isinstance(column, dict):
+        names = list(column)
+        return [dict(zip(names, row))
+                for row in zip(*(column_values(child) for child in column.values()))]
+    if isinstance(column, ListColumn):
+        values = column_values(column.values)
+        offsets = column_values(column.offsets)
+        return [values[start:end] for start, end in zip(offsets, offsets[1:])]
+    return column.tolist() if hasattr(column, 'tolist') else column
+
+_default_rng = None
+
+
+def _numpy():
+    '''Returns the numpy module, or None if it isn't installed'''
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def batch_rng(seed: int = None):
+    '''Returns a random generator for batch generation:
+    a NumPy Generator if NumPy is installed, a random.Random otherwise'''
+    np = _numpy()
+    if np is None:
+        return random.Random(seed)
+    return np.random.default_rng(seed)
+
+
+def _reset_default_rng():
+    global _default_rng
+    _default_rng = None
+
+
+# forked processes must not generate the same values as their parent
+os.register_at_fork(after_in_child=_reset_default_rng)
+
+
+# days between 0001-01-01 (ordinal 1) and 1970-01-01, the epoch of datetime64
+_EPOCH_ORDINAL = 719163
+
+
+@functools.lru_cache(maxsize=128)
+def _numpy_table(table: tuple):
+    return _numpy().array(table, dtype=object)
+
+
+@functools.lru_cache(maxsize=128)
+def _numpy_alias(typ: str, modi: tuple):
+    '''The values and alias tables of a weighted list as arrays'''
+    np = _numpy()
+    _, values, _, (prob, alias) = modi
+    dtype = {'int': np.int64, 'float': np.float64}.get(typ, object)
+    return np.array(values, dtype=dtype), np.array(prob), np.array(alias)
+
+
+def _numpy_alias_column(typ: str, modi: tuple, n: int, np, rng) -> Sequence:
+    values, prob, alias = _numpy_alias(typ, modi)
+    u = rng.random(n) * len(values)
+    i = u.astype(np.int64)
+    return values[np.where(u - i < prob[i], i, alias[i])]
+
+
+def _numpy_time(spec: tuple[str, any], n: int, np, rng, now, rows: range) -> Sequence:
+    typ, modi = spec
+    if not _is_time_range(modi):
+        if typ == 'datetime':
+            return np.full(n, _iso_time(now), dtype=object)
+        return np.full(n, now)
+
+    if modi[0] == 'rand':
+        _, start, end = modi
+        seconds = start + (end - start) * rng.random(n)
+    else:
+        _, start, step = modi
+        seconds = start + step * np.arange(rows.start, rows.stop, dtype=np.float64)
+    if typ == 'timestamp':
+        return seconds
+    if n:
+        _check_iso_times(seconds.min(), seconds.max())
+    micros = np.round(seconds * 1e6).astype(np.int64).astype('datetime64[us]')
+    return np.char.add(np.datetime_as_string(micros, unit='us'), 'Z').astype(object)
+
+
+def _numpy_new_type(spec: tuple[str, any], n: int, np, rng) -> Sequence:
+    typ, modi = spec
+
+    table = _field_table(spec)
+    if table is not None:
+        values = _numpy_table(tuple(table))
+        return values[rng.integers(0, len(values), size=n)]
+
+    if typ == 'date':
+        first, last = _date_ordinals(modi)
+        days = rng.integers(first, last, size=n, endpoint=True) - _EPOCH_ORDINAL
+        return days.astype('datetime64[D]').astype(str).astype(object)
+
+    if typ == 'bool':
+        return rng.random(n) < 0.5
+
+    # float
+    if modi is None:
+        return np.full(n, None, dtype=object)
+    if isinstance(modi, float):
+        return np.full(n, modi)
+    if isinstance(modi, list):
+        return np.array(modi)[rng.integers(0, len(modi), size=n)]
+    if modi == ('rand',):
+        return rng.random(n)
+    _, start, end = modi
+    return rng.uniform(start, end, size=n)
+
+
+def _numpy_column(spec: tuple[str, any], n: int, np, rng, randbytes, now,
+                  rows: range = None, permutations: dict = None, path: str = '') -> Sequence:
+    '''rows are the indexes of the rows and permutations those of the unique fields,
+    both only used by seq and unique fields, which can't be in arrays'''
+    typ, modi = spec
+
+    if typ == 'object':
+        return {name: _numpy_column(child, n, np, rng, randbytes, now,
+                                    rows, permutations, f'{path}.{name}')
+                for name, child in modi.items()}
+    if typ == 'array':
+        start, end, element = modi
+        lengths = np.full(n, start) if start == end else \
+            rng.integers(start, end, size=n, endpoint=True)
+        offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        return ListColumn(offsets, _numpy_column(element, int(offsets[-1]), np, rng, randbytes, now))
+
+    if typ in TIME_TYPES:
+        return _numpy_time(spec, n, np, rng, now, rows)
+
+    if _is_weighted(spec):
+        return _numpy_alias_column(typ, modi, n, np, rng)
+
+    if _is_row_modifier(modi):
+        indexes = np.arange(rows.start, rows.stop, dtype=np.int64)
+        if modi[0] == 'seq':
+            start, step = _seq_arguments(modi)
+            return start + step * indexes
+        return modi[1] + permutations[path].array(indexes, np)
+
+    if _is_ref(spec):
+        index = _ref_index(spec)
+        return index.take(rng.integers(0, len(index), size=n), np)
+
+    if typ not in ('int', 'str'):
+        return _numpy_new_type(spec, n, np, rng)
+
+    if modi is None:
+        return np.full(n, '' if typ == 'str' else None, dtype=object)
+
+    if isinstance(modi, int):
+        return np.full(n, modi, dtype=np.int64)
+    if isinstance(modi, str):
+        return np.full(n, modi, dtype=object)
+
+    if isinstance(modi, list):
+        dtype = np.int64 if typ == 'int' else object
+        choices = np.array(modi, dtype=dtype)
+        return choices[rng.integers(0, len(modi), size=n)]
+
+    if typ == 'str':
+        return np.array(random_uuids(n, randbytes), dtype=object)
+    start, end = _int_range(modi)
+    return rng.integers(start, end, size=n, endpoint=True)
+
+
+def _python_time(spec: tuple[str, any], n: int, rng, now, rows: range) -> list:
+    typ, modi = spec
+    if not _is_time_range(modi):
+        return [_iso_time(now) if typ == 'datetime' else now] * n
+
+    if modi[0] == 'rand':
+        _, start, end = modi
+        span, random_ = end - start, rng.random
+        seconds = [start + span * random_() for _ in range(n)]
+    else:
+        _, start, step = modi
+        seconds = [start + step * row for row in rows]
+    return [_iso_time(t) for t in seconds] if typ == 'datetime' else seconds
+
+
+def _python_new_type(spec: tuple[str, any], n: int, rng) -> list:
+    typ, modi = spec
+
+    table = _field_table(spec)
+    if table is not None:
+        return rng.choices(table, k=n)
+
+    if typ == 'date':
+        first, last = _date_ordinals(modi)
+        return [_iso_date(day) for day in rng.choices(range(first, last + 1), k=n)]
+
+    random_ = rng.random
+    if typ == 'bool':
+        return [random_() < 0.5 for _ in range(n)]
+
+    # float
+    if modi is None or isinstance(modi, float):
+        return [modi] * n
+    if isinstance(modi, list):
+        return rng.choices(modi, k=n)
+    if modi == ('rand',):
+        return [random_() for _ in range(n)]
+    _, start, end = modi
+    span = end - start
+    return [start + span * random_() for _ in range(n)]
+
+
+def _python_column(spec: tuple[str, any], n: int, rng, randbytes, now,
+                   rows: range = None, permutations: dict = None, path: str = '') -> list:
+    typ, modi = spec
+
+    if typ == 'object':
+        return {name: _python_column(child, n, rng, randbytes, now,
+                                     rows, permutations, f'{path}.{name}')
+                for name, child in modi.items()}
+    if typ == 'array':
+        start, end, element = modi
+        lengths = [start] * n if start == end else rng.choices(range(start, end + 1), k=n)
+        offsets = [0, *itertools.accumulate(lengths)]
+        return ListColumn(offsets, _python_column(element, offsets[-1], rng, randbytes, now))
+
+    if typ in TIME_TYPES:
+        return _python_time(spec, n, rng, now, rows)
+
+    if _is_weighted(spec):
+        random_ = rng.random
+        return [_alias_choice(modi, random_) for _ in range(n)]
+
+    if _is_row_modifier(modi):
+        if modi[0] == 'seq':
+            start, step = _seq_arguments(modi)
+            return list(range(start + step * rows.start, start + step * rows.stop, step))
+        permutation, start = permutations[path], modi[1]
+        return [start + permutation(i) for i in rows]
+
+    if _is_ref(spec):
+        index = _ref_index(spec)
+        return index.take(rng.choices(range(len(index)), k=n))
+
+    if typ not in ('int', 'str'):
+        return _python_new_type(spec, n, rng)
+
+    if modi is None:
+        return ['' if typ == 'str' else None] * n
+
+    if isinstance(modi, (int, str)):
+        return [modi] * n
+
+    if isinstance(modi, list):
+        return rng.choices(modi, k=n)
+
+    if typ == 'str':
+        return random_uuids(n, randbytes)
+    start, end = _int_range(modi)
+    if end - start >= sys.maxsize:
+        # choices can't take the len of the range
+        return [rng.randint(start, end) for _ in range(n)]
+    return rng.choices(range(start, end + 1), k=n)
+
+
+def generate_columns(compiled: CompiledSchema, n: int, rng=None, clock=time.time,
+                     first_row: int = 0, key=None) -> Columns:
+    '''Generates n values for every field of an already compiled schema.
+
+    rng is a generator returned by batch_rng. Seeding it makes the values
+    reproducible, otherwise a shared generator and os.urandom are used.
+    The rows have the indexes first_row, ..., first_row + n - 1,
+    and key chooses the permutations of unique fields (see CompiledSchema.bind).
+    '''
+    global _default_rng
+    if rng is None:
+        if _default_rng is None:
+            _default_rng = batch_rng()
+        rng = _default_rng
+        randbytes = os.urandom
+    else:
+        randbytes = getattr(rng, 'randbytes', None) or rng.bytes
+
+    now = clock()
+    rows = range(first_row, first_row + n)
+    permutations = compiled.permutations(key)
+    if isinstance(rng, random.Random):
+        return {name: _python_column(spec, n, rng, randbytes, now, rows, permutations, name)
+                for name, spec in compiled.ast.items()}
+    np = _numpy()
+    return {name: _numpy_column(spec, n, np, rng, randbytes, now, rows, permutations, name)
+            for name, spec in compiled.ast.items()}
+
+
+def iterate_rows(columns: Columns) -> Iterator[FakeObj]:
+    '''Turns columns back into fake objects with plain python values'''
+    names = list(columns)
+    values = [column_values(col) for col in columns.values()]
+    for row in zip(*values):
+        yield dict(zip(names, row))
+
+
+def generate_batch(schema: Union[str, CompiledSchema], n: int, columnar: bool = True,
+                   rng=None, first_row: int = 0, key=None) -> Union[Columns, Iterator[FakeObj]]:
+    '''Generates n fake objects at once.
+
+    Returns a dict of columns (NumPy arrays if NumPy is installed, lists otherwise),
+    or an iterator of fake objects if columnar is False.
+    Pass rng=batch_rng(seed) for reproducible batches, and first_row and key
+    for batches continuing the seq and unique fields (see generate_columns).
+    '''
+    if isinstance(schema, str):
+        schema = compile_schema(schema)
+
+    columns = generate_columns(schema, n, rng, first_row=first_row, key=key)
+    if columnar:
+        return columns
+    return iterate_rows(columns)
 
 
 if __name__ == "__main__":
@@ -217,7 +1708,12 @@ if __name__ == "__main__":
         "type":"str:['client', 'partner', 'government']",
         "age": "int:rand(1, 90)",
         "str": "str:cat1",
-        "num": "int:1"
+        "num": "int:1",
+        "score": "float:rand(0, 5)",
+        "active": "bool:",
+        "born": "date:rand(1950-01-01, 2005-12-31)",
+        "email": "email:",
+        "plan": "enum:['free':8, 'pro':2]"
         }
         '''
     print(generate_object(spec_str))
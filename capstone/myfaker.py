@@ -1,132 +1,676 @@
-import argparse
-import configparser
-import json
+import contextlib
 import logging
-import multiprocessing
+import math
 import os
 import sys
 import pathlib
-import traceback
-import uuid
-
-from interpreter import generate_object, ParsingError
+import random
+import time
+from typing import Iterator
+
+from interpreter import compile_schema, ParsingError, CompiledSchema, FakeObj, Columns
+from interpreter import batch_rng, column_length, generate_columns, slice_columns
+from formats import FORMATS, ARROW_FORMATS, EXTENSIONS as FORMAT_EXTENSIONS
+from formats import check_format, FormatError, csv_header, csv_rows, write_arrow_file
+from formats import arrow_batch, arrow_schema
+from serializers import make_serializer, check_serializer, SerializerError, SERIALIZERS
+from pipeline import pipelined, run_pipeline, DEFAULT_QUEUE_SIZE
+from sinks import Sink, StreamSink, open_sink, concatenate_parts, compressor, CompressionError
+from sinks import DEFAULT_BUFFER_SIZE, COMPRESSIONS, EXTENSIONS
+from stats import Stats, Progress, per_worker, report, write_report, show_progress
+from uuidgen import random_uuids
 
 
 class ArgumentError(Exception):
     pass
 
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s\t%(levelname)s\t%(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-    handlers=[logging.StreamHandler()]
-)
-
-
-config = configparser.ConfigParser()
-config.read('default.ini')
-config_dict: dict = dict(config['DEFAULT'])
-
-argparser = argparse.ArgumentParser(prog='myfaker',
-                                    description='Utility for generating test data based on the provided data schema',
-                                    formatter_class=argparse.ArgumentDefaultsHelpFormatter)
-argparser.add_argument(
-    'directory',
-    default=config_dict.get('directory', 'out'),
-    help='Path to directory in which to save generated files'
-)
-
-argparser.add_argument(
-    '--data-schema', '-s',
-    required=True,
-    type=str,
-    help='Schema string or path to JSON file with the schema'
-)
-
-argparser.add_argument(
-    '--files-count', '-n',
-    type=int,
-    default=config_dict.get('files_count', 0),
-    help='Number of files to generate'
-)
-
-argparser.add_argument(
-    '--file-name', '-b',
-    default=config_dict.get('file_name', 'myfaker_data'),
-    help='Base filename of the created files'
-)
-
-argparser.add_argument(
-    '--file-suffix', '-x',
-    default=config_dict.get('file_suffix', 'uuid'),
-    choices=['count', 'random', 'uuid'],
-    help=(
-        'Type of suffix to be appended to the base filename '
-        'when more than one file is generated'
-    )
-)
-
-argparser.add_argument(
-    '--data-lines', '-l',
-    type=int,
-    default=config_dict.get('data_lines', 1),
-    help='How many lines to generate in each file'
-)
-
-argparser.add_argument(
-    '--clear-path', '-r',
-    action='store_true',
-    help='Delete existing files with the same base filename'
-)
-
-argparser.add_argument(
-    '--multiprocessing', '-j',
-    type=int,
-    default=config_dict.get('multiprocessing', 1),
-    help='Number of concurrent jobs (limited by CPU cores)'
-)
 
+def setup_logging() -> None:
+    '''Logs INFO messages and above to stderr. Called when running as a script,
+    importing the module doesn't configure logging.'''
+    logging.basicConfig(
+        level=logging.INFO,
+        format="%(asctime)s\t%(levelname)s\t%(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        handlers=[logging.StreamHandler()]
+    )
 
-def generate_file(directory: pathlib.Path, schema: str,
-                  file_base_name: str, file_suffix: str,
-                  data_lines: int, index=0) -> None:
-    if file_suffix == 'uuid':
-        suffix = '_' + str(uuid.uuid4())
-    elif file_suffix == 'count':
+
+def read_config(path='default.ini') -> dict:
+    '''Default values of the options, from the DEFAULT section of the config file
+    in the current directory'''
+    import configparser
+    config = configparser.ConfigParser()
+    config.read(path)
+    return dict(config['DEFAULT'])
+
+
+def build_parser(config_dict: dict):
+    '''The argument parser, with defaults taken from config_dict'''
+    import argparse
+    argparser = argparse.ArgumentParser(
+        prog='myfaker',
+        description='Utility for generating test data based on the provided data schema',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    argparser.add_argument(
+        'directory',
+        default=config_dict.get('directory', 'out'),
+        help='Path to directory in which to save generated files'
+    )
+
+    argparser.add_argument(
+        '--data-schema', '-s',
+        required=True,
+        type=str,
+        help='Schema string or path to JSON file with the schema'
+    )
+
+    argparser.add_argument(
+        '--files-count', '-n',
+        type=int,
+        default=config_dict.get('files_count', 0),
+        help='Number of files to generate'
+    )
+
+    argparser.add_argument(
+        '--file-name', '-b',
+        default=config_dict.get('file_name', 'myfaker_data'),
+        help='Base filename of the created files'
+    )
+
+    argparser.add_argument(
+        '--file-suffix', '-x',
+        default=config_dict.get('file_suffix', 'uuid'),
+        choices=['count', 'random', 'uuid'],
+        help=(
+            'Type of suffix to be appended to the base filename '
+            'when more than one file is generated'
+        )
+    )
+
+    argparser.add_argument(
+        '--data-lines', '-l',
+        type=int,
+        default=config_dict.get('data_lines', 1),
+        help=(
+            'How many lines to generate in each file '
+            '(-1 generates to stdout until interrupted)'
+        )
+    )
+
+    argparser.add_argument(
+        '--clear-path', '-r',
+        action='store_true',
+        help='Delete existing files with the same base filename'
+    )
+
+    argparser.add_argument(
+        '--multiprocessing', '-j',
+        type=int,
+        default=config_dict.get('multiprocessing', 1),
+        help='Number of concurrent jobs (limited by CPU cores)'
+    )
+
+    argparser.add_argument(
+        '--buffer-size',
+        type=int,
+        default=config_dict.get('buffer_size', DEFAULT_BUFFER_SIZE),
+        help='Size in bytes of the output buffer of each file'
+    )
+
+    argparser.add_argument(
+        '--flush-every',
+        type=int,
+        default=config_dict.get('flush_every', 0),
+        help=(
+            'Flush and sync the output file to disk every N lines '
+            '(0 means only once all lines are written)'
+        )
+    )
+
+    argparser.add_argument(
+        '--serializer',
+        default=config_dict.get('serializer', 'schema'),
+        choices=SERIALIZERS,
+        help=(
+            'How generated objects are converted to JSON: '
+            'schema-aware (same output as json), json module or orjson'
+        )
+    )
+
+    argparser.add_argument(
+        '--seed',
+        type=int,
+        default=config_dict.get('seed'),
+        help=(
+            'Seed for reproducible output: the same seed gives the same files '
+            'for any number of jobs'
+        )
+    )
+
+    argparser.add_argument(
+        '--rate',
+        type=float,
+        default=config_dict.get('rate', 0),
+        help='Limit the output to stdout to this many lines per second (0 means no limit)'
+    )
+
+    argparser.add_argument(
+        '--compression',
+        default=config_dict.get('compression', 'none'),
+        choices=COMPRESSIONS,
+        help='Compress the output files (zstd requires the zstandard package)'
+    )
+
+    argparser.add_argument(
+        '--format',
+        default=config_dict.get('format', 'jsonl'),
+        choices=FORMATS,
+        help='Output format (parquet and arrow require the pyarrow package)'
+    )
+
+    argparser.add_argument(
+        '--max-memory',
+        type=int,
+        default=config_dict.get('max_memory', 0),
+        help=(
+            'Memory budget in MiB for the data in flight (chunks of lines and output buffers, '
+            'shared by all jobs), used to size the chunks. 0 means default sizes'
+        )
+    )
+
+    argparser.add_argument(
+        '--stats',
+        action='store_true',
+        help=(
+            'Show a progress line on stderr, log the time spent parsing, evaluating, '
+            'serializing and writing, and write a JSON stats report at the end'
+        )
+    )
+
+    argparser.add_argument(
+        '--stats-file',
+        default=config_dict.get('stats_file'),
+        help='File for the JSON stats report of --stats, stderr if not set'
+    )
+    return argparser
+
+
+# number of rows serialized and handed to the sink at once
+CHUNK_ROWS = 1000
+
+# number of rows generated at once as columns for the other formats
+BATCH_ROWS = 65_536
+
+# a file is only split between workers if every part gets at least this many lines
+MIN_SHARD_LINES = 10_000
+
+# with a seed, every block of lines gets its own random stream
+SEED_BLOCK_LINES = 10_000
+
+
+def block_random(seed: int, file_index: int, block: int) -> random.Random:
+    '''Random stream of a block of lines, derived from the seed.
+    Seeding with a string hashes it, so the streams are independent.'''
+    return random.Random(f'{seed}/{file_index}/{block}')
+
+
+def seeded_clock():
+    '''With a seed, timestamps are taken from the SOURCE_DATE_EPOCH
+    environment variable if it is set, so that they are reproducible too'''
+    epoch = os.environ.get('SOURCE_DATE_EPOCH')
+    if epoch is None:
+        return time.time
+    epoch = float(epoch)
+    return lambda: epoch
+
+
+def line_blocks(data_lines: int, seed: int = None,
+                file_index=0, first_line=0) -> Iterator[tuple[int, float, random.Random]]:
+    '''Splits the lines first_line, first_line + 1, ... into (skip, count, rng) blocks,
+    where data_lines < 0 means endless lines.
+
+    Without a seed there is a single block and rng is None.
+    With a seed, lines are generated in blocks of SEED_BLOCK_LINES, each with its own
+    random stream derived from the seed, the file index and the block index.
+    The output then doesn't depend on how lines are split between workers.
+    skip is the number of lines of the block that come before first_line.
+    '''
+    line = first_line
+    end = math.inf if data_lines < 0 else first_line + data_lines
+
+    if seed is None:
+        yield 0, end - line, None
+        return
+
+    while line < end:
+        block = line // SEED_BLOCK_LINES
+        block_end = min(end, (block + 1) * SEED_BLOCK_LINES)
+        yield line - block * SEED_BLOCK_LINES, block_end - line, block_random(seed, file_index, block)
+        line = block_end
+
+
+def chunk_sizes(count: float, chunk_rows: int) -> Iterator[int]:
+    while count > 0:
+        size = min(chunk_rows, count)
+        yield size
+        count -= size
+
+
+def row_chunks(generator: CompiledSchema, data_lines: int, seed: int = None,
+               file_index=0, first_line=0, chunk_rows=CHUNK_ROWS,
+               row_offset=0) -> Iterator[list[FakeObj]]:
+    '''Yields data_lines generated objects in lists of at most chunk_rows,
+    or never stops if data_lines is negative. See line_blocks for seeding.
+
+    row_offset is the index of the first line of the file among all the
+    generated lines, the rows of seq and unique fields continue from there.'''
+    clock = time.time if seed is None else seeded_clock()
+    line = first_line
+    for skip, count, rng in line_blocks(data_lines, seed, file_index, first_line):
+        generate = generator.bind(rng, clock, row_offset + line - skip, seed)
+        # parts of a file normally start at a block boundary
+        for _ in range(skip):
+            generate()
+        for size in chunk_sizes(count, chunk_rows):
+            yield [generate() for _ in range(size)]
+        line += count
+
+
+def column_batches(generator: CompiledSchema, data_lines: int, seed: int = None,
+                   file_index=0, first_line=0, batch_rows=BATCH_ROWS,
+                   row_offset=0) -> Iterator[Columns]:
+    '''Like row_chunks, but yields batches of columns.
+
+    Columns are drawn one after the other, so with a seed every block of
+    lines is drawn at once and then sliced into batches: the values don't
+    depend on batch_rows (which depends on -j with --max-memory, and on
+    --flush-every).'''
+    clock = time.time if seed is None else seeded_clock()
+    row = row_offset + first_line
+    for skip, count, rng in line_blocks(data_lines, seed, file_index, first_line):
+        if rng is None:
+            for size in chunk_sizes(count, batch_rows):
+                yield generate_columns(generator, size, None, clock, row, seed)
+                row += size
+            continue
+
+        # only reproducible when parts start at block boundaries,
+        # which generate_files_async makes sure of
+        block = generate_columns(generator, skip + count, batch_rng(rng.getrandbits(64)),
+                                 clock, row - skip, seed)
+        for start in range(skip, skip + count, batch_rows):
+            yield slice_columns(block, start, min(start + batch_rows, skip + count))
+        row += count
+
+
+def chunk_rows_for(fmt: str, flush_every=0, rate: float = 0) -> int:
+    '''Number of lines generated at once'''
+    rows = CHUNK_ROWS if fmt == 'jsonl' else BATCH_ROWS
+    if flush_every:
+        rows = min(rows, flush_every)
+    if rate:
+        # with a rate limit, lines are written about ten times per second
+        rows = min(rows, max(1, int(rate / 10)))
+    return rows
+
+
+def chunk_source(generator: CompiledSchema, data_lines: int, fmt='jsonl', seed: int = None,
+                 file_index=0, first_line=0, chunk_rows=CHUNK_ROWS, row_offset=0) -> Iterator:
+    '''Generated chunks of lines: lists of objects for JSON lines, batches of columns otherwise'''
+    if fmt == 'jsonl':
+        return row_chunks(generator, data_lines, seed, file_index, first_line, chunk_rows,
+                          row_offset)
+    return column_batches(generator, data_lines, seed, file_index, first_line, chunk_rows,
+                          row_offset)
+
+
+def chunk_encoder(generator: CompiledSchema, fmt='jsonl', serializer='schema'):
+    '''Returns a function encoding a chunk from chunk_source as (data, number of lines)'''
+    if fmt == 'csv':
+        return lambda columns: (csv_rows(columns), column_length(next(iter(columns.values()))))
+
+    serialize = make_serializer(generator, serializer)
+    return lambda rows: (('\n'.join([serialize(row) for row in rows]) + '\n').encode(), len(rows))
+
+
+def write_lines(sink: Sink, generator: CompiledSchema, data_lines: int, fmt='jsonl',
+                serializer='schema', seed: int = None, file_index=0, first_line=0,
+                chunk_rows=CHUNK_ROWS, on_chunk=None, stats: Stats = None,
+                row_offset=0) -> None:
+    '''Generates lines as JSON lines or CSV and writes them to the sink.
+    Generation, serialization and writing are stages of a pipeline,
+    the time spent in each of them is added to stats.
+    on_chunk is called with the number of lines after every write.'''
+    stats = stats or Stats()
+    if fmt == 'csv' and first_line == 0:
+        header = csv_header(generator)
+        sink.write(header, 0)
+        stats.count(0, len(header))
+
+    def write(chunk):
+        data, rows = chunk
+        with stats.measure('write'):
+            sink.write(data, rows)
+        stats.count(rows, len(data))
+        if on_chunk:
+            on_chunk(rows)
+
+    source = chunk_source(generator, data_lines, fmt, seed, file_index, first_line, chunk_rows,
+                          row_offset)
+    encode = chunk_encoder(generator, fmt, serializer)
+    run_pipeline(stats.time_producer('evaluate', source), [stats.timed('serialize', encode)], write)
+
+
+def estimate_row_memory(generator: CompiledSchema, fmt='jsonl', serializer='schema') -> int:
+    '''Rough number of bytes a generated line takes while it is in flight,
+    as python objects and once encoded'''
+    # a generator of its own, so the rows of seq and unique fields still start at 0
+    sample = generator.bind()
+    rows = [sample() for _ in range(min(100, generator.max_rows or 100))]
+    objects = sum(sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row.values())
+                  for row in rows)
+    encoded, _ = chunk_encoder(generator, 'jsonl', serializer)(rows)
+    return max(1, (objects + 2 * len(encoded)) // len(rows))
+
+
+def plan_memory(generator: CompiledSchema, max_memory: int, fmt='jsonl', serializer='schema',
+                compression='none', jobs=1, rate: float = 0) -> tuple[int, int]:
+    '''Splits the memory budget (in bytes, for all the jobs) between the chunks
+    in flight in the pipeline and the output buffers.
+    Returns the number of lines per chunk and the buffer size.'''
+    budget = max_memory // jobs // 2
+
+    # chunks waiting in the queues, plus the ones being produced and consumed
+    chunks_in_flight = 2 * DEFAULT_QUEUE_SIZE + 3
+    chunk_rows = budget // chunks_in_flight // estimate_row_memory(generator, fmt, serializer)
+    chunk_rows = max(1, min(chunk_rows, chunk_rows_for(fmt, rate=rate)))
+
+    # compressed sinks keep up to two blocks per thread in flight
+    blocks = 1 if compression == 'none' else 1 + 2 * (os.cpu_count() or 1)
+    buffer_size = max(1, budget // blocks)
+    return chunk_rows, buffer_size
+
+
+def file_path(directory: pathlib.Path, file_base_name: str,
+              file_suffix: str, index=0, seed: int = None,
+              compression='none', fmt='jsonl') -> pathlib.Path:
+    if file_suffix == 'count':
         suffix = '_' + str(index)
-    elif file_suffix == 'random':
-        suffix = '_' + str(uuid.uuid4())
+    elif file_suffix in ('uuid', 'random'):
+        if seed is None:
+            suffix = '_' + random_uuids(1)[0]
+        else:
+            suffix = '_' + random_uuids(1, random.Random(f'{seed}/name/{index}').randbytes)[0]
     else:
         raise ArgumentError('Invalid value for --file-suffix')
 
-    fpath = directory / (file_base_name + suffix + '.jsonl')
+    extension = FORMAT_EXTENSIONS[fmt]
+    # parquet and arrow compress inside the file
+    if fmt not in ARROW_FORMATS:
+        extension += EXTENSIONS[compression]
+    return directory / (file_base_name + suffix + extension)
+
+
+def generate_lines(fpath: pathlib.Path, schema: str, data_lines: int,
+                   buffer_size=DEFAULT_BUFFER_SIZE, flush_every=0,
+                   serializer='schema', seed: int = None,
+                   file_index=0, first_line=0, compression='none',
+                   fmt='jsonl', chunk_rows: int = None,
+                   stats: Stats = None, row_offset=0) -> tuple[int, int]:
+    '''Appends data_lines generated lines to the file
+    (Parquet and Arrow files are replaced instead).
+    Returns the number of bytes generated and written (after compression).
+    row_offset is the index of the first line of the file, see row_chunks.'''
+    stats = stats or Stats()
+    generator = compile_schema(schema)
+    chunk_rows = min(chunk_rows or math.inf, chunk_rows_for(fmt, flush_every))
+
+    if fmt in ARROW_FORMATS:
+        size = write_arrow_batches(fpath, generator, data_lines, seed, file_index, first_line,
+                                   compression, fmt, chunk_rows, stats, row_offset)
+        return size, size
+
+    sink = open_sink(fpath, compression, buffer_size, flush_every)
+    try:
+        write_lines(sink, generator, data_lines, fmt, serializer, seed,
+                    file_index, first_line, chunk_rows, stats=stats, row_offset=row_offset)
+    finally:
+        with stats.measure('write'):
+            sink.close()
+    stats.bytes_written += sink.bytes_written
+    return sink.raw_bytes, sink.bytes_written
+
+
+def write_arrow_batches(fpath: pathlib.Path, generator: CompiledSchema, data_lines: int,
+                        seed: int = None, file_index=0, first_line=0, compression='none',
+                        fmt='parquet', chunk_rows=BATCH_ROWS, stats: Stats = None,
+                        row_offset=0) -> int:
+    '''Writes a Parquet or Arrow file, converting the batches of columns
+    to Arrow in a pipeline stage. Returns the size of the file.
+    Bytes generated are counted as the in-memory size of the record batches.'''
+    stats = stats or Stats()
+    schema = arrow_schema(generator)
+
+    def written(batches):
+        for batch in stats.time_consumer('write', batches):
+            yield batch
+            stats.count(batch.num_rows, batch.nbytes)
+
+    batches = column_batches(generator, data_lines, seed, file_index, first_line, chunk_rows,
+                             row_offset)
+    convert = stats.timed('serialize', lambda columns: arrow_batch(schema, columns))
+    batches = pipelined(stats.time_producer('evaluate', batches), [convert])
+    size = write_arrow_file(fpath, generator, written(batches), fmt, compression)
+    stats.bytes_written += size
+    return size
 
-    for _ in range(data_lines):
-        obj = generate_object(schema)
-        with fpath.open('a') as f:
-            f.write(json.dumps(obj) + '\n')
+
+def generate_file(directory: pathlib.Path, schema: str,
+                  file_base_name: str, file_suffix: str,
+                  data_lines: int, index=0,
+                  buffer_size=DEFAULT_BUFFER_SIZE, flush_every=0,
+                  serializer='schema', seed: int = None,
+                  compression='none', fmt='jsonl', chunk_rows: int = None,
+                  stats: Stats = None) -> tuple[int, int]:
+    fpath = file_path(directory, file_base_name, file_suffix, index, seed, compression, fmt)
+    return generate_lines(fpath, schema, data_lines, buffer_size, flush_every, serializer,
+                          seed, file_index=index, compression=compression, fmt=fmt,
+                          chunk_rows=chunk_rows, stats=stats, row_offset=index * data_lines)
+
+
+def split_lines(data_lines: int, shards: int, align=1) -> list[int]:
+    '''Splits data_lines into `shards` nearly equal line counts.
+    All parts except the last one are multiples of align.'''
+    blocks = -(-data_lines // align)
+    size, rest = divmod(blocks, shards)
+    counts = [(size + 1 if k < rest else size) * align for k in range(shards)]
+
+    # the last non-empty part takes the remainder of the last block
+    last = max(k for k in range(shards) if counts[k] or k == 0)
+    counts[last] -= sum(counts) - data_lines
+    return counts
+
+
+# Multiprocessing
+#
+# The schema and the output options are sent to every worker once,
+# by the pool initializer. The work is cut into tasks: ranges of files,
+# or parts of a file when there are fewer files than workers.
+# Idle workers take the next task from the shared queue, and the
+# ranges get smaller towards the end so that the workers finish together.
+
+_worker_options = {}
+
+
+def _init_worker(schema: str, buffer_size: int, flush_every: int, serializer: str,
+                 seed: int, compression: str, fmt: str, chunk_rows: int,
+                 progress: Progress, key: int) -> None:
+    _worker_options.update(schema=schema, buffer_size=buffer_size,
+                           flush_every=flush_every, serializer=serializer, seed=seed,
+                           compression=compression, fmt=fmt, chunk_rows=chunk_rows,
+                           progress=progress)
+    # compiled once per worker, later calls hit the cache
+    try:
+        generator = compile_schema(schema)
+        # the same permutations of unique fields in every worker
+        generator.key = key
+        make_serializer(generator, serializer)
+    except Exception:
+        # an exception here would make the pool restart the worker forever,
+        # the first task raises it again instead
+        pass
+
+
+def _run_task(task: tuple) -> tuple[int, Stats]:
+    '''Runs a task in a worker. Returns the worker's pid and the stats of the task.'''
+    start = time.perf_counter()
+    options = _worker_options
+    stats = Stats(options['progress'])
+
+    if task[0] == 'files':
+        _, directory, file_base_name, file_suffix, data_lines, first, last = task
+        for i in range(first, last):
+            generate_file(directory, options['schema'], file_base_name, file_suffix,
+                          data_lines, i, options['buffer_size'],
+                          options['flush_every'], options['serializer'],
+                          options['seed'], options['compression'],
+                          options['fmt'], options['chunk_rows'], stats)
+    else:
+        _, part, lines, file_index, first_line, row_offset = task
+        generate_lines(part, options['schema'], lines,
+                       options['buffer_size'], options['flush_every'],
+                       options['serializer'], options['seed'],
+                       file_index, first_line, options['compression'],
+                       options['fmt'], options['chunk_rows'], stats, row_offset)
+
+    stats.tasks = 1
+    stats.elapsed = time.perf_counter() - start
+    return os.getpid(), stats
+
+
+def guided_chunks(count: int, workers: int) -> list[tuple[int, int]]:
+    '''Splits range(count) into (start, end) chunks with decreasing sizes,
+    each chunk being half of the remaining work divided by the number of workers'''
+    chunks = []
+    start = 0
+    while start < count:
+        size = max(1, (count - start) // (2 * workers))
+        chunks.append((start, min(count, start + size)))
+        start += size
+    return chunks
+
+
+def log_worker_stats(workers: dict[int, Stats]) -> None:
+    for pid, stats in workers.items():
+        rates = stats.rates()
+        logging.info(
+            f'Worker {pid}: {stats.tasks} tasks, {stats.rows} lines in {stats.elapsed:.2f} s '
+            f'({rates["lines_per_second"]:,.0f} lines/s, {rates["mb_per_second"]:.1f} MB/s)')
 
 
 def generate_files_async(directory: pathlib.Path, schema: str,
                          file_base_name: str, file_suffix: str,
-                         data_lines: int, files_count: int, num_processes: int) -> None:
-
-    with multiprocessing.Pool(processes=num_processes) as pool:
-        results = []
-
+                         data_lines: int, files_count: int, num_processes: int,
+                         buffer_size=DEFAULT_BUFFER_SIZE, flush_every=0,
+                         serializer='schema', seed: int = None,
+                         compression='none', fmt='jsonl',
+                         chunk_rows: int = None, progress: Progress = None) -> dict[int, Stats]:
+    '''When there are fewer files than processes, every file is split into
+    line ranges which are generated into temporary part files by different workers,
+    and then stitched together in order. Compressed parts are independent blocks,
+    so they are concatenated as they are. Parquet and Arrow files aren't split.
+
+    Exceptions raised in the workers are re-raised here.
+    Returns the stats of every worker process.'''
+
+    shards = 1
+    if files_count < num_processes and fmt not in ARROW_FORMATS:
+        shards = min(-(-num_processes // files_count),
+                     max(1, data_lines // MIN_SHARD_LINES))
+
+    tasks = []
+    parts = {}
+    if shards == 1:
+        for first, last in guided_chunks(files_count, num_processes):
+            tasks.append(('files', directory, file_base_name, file_suffix,
+                          data_lines, first, last))
+    else:
+        # with a seed, parts start at the beginning of a block of lines
+        align = 1 if seed is None else SEED_BLOCK_LINES
         for i in range(files_count):
-            result = pool.apply_async(
-                generate_file, (directory, schema, file_base_name, file_suffix, data_lines, i))
-            results.append(result)
-
-        pool.close()
-        pool.join()
-
-
-def generate_to_stdout(schema: str, count: int):
-    for _ in range(count):
-        obj = generate_object(schema)
-        print(json.dumps(obj))
+            fpath = file_path(directory, file_base_name, file_suffix, i, seed, compression, fmt)
+            parts[fpath] = []
+            first_line = 0
+            for k, lines in enumerate(split_lines(data_lines, shards, align)):
+                part = fpath.with_name(f'.{fpath.name}.part{k}')
+                parts[fpath].append(part)
+                tasks.append(('part', part, lines, i, first_line, i * data_lines))
+                first_line += lines
+
+    # without a seed, every worker would draw its own key for unique fields
+    key = seed if seed is not None else random.getrandbits(64)
+    initargs = (schema, buffer_size, flush_every, serializer, seed, compression, fmt,
+                chunk_rows, progress, key)
+    import multiprocessing
+    try:
+        with multiprocessing.Pool(num_processes, _init_worker, initargs) as pool:
+            workers = per_worker(pool.imap_unordered(_run_task, tasks))
+
+        for fpath, file_parts in parts.items():
+            concatenate_parts(fpath, file_parts)
+    finally:
+        for file_parts in parts.values():
+            for part in file_parts:
+                part.unlink(missing_ok=True)
+
+    log_worker_stats(workers)
+    return workers
+
+
+def write_stream(stream, schema: str, count: int, serializer='schema', seed: int = None,
+                 rate: float = 0, buffer_size=DEFAULT_BUFFER_SIZE, fmt='jsonl',
+                 chunk_rows: int = None, stats: Stats = None) -> None:
+    '''Writes count lines (or endless lines if count is negative) to a binary stream
+    in large batches, at most `rate` lines per second if rate is set.
+    The lines written so far are counted in stats.'''
+    stats = stats or Stats()
+    generator = compile_schema(schema)
+    chunk_rows = min(chunk_rows or math.inf, chunk_rows_for(fmt, rate=rate))
+    start = time.monotonic()
+
+    def throttle(rows):
+        if rate:
+            sink.flush()
+            delay = start + stats.rows / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    with StreamSink(stream, buffer_size) as sink:
+        write_lines(sink, generator, count, fmt, serializer, seed,
+                    chunk_rows=chunk_rows, on_chunk=throttle, stats=stats)
+    stats.bytes_written += sink.bytes_written
+
+
+def generate_to_stdout(schema: str, count: int, serializer='schema', seed: int = None,
+                       rate: float = 0, buffer_size=DEFAULT_BUFFER_SIZE, fmt='jsonl',
+                       chunk_rows: int = None, stats: Stats = None) -> None:
+    '''Writes count lines (or endless lines if count is negative) to stdout,
+    see write_stream. Stops quietly when the reading end of a pipe is closed.'''
+    stats = stats or Stats()
+    sys.stdout.flush()
+    try:
+        write_stream(sys.stdout.buffer, schema, count, serializer, seed, rate,
+                     buffer_size, fmt, chunk_rows, stats)
+    except BrokenPipeError:
+        # Python flushes stdout again at exit, which would raise another
+        # BrokenPipeError, so stdout is pointed at devnull
+        try:
+            devnull = os.open(os.devnull, os.O_WRONLY)
+            os.dup2(devnull, sys.stdout.fileno())
+        except (OSError, ValueError):
+            pass
+        logging.info(f'Output closed after {stats.rows} lines')
 
 
 def clear_files_with_prefix(dir: pathlib.Path, prefix):
@@ -138,23 +682,22 @@ def clear_files_with_prefix(dir: pathlib.Path, prefix):
             file.unlink()  # Delete the file
 
 
-def run_cli(argv=None):
-    '''Run the CLI app on the provided arguments,
-    or on the sys.argv list if argv is None'''
-    args = argparser.parse_args(argv)
-
-    # Input validation
+def parse_cli(argv=None, cwd: str = None):
+    '''Parses and validates the arguments, relative to the cwd directory
+    (the current directory by default). The schema is read into args.schema.'''
+    base = pathlib.Path(cwd or '.')
+    args = build_parser(read_config(base / 'default.ini')).parse_args(argv)
 
     try:
-        out_dir = pathlib.Path(args.directory)
+        args.directory = base / args.directory
     except:
         raise ArgumentError('Can\'t find output directory')
 
     try:
-        path = pathlib.Path(args.data_schema)
-        schema = path.read_text()
+        path = base / args.data_schema
+        args.schema = path.read_text()
     except:
-        schema = args.data_schema
+        args.schema = args.data_schema
 
     if args.files_count < 0:
         raise ArgumentError('Files count cannot be negative')
@@ -167,39 +710,180 @@ def run_cli(argv=None):
         logging.info(
             f'Limited number of cores to {args.multiprocessing}')
 
-    # Processing
+    if args.data_lines < -1:
+        raise ArgumentError('Data lines must be a natural number, or -1')
+
+    if args.data_lines == -1 and args.files_count != 0:
+        raise ArgumentError('Endless generation (-1 data lines) only works with stdout')
+
+    if args.rate < 0:
+        raise ArgumentError('Rate cannot be negative')
+
+    if args.rate and args.files_count != 0:
+        raise ArgumentError('Rate limiting is only supported when writing to stdout')
+
+    if args.buffer_size < 1:
+        raise ArgumentError('Buffer size must be a positive number')
+
+    if args.flush_every < 0:
+        raise ArgumentError('Flush interval cannot be negative')
+
+    if args.max_memory < 0:
+        raise ArgumentError('Memory budget cannot be negative')
+
+    try:
+        check_serializer(args.serializer)
+    except SerializerError as e:
+        raise ArgumentError(str(e))
+
+    try:
+        check_format(args.format, args.compression)
+    except FormatError as e:
+        raise ArgumentError(str(e))
+
+    if args.format in ARROW_FORMATS and args.files_count == 0:
+        raise ArgumentError(f'{args.format} output can only be written to files')
+
+    if args.compression != 'none' and args.format not in ARROW_FORMATS:
+        if args.files_count == 0:
+            raise ArgumentError('Compression is only supported when writing files')
+        try:
+            compressor(args.compression)
+        except CompressionError as e:
+            raise ArgumentError(str(e))
+
+    return args
+
+
+def check_rows(generator: CompiledSchema, args) -> None:
+    '''Checks that the unique fields have a value for every line,
+    and that seq fields stay in their range.
+
+    Every process must use the same permutations for the unique fields,
+    which are chosen by the seed: without one, a random seed is set.'''
+    if generator.max_rows is not None:
+        lines = math.inf if args.data_lines < 0 else args.data_lines * max(1, args.files_count)
+        if lines > generator.max_rows:
+            raise ArgumentError(f'Unique fields only have {generator.max_rows} values '
+                                f'for {lines} lines')
+        if args.seed is None:
+            args.seed = random.getrandbits(32)
+
+    # endless lines aren't checked: ints take centuries to leave their range,
+    # and datetime fields raise an error when they do
+    if generator.seq_rows is not None and args.data_lines >= 0:
+        lines = args.data_lines * max(1, args.files_count)
+        if lines > generator.seq_rows:
+            raise ArgumentError(f'seq fields only have {generator.seq_rows} values '
+                                f'in their range for {lines} lines')
+
+
+def run_cli(argv=None):
+    '''Run the CLI app on the provided arguments,
+    or on the sys.argv list if argv is None'''
+    args = parse_cli(argv)
+    out_dir = args.directory
+    schema = args.schema
+
+    # the schema is checked before any file is touched
+    total = Stats()
+    with total.measure('parse'):
+        generator = compile_schema(schema)
+    check_rows(generator, args)
 
     if args.clear_path and args.files_count != 0:
         clear_files_with_prefix(out_dir, args.file_name)
 
-    logging.info('Generating data...')
+    chunk_rows = None
+    if args.max_memory:
+        jobs = args.multiprocessing if args.files_count else 1
+        chunk_rows, buffer_size = plan_memory(
+            generator, args.max_memory << 20, args.format, args.serializer,
+            args.compression, jobs, args.rate)
+        args.buffer_size = min(args.buffer_size, buffer_size)
 
-    if args.files_count == 0:
-        generate_to_stdout(schema, args.data_lines)
-    else:
-        if args.multiprocessing == 1:
+    progress = Progress() if args.stats else None
+    total_lines = args.data_lines * max(args.files_count, 1) if args.data_lines >= 0 else None
+
+    logging.info('Generating data...')
+    start = time.perf_counter()
+
+    with show_progress(progress, total_lines) if progress else contextlib.nullcontext():
+        if args.files_count == 0:
+            stats = Stats(progress)
+            workers = {os.getpid(): stats}
+            generate_to_stdout(schema, args.data_lines, args.serializer, args.seed,
+                               args.rate, args.buffer_size, args.format, chunk_rows, stats)
+        elif args.multiprocessing == 1:
+            stats = Stats(progress)
+            workers = {os.getpid(): stats}
             for i in range(args.files_count):
                 generate_file(out_dir, schema, args.file_name, args.file_suffix,
-                              args.data_lines, index=i)
+                              args.data_lines, index=i,
+                              buffer_size=args.buffer_size,
+                              flush_every=args.flush_every,
+                              serializer=args.serializer, seed=args.seed,
+                              compression=args.compression, fmt=args.format,
+                              chunk_rows=chunk_rows, stats=stats)
         else:
-            generate_files_async(out_dir, schema, args.file_name, args.file_suffix,
-                                 args.data_lines, args.files_count, args.multiprocessing)
+            workers = generate_files_async(
+                out_dir, schema, args.file_name, args.file_suffix,
+                args.data_lines, args.files_count, args.multiprocessing,
+                args.buffer_size, args.flush_every, args.serializer, args.seed,
+                args.compression, args.format, chunk_rows, progress)
+
+    elapsed = time.perf_counter() - start
+    single_process = args.files_count == 0 or args.multiprocessing == 1
+    if single_process:
+        stats.tasks = 1
+        stats.elapsed = elapsed
+    for stats in workers.values():
+        total.add(stats)
+    total.elapsed = elapsed
+
+    if args.files_count and args.compression != 'none' and args.format not in ARROW_FORMATS:
+        generated, written = total.raw_bytes, total.bytes_written
+        ratio = generated / written if written else 0
+        logging.info(
+            f'Data generated: {generated / 1e6:.1f} MB compressed to {written / 1e6:.1f} MB '
+            f'with {args.compression} (ratio {ratio:.2f}, {generated / max(elapsed, 1e-9) / 1e6:.1f} MB/s)')
+    else:
+        logging.info('Data generated')
 
-    logging.info('Data generated')
+    if args.stats:
+        stages = ', '.join(f'{stage} {seconds:.2f} s' for stage, seconds in total.times.items())
+        logging.info(f'Time per stage: {stages}')
+        if single_process:
+            log_worker_stats(workers)
+        options = {
+            'files_count': args.files_count, 'data_lines': args.data_lines,
+            'jobs': args.multiprocessing, 'format': args.format,
+            'compression': args.compression, 'serializer': args.serializer,
+        }
+        write_report(report(total, workers, options), args.stats_file)
 
 
 if __name__ == '__main__':
+    setup_logging()
     # redirect traceback to file
     try:
-        run_cli()
+        if sys.argv[1:2] == ['serve']:
+            import server
+            server.main(sys.argv[2:])
+        else:
+            run_cli()
     except ParsingError as e:
         logging.error("Syntax error: " + str(e))
         sys.exit(1)
     except ArgumentError as e:
         logging.error("Argument error: " + str(e))
         sys.exit(1)
+    except KeyboardInterrupt:
+        logging.info('Interrupted')
+        sys.exit(130)
     except Exception as e:
         logging.error("An unhandled exception occurred: " + str(e))
+        import traceback
         with open('error_log.txt', 'a') as f:
             f.write(traceback.format_exc())
         sys.exit(1)
@@ -0,0 +1,78 @@
+'''
+Keyed permutations of integer ranges, for fields with unique values.
+
+The value of row i is permutation[i], computed directly from i, so the
+values are unique without remembering the ones already generated, and
+rows can be generated in any order by any number of workers.
+
+The permutation is a 4-round Feistel network on the smallest even
+number of bits that covers the range, which is a bijection on that
+power of two. Values outside the range are encrypted again
+("cycle walking") until they fall in it, which keeps it a bijection
+of the range. The domain is less than 4 times the range, so this
+takes less than 4 rounds of the network on average.
+'''
+import functools
+import random
+
+ROUNDS = 4
+
+_MULTIPLIER = 0xff51afd7ed558ccd
+_MASK64 = (1 << 64) - 1
+
+
+class Permutation:
+    '''A pseudo-random permutation of range(size), chosen by the key'''
+
+    def __init__(self, size: int, key: str):
+        if size < 1:
+            raise ValueError('The range of a permutation must not be empty')
+        self.size = size
+        self.half_bits = max(1, ((size - 1).bit_length() + 1) // 2)
+        self.half_mask = (1 << self.half_bits) - 1
+        rng = random.Random(f'permutation/{key}')
+        self.keys = tuple(rng.getrandbits(64) for _ in range(ROUNDS))
+
+    def _encrypt(self, x: int) -> int:
+        bits, mask = self.half_bits, self.half_mask
+        left, right = x >> bits, x & mask
+        for k in self.keys:
+            f = ((right ^ k) * _MULTIPLIER) & _MASK64
+            f ^= f >> 29
+            left, right = right, left ^ (f & mask)
+        return (left << bits) | right
+
+    def __call__(self, i: int) -> int:
+        if not 0 <= i < self.size:
+            raise IndexError(f'All the {self.size} unique values were generated')
+        x = self._encrypt(i)
+        while x >= self.size:
+            x = self._encrypt(x)
+        return x
+
+    def array(self, indices, np):
+        '''The permutation of a NumPy array of indices'''
+        if len(indices) and (indices.min() < 0 or indices.max() >= self.size):
+            raise IndexError(f'All the {self.size} unique values were generated')
+        x = self._encrypt_array(indices.astype(np.uint64), np)
+        walking = x >= self.size
+        while walking.any():
+            x[walking] = self._encrypt_array(x[walking], np)
+            walking = x >= self.size
+        return x.astype(np.int64)
+
+    def _encrypt_array(self, x, np):
+        bits, mask = np.uint64(self.half_bits), np.uint64(self.half_mask)
+        left, right = x >> bits, x & mask
+        # uint64 multiplication wraps around like the masked python version
+        with np.errstate(over='ignore'):
+            for k in self.keys:
+                f = (right ^ np.uint64(k)) * np.uint64(_MULTIPLIER)
+                f ^= f >> np.uint64(29)
+                left, right = right, left ^ (f & mask)
+        return (left << bits) | right
+
+
+@functools.lru_cache(maxsize=128)
+def permutation(size: int, key: str) -> Permutation:
+    return Permutation(size, key)
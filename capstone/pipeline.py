@@ -0,0 +1,96 @@
+'''
+Streaming pipeline for the generated data: source -> serialize -> ... -> sink.
+
+Every stage runs in its own thread, and consecutive stages are connected
+with bounded queues. A stage blocks when the next one falls behind, so at most
+queue_size items wait between two stages and the memory used doesn't
+depend on how much data is generated. Stages that release the GIL
+(compression, writing to files) overlap with the generation of the next items.
+'''
+import queue
+import threading
+from typing import Callable, Iterable, Iterator, Sequence
+
+DEFAULT_QUEUE_SIZE = 2
+
+# how often blocked stages check whether the pipeline was stopped
+_POLL_INTERVAL = 0.1
+
+_DONE = object()
+
+
+class _Failed:
+    '''Passed down the pipeline when a stage raises an exception'''
+
+    def __init__(self, exc: BaseException):
+        self.exc = exc
+
+
+def _put(out: queue.Queue, item, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            out.put(item, timeout=_POLL_INTERVAL)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get_all(source: queue.Queue, stop: threading.Event) -> Iterator:
+    while not stop.is_set():
+        try:
+            item = source.get(timeout=_POLL_INTERVAL)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        if isinstance(item, _Failed):
+            raise item.exc
+        yield item
+
+
+def _run_stage(items: Iterator, fn: Callable, out: queue.Queue, stop: threading.Event) -> None:
+    try:
+        for item in items:
+            if not _put(out, item if fn is None else fn(item), stop):
+                return
+    except BaseException as e:
+        _put(out, _Failed(e), stop)
+        return
+    _put(out, _DONE, stop)
+
+
+def pipelined(source: Iterable, stages: Sequence[Callable] = (),
+              queue_size: int = DEFAULT_QUEUE_SIZE) -> Iterator:
+    '''Iterates over source in a background thread and passes every item
+    through the stages, each in its own thread. Yields the results in order.
+
+    Exceptions raised by the source or a stage are re-raised here.
+    Closing the iterator stops all the threads.
+    '''
+    stop = threading.Event()
+    threads = []
+    items = iter(source)
+
+    # the first thread only pulls items from the source
+    for fn in (None, *stages):
+        out = queue.Queue(queue_size)
+        thread = threading.Thread(target=_run_stage, args=(items, fn, out, stop), daemon=True)
+        thread.start()
+        threads.append(thread)
+        items = _get_all(out, stop)
+
+    try:
+        yield from items
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+
+def run_pipeline(source: Iterable, stages: Sequence[Callable], sink: Callable,
+                 queue_size: int = DEFAULT_QUEUE_SIZE) -> None:
+    '''Passes every item of source through the stages and into sink,
+    which is called in the current thread'''
+    for item in pipelined(source, stages, queue_size):
+        sink(item)
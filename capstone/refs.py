@@ -0,0 +1,192 @@
+'''
+Indexes of the values of a field in earlier outputs, for ref fields:
+
+    {"order_id": "int:rand", "user_id": "int:ref(users/*.jsonl.id)"}
+
+draws user_id from the id fields of the JSON lines (or CSV) files matching
+users/*.jsonl, relative to the current directory. Nested fields are
+written with dots (orders.jsonl.user.id), compressed files are read too.
+
+The values are extracted once into an index file in a .myfaker-refs
+directory next to the first file, named by a hash of the files (with their
+sizes and modification times), the field and the kind of values.
+The index is memory-mapped, so a value is read directly by its position
+and every worker process shares the same pages instead of loading the
+values. The index is rebuilt when the files change.
+
+Index format, in the byte order of the machine (indexes are a local cache):
+8 bytes of magic, the number of values n as an int64, then either n int64 or float64 values, or the UTF-8 text of n strings
+followed by n + 1 int64 offsets into the text.
+'''
+import array
+import bz2
+import csv
+import glob
+import gzip
+import hashlib
+import json
+import mmap
+import os
+import pathlib
+import struct
+from typing import Iterator
+
+MAGIC = b'MFREF001'
+HEADER = struct.Struct('=8sq')
+
+INDEX_DIRECTORY = '.myfaker-refs'
+
+# kinds of indexed values, by field type
+KINDS = {'int': 'int', 'float': 'float'}
+
+
+class RefError(Exception):
+    """Raised when the values of a ref field can't be read."""
+    pass
+
+
+def kind_of(field_type: str) -> str:
+    return KINDS.get(field_type, 'str')
+
+
+def _open_text(path: str):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt', encoding='utf-8')
+    if path.endswith('.bz2'):
+        return bz2.open(path, 'rt', encoding='utf-8')
+    return open(path, encoding='utf-8')
+
+
+def _convert(value, kind: str, path: str):
+    try:
+        if kind == 'int':
+            if type(value) is float or isinstance(value, bool):
+                raise ValueError
+            return int(value)
+        if kind == 'float':
+            return float(value)
+    except (TypeError, ValueError):
+        raise RefError(f'{path} has a value which is not {kind}: {value!r}')
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def read_values(path: str, field: str, kind: str) -> Iterator:
+    '''The values of the field in every line of a JSON lines or CSV file'''
+    keys = field.split('.')
+    with _open_text(path) as f:
+        if '.csv' in pathlib.Path(path).suffixes:
+            reader = csv.DictReader(f)
+            if field not in (reader.fieldnames or ()):
+                raise RefError(f'{path} has no column {field}')
+            for row in reader:
+                yield _convert(row[field], kind, path)
+            return
+
+        for line in f:
+            if not line.strip():
+                continue
+            value = json.loads(line)
+            try:
+                for key in keys:
+                    value = value[key]
+            except (KeyError, TypeError):
+                raise RefError(f'{path} has a line without the field {field}')
+            yield _convert(value, kind, path)
+
+
+def _write_index(index_path: pathlib.Path, paths: list[str], field: str, kind: str) -> None:
+    # written under a temporary name, workers may build the same index at once
+    index_path.parent.mkdir(exist_ok=True)
+    tmp = index_path.with_name(f'.{index_path.name}.{os.getpid()}')
+    try:
+        with open(tmp, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, 0))
+            # only the numbers (or the offsets of the strings) are kept in memory
+            numbers = array.array('d' if kind == 'float' else 'q')
+            if kind == 'str':
+                numbers.append(0)
+            for path in paths:
+                for value in read_values(path, field, kind):
+                    if kind == 'str':
+                        data = value.encode()
+                        f.write(data)
+                        numbers.append(numbers[-1] + len(data))
+                    else:
+                        numbers.append(value)
+
+            count = len(numbers) - (kind == 'str')
+            if count == 0:
+                raise RefError(f'No values of {field} in {", ".join(paths)}')
+            f.write(numbers.tobytes())
+            f.seek(0)
+            f.write(HEADER.pack(MAGIC, count))
+        os.replace(tmp, index_path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def index_path(pattern: str, field: str, kind: str) -> tuple[pathlib.Path, list[str]]:
+    '''The path of the index for the files matching the pattern, and the files'''
+    paths = sorted(glob.glob(pattern))
+    if not paths:
+        raise RefError(f'No files match {pattern}')
+
+    key = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        key.update(f'{os.path.abspath(path)}\0{stat.st_size}\0{stat.st_mtime_ns}\0'.encode())
+    key.update(f'{field}\0{kind}'.encode())
+    directory = pathlib.Path(paths[0]).parent / INDEX_DIRECTORY
+    return directory / f'{key.hexdigest()}.idx', paths
+
+
+class RefIndex:
+    '''Memory-mapped values of an index'''
+
+    def __init__(self, path: pathlib.Path, kind: str):
+        self.kind = kind
+        with open(path, 'rb') as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise RefError(f'{path} is not an index of values')
+
+        view = memoryview(self.map)
+        if kind == 'str':
+            self.offsets = view[len(view) - 8 * (self.count + 1):].cast('q')
+        else:
+            self.values = view[HEADER.size:].cast('q' if kind == 'int' else 'd')
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __getitem__(self, i: int):
+        if self.kind != 'str':
+            return self.values[i]
+        start = HEADER.size
+        return self.map[start + self.offsets[i]:start + self.offsets[i + 1]].decode()
+
+    def take(self, indices, np=None):
+        '''The values at the indices, as an array if np is the NumPy module'''
+        if np is None:
+            return [self[i] for i in indices]
+        if self.kind == 'str':
+            return np.array([self[i] for i in indices.tolist()], dtype=object)
+        dtype = np.int64 if self.kind == 'int' else np.float64
+        values = np.frombuffer(self.map, dtype=dtype, count=self.count, offset=HEADER.size)
+        return values[indices]
+
+
+_indexes = {}
+
+
+def open_index(pattern: str, field: str, field_type: str) -> RefIndex:
+    '''Opens the index of the field in the files matching the pattern,
+    building it first if the files changed. Indexes stay open in the process.'''
+    kind = kind_of(field_type)
+    path, paths = index_path(pattern, field, kind)
+    if path not in _indexes:
+        if not path.exists():
+            _write_index(path, paths, field, kind)
+        _indexes[path] = RefIndex(path, kind)
+    return _indexes[path]
@@ -0,0 +1,167 @@
+'''
+Serializers turning generated objects into JSON lines.
+
+- "json": json.dumps on every object
+- "schema": a function generated for the schema. The schema fixes the
+  order of the keys and the type of every value, so the keys and the
+  literal values are escaped once and only the random values are
+  formatted per object. The output is identical to json.dumps.
+- "orjson": orjson.dumps, if the orjson package is installed.
+  Its output is compact (no spaces after separators).
+'''
+import functools
+import json
+from json.encoder import encode_basestring_ascii
+from typing import Callable
+
+from interpreter import CompiledSchema, FakeObj
+
+Serializer = Callable[[FakeObj], str]
+
+SERIALIZERS = ('schema', 'json', 'orjson')
+
+
+class SerializerError(Exception):
+    """Raised when a serializer is not available."""
+    pass
+
+
+def _value_source(spec: tuple[str, any], var: str) -> tuple[str, bool]:
+    '''Returns a python expression formatting the value in `var` as JSON,
+    and whether the value is constant (in which case the expression
+    is the JSON text itself).'''
+    typ, modi = spec
+
+    if typ == 'timestamp':
+        return f'{{{var}!r}}', False
+
+    # weighted lists are formatted like the other lists
+    if isinstance(modi, tuple) and modi[0] == 'weighted':
+        modi = list(modi[1])
+
+    if typ == 'float' and modi is not None and not isinstance(modi, float):
+        return f'{{{var}!r}}', False
+    if typ == 'bool':
+        return f'{{_bool[{var}]}}', False
+    if typ in ('date', 'datetime', 'email', 'name', 'enum'):
+        return f'{{_str({var})}}', False
+
+    # literal values
+    if modi is None or isinstance(modi, (int, float, str)):
+        if modi is None and typ == 'str':
+            modi = ''
+        return json.dumps(modi), True
+
+    # ints, or strings of random or referenced values
+    if isinstance(modi, tuple) and modi[0] in ('rand', 'seq', 'unique', 'ref'):
+        if typ == 'str':
+            return f'{{_str({var})}}', False
+        return f'{{{var}}}', False
+
+    if isinstance(modi, list):
+        if all(isinstance(item, str) for item in modi):
+            return f'{{_str({var})}}', False
+        # float lists go through json
+        if all(type(item) is int for item in modi):
+            return f'{{{var}}}', False
+
+    return f'{{_dumps({var})}}', False
+
+
+def _escape(text: str) -> str:
+    return text.replace('{', '{{').replace('}', '}}')
+
+
+def _json_parts(spec: tuple[str, any], var: str, lines: list,
+                namespace: dict) -> tuple[list[str], bool]:
+    '''Returns the parts of an f-string formatting the value in `var` as JSON,
+    and whether the value is constant (in which case `var` isn't used).
+    Nested values are read into more variables by the statements added to lines,
+    array elements are formatted by functions added to namespace.'''
+    typ, modi = spec
+
+    if typ == 'object':
+        parts = []
+        constant = True
+        for i, (name, child) in enumerate(modi.items()):
+            child_var = f'v{i}' if var == 'row' else f'{var}_{i}'
+            separator = '{' if i == 0 else ', '
+            parts.append(_escape(separator + json.dumps(name) + ': '))
+            child_lines = []
+            child_parts, child_constant = _json_parts(child, child_var, child_lines, namespace)
+            if not child_constant:
+                lines.append(f'    {child_var} = {var}[{name!r}]\n')
+                constant = False
+            lines.extend(child_lines)
+            parts.extend(child_parts)
+        parts.append('}}')
+        return parts, constant
+
+    if typ == 'array':
+        item = _item_serializer(modi[2], namespace)
+        return [f'{{_array({item}, {var})}}'], False
+
+    source, constant = _value_source(spec, var)
+    return [_escape(source) if constant else source], constant
+
+
+def _item_serializer(spec: tuple[str, any], namespace: dict) -> str:
+    '''Adds a function formatting an array element to namespace, returns its name'''
+    lines = []
+    parts, _ = _json_parts(spec, 'item', lines, namespace)
+    name = f'_item{len(namespace)}'
+    src = (
+        f'def {name}(item):\n'
+        + ''.join(lines)
+        + f'    return f{"".join(parts)!r}\n'
+    )
+    exec(compile(src, '<serializer>', 'exec'), namespace)
+    return name
+
+
+def schema_serializer(compiled: CompiledSchema) -> Serializer:
+    '''Generates a serializer specialised for the schema, e.g. for
+    {"age": "int:rand(1, 90)", "n": "int:1"}:
+
+        def _serialize(row):
+            v0 = row['age']
+            return f'{"age": {v0}, "n": 1}'
+    '''
+    namespace = {'_str': encode_basestring_ascii, '_dumps': json.dumps,
+                 '_bool': ('false', 'true'),
+                 '_array': lambda item, items: '[' + ', '.join(map(item, items)) + ']'}
+    lines = []
+    parts, _ = _json_parts(('object', compiled.ast), 'row', lines, namespace)
+
+    src = (
+        'def _serialize(row):\n'
+        + ''.join(lines)
+        + f'    return f{"".join(parts)!r}\n'
+    )
+
+    exec(compile(src, '<serializer>', 'exec'), namespace)
+    return namespace['_serialize']
+
+
+def check_serializer(kind: str) -> None:
+    '''Raises SerializerError if the serializer can't be used'''
+    if kind not in SERIALIZERS:
+        raise SerializerError(f'Unknown serializer: {kind}')
+    if kind == 'orjson':
+        try:
+            import orjson
+        except ImportError:
+            raise SerializerError('The orjson package is not installed')
+
+
+@functools.lru_cache(maxsize=128)
+def make_serializer(compiled: CompiledSchema, kind: str = 'schema') -> Serializer:
+    check_serializer(kind)
+    if kind == 'schema':
+        return schema_serializer(compiled)
+    if kind == 'json':
+        return json.dumps
+
+    import orjson
+    dumps = orjson.dumps
+    return lambda obj: dumps(obj).decode()
@@ -0,0 +1,193 @@
+'''
+Server mode, which saves the interpreter start-up and the parsing of the
+schema for every call of myfaker:
+
+    python myfaker.py serve [--socket PATH] [-j JOBS]
+
+The server listens on a Unix socket for the arguments of myfaker sent by
+client.py (see there for the protocol), and streams the generated lines
+back. Compiled schemas stay in the cache of compile_schema between requests.
+
+Requests with -j above 1 and at least POOL_MIN_LINES lines are generated
+by a pool of worker processes started with the server, in blocks of
+SEED_BLOCK_LINES lines so that seeded output is the same as with myfaker.
+Smaller requests are generated in the thread handling the connection.
+
+Timestamps of seeded requests use the SOURCE_DATE_EPOCH of the server.
+Schemas with ref fields are generated by myfaker itself, since the
+paths of the referenced files are relative to its current directory.
+'''
+import argparse
+import collections
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import socket
+import socketserver
+import sys
+from typing import Iterator
+
+import myfaker
+from client import FRAME_HEADER, default_socket
+from interpreter import ParsingError, compile_schema, has_refs, parse
+from sinks import StreamSink
+from stats import Stats
+
+# requests with fewer lines are generated without the worker pool
+POOL_MIN_LINES = 100_000
+
+
+class _Frames:
+    '''Writable stream sending every write as a frame of the protocol'''
+
+    def __init__(self, sock: socket.socket):
+        self.sock = sock
+
+    def write(self, data: bytes) -> int:
+        if data:
+            self.sock.sendall(FRAME_HEADER.pack(len(data)))
+            self.sock.sendall(data)
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+
+def _generate_range(task: tuple) -> bytes:
+    '''Runs in a worker: the encoded lines first_line, ..., first_line + lines - 1'''
+    schema, fmt, serializer, seed, first_line, lines = task
+    generator = compile_schema(schema)
+    encode = myfaker.chunk_encoder(generator, fmt, serializer)
+    chunks = myfaker.chunk_source(generator, lines, fmt, seed, 0, first_line,
+                                  myfaker.chunk_rows_for(fmt))
+    return b''.join(encode(chunk)[0] for chunk in chunks)
+
+
+def pooled_chunks(pool, jobs: int, args) -> Iterator[tuple[bytes, int]]:
+    '''Yields the encoded lines of a request in order, as (data, number of lines),
+    generated by the pool with at most two blocks per worker in flight'''
+    block = myfaker.SEED_BLOCK_LINES
+    pending = collections.deque()
+    for first in range(0, args.data_lines, block):
+        lines = min(block, args.data_lines - first)
+        task = (args.schema, args.format, args.serializer, args.seed, first, lines)
+        pending.append((pool.apply_async(_generate_range, (task,)), lines))
+        while len(pending) > 2 * jobs:
+            result, lines = pending.popleft()
+            yield result.get(), lines
+    while pending:
+        result, lines = pending.popleft()
+        yield result.get(), lines
+
+
+class Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path: str, pool=None, jobs=1):
+        self.pool = pool
+        self.jobs = jobs
+        super().__init__(path, _Handler)
+
+    def reply(self, sock: socket.socket, **message) -> None:
+        sock.sendall(json.dumps(message).encode() + b'\n')
+
+    def handle_request(self, message: dict, sock: socket.socket) -> None:
+        try:
+            args = myfaker.parse_cli(message['argv'], message.get('cwd'))
+            if args.files_count != 0 or args.stats:
+                # files are written by myfaker itself
+                self.reply(sock, status='local')
+                return
+            if has_refs(parse(args.schema)):
+                # the paths of ref fields are relative to the directory of the client
+                self.reply(sock, status='local')
+                return
+            generator = compile_schema(args.schema)
+            myfaker.check_rows(generator, args)
+        except SystemExit:
+            # usage errors and --help, which argparse prints itself
+            self.reply(sock, status='local')
+            return
+        except ParsingError as e:
+            self.reply(sock, status='error', message='Syntax error: ' + str(e))
+            return
+        except myfaker.ArgumentError as e:
+            self.reply(sock, status='error', message='Argument error: ' + str(e))
+            return
+
+        self.reply(sock, status='ok')
+        frames = _Frames(sock)
+        stats = Stats()
+        jobs = min(self.jobs, args.multiprocessing)
+        try:
+            if self.pool and jobs > 1 and args.data_lines >= POOL_MIN_LINES and not args.rate:
+                with StreamSink(frames, args.buffer_size) as sink:
+                    if args.format == 'csv':
+                        sink.write(myfaker.csv_header(generator), 0)
+                    for data, lines in pooled_chunks(self.pool, jobs, args):
+                        sink.write(data, lines)
+                        stats.count(lines, len(data))
+            else:
+                myfaker.write_stream(frames, args.schema, args.data_lines, args.serializer,
+                                     args.seed, args.rate, args.buffer_size, args.format,
+                                     stats=stats)
+            end = {'status': 'done', 'lines': stats.rows}
+        except (BrokenPipeError, ConnectionResetError):
+            logging.info(f'Client closed the connection after {stats.rows} lines')
+            return
+        except Exception as e:
+            logging.exception('Request failed')
+            end = {'status': 'error', 'message': 'An unhandled exception occurred: ' + str(e)}
+
+        sock.sendall(FRAME_HEADER.pack(0))
+        self.reply(sock, **end)
+
+
+class _Handler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        line = self.rfile.readline()
+        if line:
+            self.server.handle_request(json.loads(line), self.connection)
+
+
+def serve(path: str = None, jobs: int = 1) -> None:
+    '''Serves requests on the Unix socket until interrupted'''
+    path = path or default_socket()
+    if os.path.exists(path):
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            if sock.connect_ex(path) == 0:
+                raise myfaker.ArgumentError(f'A server is already listening on {path}')
+        # left over by a server which didn't stop cleanly
+        os.unlink(path)
+
+    # the workers are started before any thread
+    pool = multiprocessing.Pool(jobs) if jobs > 1 else None
+    # stopping with SIGTERM cleans up like an interrupt
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    try:
+        with Server(path, pool, jobs) as server:
+            os.chmod(path, 0o600)
+            logging.info(f'Listening on {path} with {jobs} workers')
+            try:
+                server.serve_forever()
+            finally:
+                os.unlink(path)
+    finally:
+        if pool:
+            pool.terminate()
+
+
+def main(argv=None) -> None:
+    argparser = argparse.ArgumentParser(prog='myfaker serve',
+                                        description='Serve myfaker requests on a Unix socket')
+    argparser.add_argument('--socket', default=default_socket(),
+                           help='Path of the Unix socket')
+    argparser.add_argument('--jobs', '-j', type=int, default=os.cpu_count() or 1,
+                           help='Number of worker processes for large requests')
+    args = argparser.parse_args(argv)
+    if args.jobs < 1:
+        raise myfaker.ArgumentError('Jobs must be a natural number')
+    serve(args.socket, args.jobs)
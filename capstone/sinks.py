@@ -0,0 +1,243 @@
+'''
+Output sinks for the generated data.
+
+A sink is opened once per output file, collects the serialized rows
+in a buffer and writes the buffer out in large chunks, instead of
+doing an open/write/close cycle for every generated line.
+
+Compressed sinks compress every chunk as an independent block
+(gzip member, bz2 stream or zstd frame) on a thread pool.
+zlib, bz2 and zstd release the GIL while compressing, so the blocks
+are compressed in parallel. Concatenated blocks form a valid file.
+'''
+import collections
+import functools
+import os
+import pathlib
+from typing import Callable
+
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+COMPRESSIONS = ('none', 'gzip', 'bz2', 'zstd')
+
+EXTENSIONS = {'none': '', 'gzip': '.gz', 'bz2': '.bz2', 'zstd': '.zst'}
+
+
+class CompressionError(Exception):
+    """Raised when a compression method is not available."""
+    pass
+
+
+def _zstd_compress():
+    try:
+        from compression import zstd
+        return zstd.compress
+    except ImportError:
+        pass
+    try:
+        import zstandard
+    except ImportError:
+        raise CompressionError('zstd compression requires the zstandard package')
+    # compressor objects can't be shared between threads
+    return lambda data: zstandard.ZstdCompressor(level=3).compress(data)
+
+
+def compressor(name: str) -> Callable[[bytes], bytes]:
+    '''Returns a function compressing a block of data into an independent
+    gzip member, bz2 stream or zstd frame'''
+    if name == 'gzip':
+        import gzip
+        # a fixed mtime keeps seeded output reproducible
+        return functools.partial(gzip.compress, compresslevel=6, mtime=0)
+    if name == 'bz2':
+        import bz2
+        return bz2.compress
+    if name == 'zstd':
+        return _zstd_compress()
+    raise CompressionError(f'Unknown compression: {name}')
+
+
+class Sink:
+    '''Writes data to self.file through a buffer of buffer_size bytes.
+
+    If flush_every is set, the buffer is flushed and synced
+    after every flush_every rows, otherwise only when the sink is closed.
+    '''
+
+    def __init__(self, file, buffer_size: int = DEFAULT_BUFFER_SIZE, flush_every: int = 0):
+        self.file = file
+        self.buffer_size = buffer_size
+        self.flush_every = flush_every
+
+        self.buffer = []
+        self.buffered_bytes = 0
+        self.unsynced_rows = 0
+
+        # statistics
+        self.rows = 0
+        self.raw_bytes = 0
+        self.bytes_written = 0
+        self.write_calls = 0
+
+    def write_rows(self, lines: list[str]) -> None:
+        '''Writes serialized rows (without the trailing newlines)'''
+        if not lines:
+            return
+        self.write(('\n'.join(lines) + '\n').encode(), len(lines))
+
+    def write(self, data: bytes, rows: int) -> None:
+        '''Writes data containing the given number of rows'''
+        self.buffer.append(data)
+        self.buffered_bytes += len(data)
+        self.rows += rows
+        self.unsynced_rows += rows
+
+        if self.flush_every and self.unsynced_rows >= self.flush_every:
+            self.flush(sync=True)
+        elif self.buffered_bytes >= self.buffer_size:
+            self.flush()
+
+    def flush(self, sync: bool = False) -> None:
+        if self.buffer:
+            data = b''.join(self.buffer)
+            self.buffer.clear()
+            self.buffered_bytes = 0
+            self.raw_bytes += len(data)
+            self._write(data)
+        if sync:
+            self._sync()
+            self.unsynced_rows = 0
+
+    def _sync(self) -> None:
+        os.fsync(self.file.fileno())
+
+    def _write(self, data: bytes) -> None:
+        view = memoryview(data)
+        while view:
+            written = self.file.write(view)
+            self.write_calls += 1
+            self.bytes_written += written
+            view = view[written:]
+
+    def close(self) -> None:
+        try:
+            self.flush(sync=bool(self.flush_every))
+        finally:
+            self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FileSink(Sink):
+    '''Appends to a file, syncing it to disk every flush_every rows'''
+
+    def __init__(self, path: pathlib.Path, buffer_size: int = DEFAULT_BUFFER_SIZE,
+                 flush_every: int = 0):
+        self.path = path
+        super().__init__(open(path, 'ab', buffering=0), buffer_size, flush_every)
+
+
+class CompressedFileSink(FileSink):
+    '''Compresses every buffer_size chunk as an independent block on a thread pool.
+    At most two blocks per thread are compressed or waiting to be written.'''
+
+    def __init__(self, path: pathlib.Path, compress: Callable[[bytes], bytes],
+                 buffer_size: int = DEFAULT_BUFFER_SIZE, flush_every: int = 0,
+                 threads: int = None):
+        import concurrent.futures
+        super().__init__(path, buffer_size, flush_every)
+        self.compress = compress
+        self.threads = threads or os.cpu_count() or 1
+        self.executor = concurrent.futures.ThreadPoolExecutor(self.threads)
+        self.pending = collections.deque()
+
+    def _write(self, data: bytes) -> None:
+        self.pending.append(self.executor.submit(self.compress, data))
+        while len(self.pending) > 2 * self.threads:
+            super()._write(self.pending.popleft().result())
+
+    def _drain(self) -> None:
+        while self.pending:
+            super()._write(self.pending.popleft().result())
+
+    def _sync(self) -> None:
+        self._drain()
+        super()._sync()
+
+    def close(self) -> None:
+        try:
+            self.flush()
+            self._drain()
+            super().close()
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+            self.file.close()
+
+
+def open_sink(path: pathlib.Path, compression: str = 'none',
+              buffer_size: int = DEFAULT_BUFFER_SIZE, flush_every: int = 0) -> Sink:
+    if compression == 'none':
+        return FileSink(path, buffer_size, flush_every)
+    return CompressedFileSink(path, compressor(compression), buffer_size, flush_every)
+
+
+class StreamSink(Sink):
+    '''Writes to an already open binary stream such as sys.stdout.buffer.
+    The stream is flushed after every write of the buffer, but not closed.'''
+
+    def _write(self, data: bytes) -> None:
+        self.file.write(data)
+        self.file.flush()
+        self.write_calls += 1
+        self.bytes_written += len(data)
+
+    def _sync(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.flush()
+
+
+def _copy_file(src, dst, size: int) -> None:
+    '''Copies size bytes between two open files, inside the kernel when possible'''
+    src_fd, dst_fd = src.fileno(), dst.fileno()
+
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    sendfile = getattr(os, 'sendfile', None)
+    for copy in (copy_file_range, sendfile):
+        if copy is None:
+            continue
+        try:
+            while size > 0:
+                if copy is sendfile:
+                    copied = sendfile(dst_fd, src_fd, None, size)
+                else:
+                    copied = copy_file_range(src_fd, dst_fd, size)
+                if copied == 0:
+                    break
+                size -= copied
+            if size == 0:
+                return
+        except OSError:
+            # not supported for these files, the next method continues
+            # from the current offsets
+            pass
+
+    import shutil
+    shutil.copyfileobj(src, dst)
+
+
+def concatenate_parts(path: pathlib.Path, parts: list[pathlib.Path]) -> None:
+    '''Appends the part files to path in order and deletes them'''
+    # not opened in append mode, copy_file_range doesn't support it
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT, 0o666)
+    with open(fd, 'wb') as dst:
+        dst.seek(0, os.SEEK_END)
+        for part in parts:
+            with open(part, 'rb') as src:
+                _copy_file(src, dst, os.fstat(src.fileno()).st_size)
+            part.unlink()
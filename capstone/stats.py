@@ -0,0 +1,197 @@
+'''
+Throughput statistics of a generation run, reported with --stats.
+
+Every stage of the pipeline adds the time it spends working to
+Stats.times: parsing the schema, evaluating (generating) the rows,
+serializing them and writing them (including compression).
+The stages run in parallel threads, so their times can add up to more
+than the elapsed time. The busiest stage is the one limiting the run.
+
+The times are measured once per chunk of lines, so they are always
+collected; --stats only decides whether they are reported.
+'''
+import contextlib
+import json
+import sys
+import threading
+import time
+from typing import Callable, Iterable, Iterator
+
+STAGES = ('parse', 'evaluate', 'serialize', 'write')
+
+
+class Stats:
+    '''Time spent per stage, lines and bytes produced by a run or a task.
+
+    Every stage runs in a single thread and only updates its own entry,
+    rows and byte counts are only updated by the writing stage.
+    '''
+
+    def __init__(self, progress: 'Progress' = None):
+        self.times = dict.fromkeys(STAGES, 0.0)
+        self.rows = 0
+        self.raw_bytes = 0
+        self.bytes_written = 0
+        self.elapsed = 0.0
+        self.tasks = 0
+        self.progress = progress
+
+    def __getstate__(self):
+        # the shared progress counters stay in the process that created them
+        return {**self.__dict__, 'progress': None}
+
+    @contextlib.contextmanager
+    def measure(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.times[stage] += time.perf_counter() - start
+
+    def timed(self, stage: str, fn: Callable) -> Callable:
+        '''Wraps fn, adding the time of every call to the stage'''
+        def wrapper(*args):
+            start = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                self.times[stage] += time.perf_counter() - start
+        return wrapper
+
+    def time_producer(self, stage: str, items: Iterable) -> Iterator:
+        '''Yields the items, adding the time spent producing them to the stage'''
+        items = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(items)
+            except StopIteration:
+                return
+            finally:
+                self.times[stage] += time.perf_counter() - start
+            yield item
+
+    def time_consumer(self, stage: str, items: Iterable) -> Iterator:
+        '''Yields the items, adding the time the consumer spends on every item
+        (until it asks for the next one) to the stage'''
+        for item in items:
+            start = time.perf_counter()
+            yield item
+            self.times[stage] += time.perf_counter() - start
+
+    def count(self, rows: int, raw_bytes: int) -> None:
+        '''Counts lines handed to the output'''
+        self.rows += rows
+        self.raw_bytes += raw_bytes
+        if self.progress:
+            self.progress.add(rows, raw_bytes)
+
+    def add(self, other: 'Stats') -> None:
+        for stage, seconds in other.times.items():
+            self.times[stage] += seconds
+        self.rows += other.rows
+        self.raw_bytes += other.raw_bytes
+        self.bytes_written += other.bytes_written
+        self.elapsed += other.elapsed
+        self.tasks += other.tasks
+
+    def rates(self) -> dict:
+        elapsed = max(self.elapsed, 1e-9)
+        return {
+            'lines_per_second': round(self.rows / elapsed, 1),
+            'mb_per_second': round(self.raw_bytes / elapsed / 1e6, 3),
+        }
+
+
+def per_worker(results: Iterable[tuple[int, Stats]]) -> dict[int, Stats]:
+    '''Adds up the stats of the tasks run by every worker process'''
+    workers = {}
+    for pid, stats in results:
+        workers.setdefault(pid, Stats()).add(stats)
+    return dict(sorted(workers.items()))
+
+
+def report(total: Stats, workers: dict[int, Stats], options: dict = None) -> dict:
+    '''The JSON stats report: totals, busy time per stage and per-worker throughput'''
+    return {
+        'options': options or {},
+        'elapsed': round(total.elapsed, 6),
+        'lines': total.rows,
+        'bytes_generated': total.raw_bytes,
+        'bytes_written': total.bytes_written,
+        **total.rates(),
+        'stages': {stage: round(seconds, 6) for stage, seconds in total.times.items()},
+        'workers': [
+            {'pid': pid, 'tasks': stats.tasks, 'lines': stats.rows,
+             'elapsed': round(stats.elapsed, 6), **stats.rates()}
+            for pid, stats in workers.items()
+        ],
+    }
+
+
+def write_report(data: dict, path: str = None) -> None:
+    '''Writes the report to a file, or to stderr if path is None'''
+    text = json.dumps(data, indent=2)
+    if path is None:
+        print(text, file=sys.stderr)
+    else:
+        with open(path, 'w') as f:
+            f.write(text + '\n')
+
+
+# Progress
+
+class Progress:
+    '''Lines and bytes written so far, in shared memory so that
+    the worker processes can update them'''
+
+    def __init__(self):
+        import multiprocessing
+        self.counts = multiprocessing.Array('q', 2)
+
+    def add(self, rows: int, raw_bytes: int) -> None:
+        with self.counts.get_lock():
+            self.counts[0] += rows
+            self.counts[1] += raw_bytes
+
+    def get(self) -> tuple[int, int]:
+        with self.counts.get_lock():
+            return self.counts[0], self.counts[1]
+
+
+def progress_line(rows: int, raw_bytes: int, elapsed: float, total: int = None) -> str:
+    elapsed = max(elapsed, 1e-9)
+    done = f'{rows:,} lines' if total is None else f'{rows:,}/{total:,} lines ({rows / max(total, 1):.0%})'
+    return (f'{done}, {raw_bytes / 1e6:,.1f} MB in {elapsed:.1f} s '
+            f'({rows / elapsed:,.0f} lines/s, {raw_bytes / elapsed / 1e6:.1f} MB/s)')
+
+
+@contextlib.contextmanager
+def show_progress(progress: Progress, total: int = None, stream=None, interval: float = None):
+    '''Prints a progress line on stderr while the block runs.
+    On a terminal the line is redrawn in place, otherwise a line is
+    printed every few seconds.'''
+    stream = stream or sys.stderr
+    tty = stream.isatty()
+    interval = interval or (0.5 if tty else 5.0)
+    end = '\r' if tty else '\n'
+    start = time.perf_counter()
+    stop = threading.Event()
+
+    def show(end):
+        rows, raw_bytes = progress.get()
+        print(progress_line(rows, raw_bytes, time.perf_counter() - start, total),
+              end=end, file=stream, flush=True)
+
+    def run():
+        while not stop.wait(interval):
+            show(end)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stop.set()
+        thread.join()
+        show('\n')
@@ -0,0 +1,131 @@
+import asyncio
+import concurrent.futures
+import contextlib
+import time
+
+import pytest
+
+import asyncgen
+from asyncgen import agenerate
+from interpreter import compile_schema, iterate_rows
+
+SCHEMA = '{"name": "str:rand", "age": "int:rand(1, 90)", "type": "str:[\'a\', \'b\']", "n": "int:1"}'
+
+
+async def collect(batches):
+    return [batch async for batch in batches]
+
+
+@pytest.mark.parametrize("batch_size", [7, 5000])
+def test_batches(batch_size):
+    batches = asyncio.run(collect(agenerate(SCHEMA, 12_000, batch_size)))
+    assert sum(len(batch) for batch in batches) == 12_000
+    assert all(len(batch) == batch_size for batch in batches[:-1])
+    assert all(obj['n'] == 1 and 1 <= obj['age'] <= 90 for batch in batches for obj in batch)
+
+
+def test_columnar_batches():
+    batches = asyncio.run(collect(agenerate(SCHEMA, 10, 4, columnar=True)))
+    assert [len(batch['age']) for batch in batches] == [4, 4, 2]
+
+
+ROWS_SCHEMA = '{"id": "int:seq", "u": "int:unique(1, 100)"}'
+
+
+@pytest.mark.parametrize("columnar", [False, True])
+@pytest.mark.parametrize("processes", [False, True])
+def test_row_fields_continue_across_batches(monkeypatch, columnar, processes):
+    if processes:
+        # every batch goes to the executor
+        monkeypatch.setattr(asyncgen, 'OFFLOAD_VALUES', 0)
+        executor = concurrent.futures.ProcessPoolExecutor(2)
+    else:
+        executor = None
+    with executor or contextlib.nullcontext():
+        batches = asyncio.run(collect(agenerate(ROWS_SCHEMA, 50, 8, executor, columnar)))
+
+    if columnar:
+        rows = [row for batch in batches for row in iterate_rows(batch)]
+    else:
+        rows = [row for batch in batches for row in batch]
+    assert [row['id'] for row in rows] == list(range(1, 51))
+    assert len({row['u'] for row in rows}) == 50
+
+
+def test_endless_generation_stops_with_the_consumer():
+    async def take(count):
+        batches = agenerate(compile_schema(SCHEMA), batch_size=5000)
+        taken = []
+        async for batch in batches:
+            taken.append(batch)
+            if len(taken) == count:
+                break
+        await batches.aclose()
+        return taken
+
+    assert len(asyncio.run(take(3))) == 3
+
+
+def test_process_executor():
+    with concurrent.futures.ProcessPoolExecutor(2) as executor:
+        batches = asyncio.run(collect(agenerate(SCHEMA, 10_000, 5000, executor)))
+        assert sum(len(batch) for batch in batches) == 10_000
+
+        with pytest.raises(TypeError):
+            asyncio.run(collect(agenerate(compile_schema(SCHEMA), 10, executor=executor)))
+
+
+def test_invalid_batch_size():
+    with pytest.raises(ValueError):
+        asyncio.run(collect(agenerate(SCHEMA, 10, 0)))
+
+
+async def max_lag(consume, interval=0.001) -> float:
+    '''Runs consume() next to a coroutine ticking every interval,
+    and returns the longest delay of a tick'''
+    lag = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal lag
+        while not done:
+            start = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag = max(lag, time.perf_counter() - start - interval)
+
+    tick = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    await consume()
+    done = True
+    await tick
+    return lag
+
+
+def test_event_loop_stays_responsive():
+    compiled = compile_schema(SCHEMA)
+    rows = 100_000
+
+    async def blocking():
+        for _ in range(rows // 25_000):
+            [compiled() for _ in range(25_000)]
+            await asyncio.sleep(0)
+
+    async def batched():
+        async for _ in agenerate(compiled, rows, batch_size=25_000):
+            pass
+
+    blocking_lag = asyncio.run(max_lag(blocking))
+    batched_lag = asyncio.run(max_lag(batched))
+    # the loop runs at least every switch interval (5 ms) while a thread generates
+    assert batched_lag < 0.05
+    assert batched_lag < blocking_lag / 2
+
+
+def test_small_batches_stay_in_the_loop(monkeypatch):
+    def fail(*args):
+        raise AssertionError('executor used')
+
+    monkeypatch.setattr(asyncio.AbstractEventLoop, 'run_in_executor', fail)
+    monkeypatch.setattr(asyncgen, 'OFFLOAD_VALUES', 10 ** 9)
+    batches = asyncio.run(collect(agenerate(SCHEMA, 100, 10)))
+    assert len(batches) == 10
@@ -0,0 +1,83 @@
+import json
+
+import pytest
+
+import benchmark
+
+
+def test_compare():
+    baseline = {'a': 100.0, 'b': 100.0, 'c': 100.0, 'old': 1.0}
+    results = {'a': 95.0, 'b': 80.0, 'c': 150.0, 'new': 1.0}
+    rows = benchmark.compare(results, baseline, threshold=0.1)
+
+    assert [row[0] for row in rows] == ['a', 'b', 'c']
+    assert [row[4] for row in rows] == [False, True, False]
+    assert rows[1][3] == pytest.approx(-0.2)
+
+
+def test_file_output():
+    result = benchmark.bench_file_output(lines=2000, legacy_lines=100, chunk_rows=100)
+
+    assert result['legacy rows/s'] > 0 and result['sink rows/s'] > 0
+    if benchmark.write_syscalls() is None:
+        pytest.skip('write syscalls are only counted on Linux')
+    # a write per legacy line, the sink writes its buffer once
+    assert result['legacy write syscalls'] >= 2000
+    assert 1 <= result['sink write syscalls'] < 10
+
+
+def test_run_suite():
+    calls = []
+
+    def bench():
+        calls.append(1)
+        return len(calls)
+
+    assert benchmark.run_suite({'x': bench}, repeat=3) == {'x': 3}
+
+
+def test_results_file(tmp_path):
+    path = tmp_path / 'results.json'
+    benchmark.save_results(path, {'parse/mixed': 10.0})
+    data = json.loads(path.read_text())
+    assert data['machine']['cpu_count']
+    assert benchmark.load_results(path) == {'parse/mixed': 10.0}
+
+
+def test_suite_covers_shapes_and_modes():
+    names = benchmark.benchmarks(0.01)
+    for shape in benchmark.SHAPES:
+        for bench in ['parse', 'evaluate', 'generate_object']:
+            assert f'{bench}/{shape}' in names
+    assert 'cli/stdout jsonl' in names
+    for name in benchmark.large_schemas(0.01):
+        assert f'parse large/{name}' in names
+        assert f'parse vs json/{name}' in names
+    assert 'cli/jobs 1' in names
+    assert 'file output/legacy' in names and 'file output/sink' in names
+
+
+def test_large_schemas():
+    schemas = benchmark.large_schemas(0.01)
+    assert len(benchmark.parse(schemas['fields'])) == 1000
+    assert len(benchmark.parse(schemas['distinct fields'])) == 1000
+    assert len(benchmark.parse(schemas['lists'])['city'][1]) == 1000
+    _, values, weights, _ = benchmark.parse(schemas['weighted list'])['plan'][1]
+    assert len(values) == len(weights) == 500
+
+
+def test_main_compares_with_baseline(tmp_path, capsys):
+    path = tmp_path / 'baseline.json'
+    assert benchmark.main(['--quick', '--repeat', '1', '-k', 'parse/wide', '-o', str(path)]) == 0
+
+    # a baseline much faster than any run
+    benchmark.save_results(path, {'parse/wide': 1e12})
+    assert benchmark.main(['--quick', '--repeat', '1', '-k', 'parse/wide', '-c', str(path)]) == 1
+    assert 'REGRESSION' in capsys.readouterr().out
+
+
+@pytest.mark.parametrize(('seconds', 'status'), [(0.001, 0), (1.0, 1)])
+def test_main_checks_import_budget(monkeypatch, seconds, status):
+    # the budget itself is checked by the benchmark runs, wall-clock times are too noisy here
+    monkeypatch.setattr(benchmark, 'import_time', lambda module, repeat=5: seconds)
+    assert benchmark.main(['--quick', '--repeat', '1', '-k', 'startup/import']) == status
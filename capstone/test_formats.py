@@ -0,0 +1,132 @@
+import csv
+import io
+import json
+
+import pytest
+
+from interpreter import compile_schema, generate_batch, iterate_rows
+from formats import csv_header, csv_rows, check_format, write_arrow_file, FormatError
+
+SPEC = '''{"date": "timestamp:", "name": "str:rand", "type": "str:['a,b', 'c']",
+    "age": "int:rand(1, 90)", "e": "int:", "s": "str:"}'''
+
+
+def test_csv():
+    compiled = compile_schema(SPEC)
+    columns = generate_batch(compiled, 10)
+    data = (csv_header(compiled) + csv_rows(columns)).decode()
+
+    rows = list(csv.reader(io.StringIO(data)))
+    assert rows[0] == ['date', 'name', 'type', 'age', 'e', 's']
+    assert len(rows) == 11
+    for row in rows[1:]:
+        float(row[0])
+        assert row[2] in ('a,b', 'c')
+        assert 1 <= int(row[3]) <= 90
+        assert row[4] == row[5] == ''
+
+
+@pytest.mark.parametrize("fmt", ['parquet', 'arrow'])
+def test_arrow_files(tmp_path, fmt):
+    pa = pytest.importorskip('pyarrow')
+    compiled = compile_schema(SPEC)
+    batches = [generate_batch(compiled, 10), generate_batch(compiled, 5)]
+    path = tmp_path / f'out.{fmt}'
+
+    size = write_arrow_file(path, compiled, iter(batches), fmt)
+    assert size == path.stat().st_size
+
+    if fmt == 'parquet':
+        import pyarrow.parquet
+        table = pyarrow.parquet.read_table(path)
+        assert pyarrow.parquet.ParquetFile(path).num_row_groups == 2
+    else:
+        table = pa.ipc.open_file(path).read_all()
+
+    assert table.num_rows == 15
+    assert table.schema.field('date').type == pa.timestamp('us', tz='UTC')
+    assert table.schema.field('age').type == pa.int64()
+    assert table.schema.field('name').type == pa.string()
+    assert table.column('e').null_count == 15
+    assert table.column('age').to_pylist()[:10] == list(batches[0]['age'])
+
+
+def test_arrow_new_types(tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    compiled = compile_schema('''{"f": "float:rand", "b": "bool:", "d": "date:",
+        "e": "email:", "t": "enum:['a':1, 'b':2]", "x": "float:"}''')
+    columns = generate_batch(compiled, 10)
+    path = tmp_path / 'out.arrow'
+    write_arrow_file(path, compiled, iter([columns]), 'arrow')
+
+    table = pa.ipc.open_file(path).read_all()
+    assert [field.type for field in table.schema] == [
+        pa.float64(), pa.bool_(), pa.date32(), pa.string(), pa.string(), pa.float64()]
+    assert table.column('d').cast(pa.string()).to_pylist() == list(columns['d'])
+    assert table.column('x').null_count == 10
+
+
+def test_arrow_times(tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    compiled = compile_schema('{"t": "timestamp:seq(2024-01-01, 60)", "d": "datetime:seq(0, 60)"}')
+    path = tmp_path / 'out.arrow'
+    write_arrow_file(path, compiled, iter([generate_batch(compiled, 3)]), 'arrow')
+
+    table = pa.ipc.open_file(path).read_all()
+    assert [field.type for field in table.schema] == [pa.timestamp('us', tz='UTC'), pa.string()]
+    assert table.column('t').cast(pa.int64()).to_pylist() == [
+        1704067200_000000, 1704067260_000000, 1704067320_000000]
+    assert table.column('d').to_pylist()[1] == '1970-01-01T00:01:00.000000Z'
+
+
+NESTED_SPEC = '''{"id": "int:rand", "user": {"name": "name:", "tags": "array(0..2) of str:rand"},
+    "items": "array(1..3) of {\\"sku\\": \\"int:rand\\", \\"at\\": \\"timestamp:\\"}"}'''
+
+
+def test_csv_nested():
+    compiled = compile_schema(NESTED_SPEC)
+    columns = generate_batch(compiled, 10)
+    data = (csv_header(compiled) + csv_rows(columns)).decode()
+
+    rows = list(csv.reader(io.StringIO(data)))
+    assert rows[0] == ['id', 'user', 'items']
+    assert len(rows) == 11
+    for row in rows[1:]:
+        assert list(json.loads(row[1])) == ['name', 'tags']
+        assert 1 <= len(json.loads(row[2])) <= 3
+
+
+@pytest.mark.parametrize("fmt", ['parquet', 'arrow'])
+def test_arrow_nested(tmp_path, fmt):
+    pa = pytest.importorskip('pyarrow')
+    compiled = compile_schema(NESTED_SPEC)
+    columns = generate_batch(compiled, 20)
+    path = tmp_path / f'out.{fmt}'
+    write_arrow_file(path, compiled, iter([columns]), fmt)
+
+    if fmt == 'parquet':
+        import pyarrow.parquet
+        table = pyarrow.parquet.read_table(path)
+    else:
+        table = pa.ipc.open_file(path).read_all()
+
+    assert table.schema.field('user').type == pa.struct(
+        [pa.field('name', pa.string()), pa.field('tags', pa.list_(pa.string()))])
+    assert table.schema.field('items').type == pa.list_(pa.struct(
+        [pa.field('sku', pa.int64()), pa.field('at', pa.timestamp('us', tz='UTC'))]))
+
+    rows = list(iterate_rows(columns))
+    assert table.column('user').to_pylist() == [row['user'] for row in rows]
+    assert [[item['sku'] for item in items] for items in table.column('items').to_pylist()] == \
+        [[item['sku'] for item in row['items']] for row in rows]
+
+
+def test_check_format():
+    with pytest.raises(FormatError):
+        check_format('xml')
+    check_format('csv', 'bz2')
+
+    pytest.importorskip('pyarrow')
+    check_format('parquet', 'zstd')
+    with pytest.raises(FormatError):
+        check_format('arrow', 'bz2')
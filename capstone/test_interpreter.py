@@ -1,4 +1,10 @@
-from interpreter import parse, ParsingError, evaluate
+from interpreter import parse, ParsingError, evaluate, compile_schema
+from interpreter import generate_batch, batch_rng, alias_table
+import interpreter
+
+import datetime
+import json
+import random
 
 import pytest
 
@@ -40,8 +46,24 @@ import pytest
 
         # list of ints
         (
-            '''{"name": "str:[1, 2]"}''',
-            {'name': ('str', [1, 2])}
+            '''{"name": "int:[1, 2]"}''',
+            {'name': ('int', [1, 2])}
+        ),
+
+        # nested object
+        (
+            '{"user": {"id": "int:rand", "address": {"city": "str:Paris"}}}',
+            {'user': ('object', {'id': ('int', ('rand',)),
+                                 'address': ('object', {'city': ('str', 'Paris')})})}
+        ),
+
+        # arrays, of a fixed length, of arrays and of objects
+        (
+            '''{"a": "array(0..3) of int:rand", "b": "array(2) of array(1..2) of str:x",
+              "c": "array(1..5) of {\\"sku\\": \\"int:1\\"}"}''',
+            {'a': ('array', (0, 3, ('int', ('rand',)))),
+             'b': ('array', (2, 2, ('array', (1, 2, ('str', 'x'))))),
+             'c': ('array', (1, 5, ('object', {'sku': ('int', 1)})))}
         ),
 
         # string value other than rand
@@ -59,11 +81,77 @@ import pytest
 
         # int value
         (
-            '{"name": "str:1"}',
-            {'name': ('str', 1)}
+            '{"name": "int:1"}',
+            {'name': ('int', 1)}
         ),
 
 
+        # negative and float numbers
+        (
+            '{"a": "int:-3", "b": "float:1", "c": "float:-0.5"}',
+            {'a': ('int', -3), 'b': ('float', 1.0), 'c': ('float', -0.5)}
+        ),
+
+        # float range
+        (
+            '{"name": "float:rand(1, 2.5)"}',
+            {'name': ('float', ('rand', 1.0, 2.5))}
+        ),
+
+        # date range, and the default range
+        (
+            '{"a": "date:rand(2020-01-01, 2020-12-31)", "b": "date:"}',
+            {'a': ('date', ('rand', '2020-01-01', '2020-12-31')),
+             'b': ('date', ('rand', '1970-01-01', '2037-12-31'))}
+        ),
+
+        # types which are always random
+        (
+            '{"a": "bool:", "b": "email:rand", "c": "name:"}',
+            {'a': ('bool', ('rand',)), 'b': ('email', ('rand',)), 'c': ('name', ('rand',))}
+        ),
+
+        # enum with and without weights
+        (
+            '''{"a": "enum:['x', 'y']", "b": "enum:['gold':1, 'silver': 2.5]"}''',
+            {'a': ('enum', ['x', 'y']),
+             'b': ('enum', ('weighted', ('gold', 'silver'), (1, 2.5), alias_table((1, 2.5))))}
+        ),
+
+        # weighted lists of strings and ints
+        (
+            '''{"a": "str:['client':5, 'partner' : 1]", "b": "int:[1:2, -3:1]"}''',
+            {'a': ('str', ('weighted', ('client', 'partner'), (5, 1), alias_table((5, 1)))),
+             'b': ('int', ('weighted', (1, -3), (2, 1), alias_table((2, 1))))}
+        ),
+
+        # time ranges and sequences, as seconds since the epoch
+        (
+            '{"a": "timestamp:rand(2024-01-01, 2024-01-02T00:00+01:00)", '
+            '"b": "datetime:seq(1000, 0.5)", "c": "datetime:"}',
+            {'a': ('timestamp', ('rand', 1704067200.0, 1704150000.0)),
+             'b': ('datetime', ('seq', 1000.0, 0.5)), 'c': ('datetime', None)}
+        ),
+
+        # fields depending on the row, and references
+        (
+            '{"a": "int:seq", "b": "int:seq(10, -5)", "c": "int:unique(1, 100)", '
+            '"d": "str:ref(users/*.jsonl.name)", "e": {"f": "int:ref(o.csv.gz.user.id)"}}',
+            {'a': ('int', ('seq',)), 'b': ('int', ('seq', 10, -5)),
+             'c': ('int', ('unique', 1, 100)), 'd': ('str', ('ref', 'users/*.jsonl', 'name')),
+             'e': ('object', {'f': ('int', ('ref', 'o.csv.gz', 'user.id'))})}
+        ),
+
+        # trailing whitespace
+        (
+            '''{"a": "int:rand(1, 10) ", "b": "str:['x', 'y']\\n", "c": "int:5 ",
+                "d": "array(2) of int:rand\\t", "e": "enum:['x': 1, 'y': 2] "}''',
+            {'a': ('int', ('rand', 1, 10)), 'b': ('str', ['x', 'y']), 'c': ('int', 5),
+             'd': ('array', (2, 2, ('int', ('rand',)))),
+             'e': ('enum', ('weighted', ('x', 'y'), (1, 2),
+                            interpreter.alias_table((1, 2))))}
+        ),
+
         (
             '''
          {"date":"timestamp:",
@@ -106,12 +194,186 @@ def test_parse(inp, expected_AST):
 
         # integer value
         '{"name": "str:1e"}',
+
+        # no modifier separator
+        '{"name": "int"}',
+
+        # literals and rand of the other type, detected before any row is generated
+        '{"name": "str:1"}',
+        '{"name": "str:1.5"}',
+        '{"name": "str:rand(1, 2)"}',
+        '{"name": "int:abc"}',
+        '{"name": "int:1.5"}',
+        '{"name": "int:rand(5, 1)"}',
+        '{"name": "int:rand(2020-01-01, 2020-01-02)"}',
+        '{"name": "int:unique"}',
+        # ints are 64-bit
+        '{"name": "int:100000000000000000000000"}',
+        '{"name": "int:rand(0, 100000000000000000000000)"}',
+        '{"name": "int:[1, 100000000000000000000000]"}',
+        '{"name": "int:[1: 2, -100000000000000000000000: 1]"}',
+        '{"name": "int:seq(100000000000000000000000, 1)"}',
+        '{"name": "int:unique(0, 100000000000000000000000)"}',
+        # the width of float ranges must be a float
+        '{"name": "float:rand(-1e308, 1e308)"}',
+        '{"name": "timestamp:rand(-1e308, 1e308)"}',
+        # datetime values are between the years 1 and 9999
+        '{"name": "datetime:rand(0, 1e12)"}',
+        '{"name": "datetime:rand(-1e12, 0)"}',
+        '{"name": "datetime:seq(1e12, 1)"}',
+
+        # nested objects must have fields
+        '{"user": {}}',
+
+        # malformed arrays
+        '{"a": "array(1..3) int:rand"}',
+        '{"a": "array(3..1) of int:rand"}',
+        '{"a": "array(-1..1) of int:rand"}',
+        '{"a": "array(1..2) of {}"}',
+        '{"a": "array(1..2) of {\\"b\\": 1}"}',
+        '{"a": "array(1..2) of float:x"}',
+
+        # rand arguments of the new types
+        '{"name": "float:rand(a, b)"}',
+        '{"name": "float:rand(2, 1)"}',
+        '{"name": "date:rand(1, 2)"}',
+        '{"name": "date:rand(2020-02-30, 2020-03-01)"}',
+        '{"name": "int:rand(1.5, 2)"}',
+
+        # types which only support rand
+        '{"name": "bool:yes"}',
+        '{"name": "email:[1]"}',
+
+        # enum requires a list of strings
+        '{"name": "enum:"}',
+        '{"name": "enum:[1, 2]"}',
+
+        # weights must be positive, and only enums have weights
+        '''{"name": "enum:['a':0]"}''',
+        '''{"name": "enum:['a':-1]"}''',
+        '''{"name": "enum:['a':x]"}''',
+
+        # list items must have the type of the field
+        '''{"name": "str:[1, 2]"}''',
+        '''{"name": "int:['test', 1]"}''',
+        '''{"name": "str:['test', 1]"}''',
+        '''{"name": "int:['a':1]"}''',
+        '''{"name": "float:['a']"}''',
+        '''{"name": "bool:[true]"}''',
+        '''{"name": "int:[true]"}''',
+        '''{"name": "int:[true: 1, 2: 1]"}''',
+
+        # time ranges and sequences
+        '{"name": "timestamp:rand(2024-01-02, 2024-01-01)"}',
+        '{"name": "timestamp:seq"}',
+        '{"name": "datetime:seq(2024-01-01, 0)"}',
+        '{"name": "datetime:seq(0, 2024-01-01)"}',
+        '{"name": "array(2) of timestamp:seq(0, 1)"}',
+        '{"name": "date:rand(2024-01-01T10:00, 2024-01-02)"}',
+
+        # seq and unique are for ints outside of arrays
+        '{"name": "str:unique(1, 2)"}',
+        '{"name": "int:unique(5, 1)"}',
+        '{"name": "int:unique(1.5, 3)"}',
+        '{"name": "int:seq(1, 0)"}',
+        '{"name": "array(2) of int:seq"}',
+        '{"name": "bool:ref(a.jsonl.b)"}',
+
+        # text around the modifier
+        '{"name": "int:xrand(1, 2)"}',
+        '{"name": "int:rand(1, 2)x"}',
+        '{"name": "int:ref(a.jsonl.b) x"}',
+
+        # malformed lists
+        '''{"name": "str:['a', 'b'"}''',
+        '''{"name": "str:['a',]"}''',
+        '''{"name": "int:[1 2]"}''',
+        '''{"name": "int:[[1]]"}''',
+        '''{"name": "enum:['a':1, 'b']"}''',
+        '''{"name": "float:[1e400]"}''',
+        '''{"name": "float:[NaN]"}''',
     ])
 def test_raises(inp):
     with pytest.raises(ParsingError):
         parse(inp)
 
 
+@pytest.mark.parametrize(
+    ('inp', 'field', 'column'),
+    [
+        ('{"age": "int:rand(1 10)"}', 'age', 12),
+        ('{"age": "int:rand(1, 10)x"}', 'age', 16),
+        ('{"age": "int:rand(a, 10)"}', 'age', 10),
+        ('{"age": "in:5"}', 'age', 1),
+        ('{"name": "str:a-b"}', 'name', 6),
+        ('''{"tags": "str:['a', 'b'"}''', 'tags', 14),
+        ('''{"plan": "enum:['a':1, 'b']"}''', 'plan', 14),
+        ('''{"plan": "enum:['a':1, 'b':0]"}''', 'plan', 18),
+        ('{"items": "array(3..1) of int:rand"}', 'items', 7),
+        # errors of the type checks point at the modifier
+        ('{"user": {"age": "int:rand(5, 1)"}}', 'user.age', 5),
+        ('{"items": "array(2) of {\\"qty\\": \\"int:x1\\"}"}', 'items.qty', 5),
+    ])
+def test_error_positions(inp, field, column):
+    with pytest.raises(ParsingError) as error:
+        parse(inp)
+    assert error.value.field == field
+    assert error.value.position + 1 == column
+
+
+def test_error_messages():
+    with pytest.raises(ParsingError) as error:
+        parse('{"user": {"age": "int:rand(1 10)"}}')
+    assert str(error.value) == 'Field "user.age": Expected "," at column 12 (near "10)")'
+
+    with pytest.raises(ParsingError) as error:
+        parse('{"age": "int:rand(1, 10"}')
+    assert str(error.value).endswith('Expected ")" at column 15 (at the end)')
+
+    with pytest.raises(ParsingError) as error:
+        parse('{"a": "int:",\n "b" "int:"}')
+    assert str(error.value).startswith('Wrong syntax of the key-value mapping')
+    assert 'at line 2, column 6' in str(error.value)
+
+
+@pytest.mark.parametrize(
+    ('modifier', 'expected'),
+    [
+        # lists decoded by the json module and item by item
+        ('''['a', 'b']''', ['a', 'b']),
+        ('''["a", 'b']''', ['a', 'b']),
+        ('''['it\\'s', 'say "hi"', "\\u00e9"]''', ["it's", 'say "hi"', 'é']),
+        ('''['a:b', 'x[y]']''', ['a:b', 'x[y]']),
+        ('''['a':1, "b" : 2.5]''', ('weighted', ('a', 'b'), (1, 2.5))),
+        ('''['it\\'s':1]''', ('weighted', ("it's",), (1,))),
+        ('[1, -2, 1_000]', [1, -2, 1000]),
+        ('[1:1, 2:1_000]', ('weighted', (1, 2), (1, 1000))),
+        ('rand( 1 ,2 )', ('rand', 1, 2)),
+    ])
+def test_parse_field_modifier(modifier, expected):
+    assert interpreter.parse_field_modifier(modifier) == expected
+
+
+@pytest.mark.parametrize('spec', [
+    'int:', 'str:rand', 'int:seq', 'int:rand( 1 ,2 )', 'int:seq(10, -2)', 'int:unique(1, 9)',
+    'int:-5', 'float:2.5', 'float:rand(0, 5)', 'str:cat1', 'str:1abc', 'str:\u00e9t\u00e9',
+    'timestamp:rand(0, 10)', 'date:rand(2020-01-01, 2020-12-31)', "str:['a', 'b']",
+    'email:', 'bool:rand ',
+])
+def test_simple_specs_match_the_parser(spec):
+    # the simple specs are matched by a single regular expression
+    parser = interpreter._SpecParser(spec)
+    try:
+        expected = parser.field_spec()
+        parser.end()
+    except ParsingError as e:
+        with pytest.raises(ParsingError) as error:
+            interpreter.parse_field_spec(spec)
+        assert str(error.value) == str(e)
+    else:
+        assert interpreter.parse_field_spec(spec) == expected
+
+
 def test_fields_count():
     ast = {'num': ('int', ('rand',)),
            'f': ('str', 'test')}
@@ -170,16 +432,385 @@ def test_timestamp():
     assert isinstance(res['f'], float)
 
 
+def test_compile_schema():
+    compiled = compile_schema('{"num": "int:rand(1, 1)", "f": "str:a1"}')
+    assert compiled() == {'num': 1, 'f': 'a1'}
+    assert compiled() is not compiled()
+
+
+def test_compile_schema_is_cached():
+    spec = '{"num": "int:rand"}'
+    assert compile_schema(spec) is compile_schema(spec)
+
+
+def test_compile_schema_raises():
+    with pytest.raises(ParsingError):
+        compile_schema('{}')
+
+
+def test_compiled_matches_evaluate():
+    spec = '''{"age": "int:rand(1, 90)", "num": "int:rand",
+        "type": "str:['client', 'partner']", "s": "str:cat1",
+        "n": "int:1", "e": "str:", "i": "int:"}'''
+    ast = parse(spec)
+    compiled = compile_schema(spec)
+
+    random.seed(1)
+    expected = [evaluate(ast) for _ in range(10)]
+    random.seed(1)
+    assert [compiled() for _ in range(10)] == expected
+
+
+NEW_TYPES_SPEC = '''{"f": "float:rand(-1, 1)", "u": "float:rand", "fl": "float:[0.5, 2]",
+    "fc": "float:2", "fe": "float:", "b": "bool:", "d": "date:rand(2020-02-27, 2020-03-01)",
+    "wide": "date:rand(0001-01-01, 9999-12-31)", "e": "email:", "n": "name:",
+    "plan": "enum:['free', 'pro']", "tier": "enum:['gold':1, 'silver':3]",
+    "w": "enum:['a':0.1, 'b':0.9]"}'''
+
+
+def check_new_types(row):
+    assert -1 <= row['f'] <= 1
+    assert 0 <= row['u'] < 1
+    assert row['fl'] in (0.5, 2.0)
+    assert row['fc'] == 2.0 and type(row['fc']) is float
+    assert row['fe'] is None
+    assert type(row['b']) is bool
+    assert row['d'] in ('2020-02-27', '2020-02-28', '2020-02-29', '2020-03-01')
+    assert len(row['wide']) == 10
+    assert row['e'].count('@') == 1
+    assert len(row['n'].split()) == 2
+    assert row['plan'] in ('free', 'pro')
+    assert row['tier'] in ('gold', 'silver')
+    assert row['w'] in ('a', 'b')
+
+
+def test_new_types():
+    ast = parse(NEW_TYPES_SPEC)
+    for _ in range(100):
+        check_new_types(evaluate(ast))
+
+
+def test_new_types_compiled_matches_evaluate():
+    ast = parse(NEW_TYPES_SPEC)
+    compiled = compile_schema(NEW_TYPES_SPEC)
+
+    random.seed(1)
+    expected = [evaluate(ast) for _ in range(100)]
+    random.seed(1)
+    assert [compiled() for _ in range(100)] == expected
+    for row in expected:
+        check_new_types(row)
+
+
+def test_weighted_enum():
+    compiled = compile_schema('''{"t": "enum:['gold':1, 'silver':3]",
+        "w": "enum:['a':0.25, 'b':0.75]"}''')
+    random.seed(1)
+    rows = [compiled() for _ in range(4000)]
+    for field, rare in (('t', 'gold'), ('w', 'a')):
+        share = sum(row[field] == rare for row in rows) / len(rows)
+        assert 0.2 < share < 0.3
+
+
 @pytest.mark.parametrize(
-    "ast",
+    "weights",
     [
-        # all items of a list must have the appropriate type
-        {'f': ('int', ['test', 1])},
-        {'f': ('str', ['test', 1])},
-
-        # can't do rand range for string type
-        {'f': ('str', ('rand', 1, 2))},
+        (1,),
+        (5, 1),
+        (1, 2, 3, 4),
+        (0.1, 0.7, 0.2),
+        (1e-9, 1, 1e9),
+        tuple(range(1, 1001)),
     ])
-def test_evaluate_raises(ast):
-    with pytest.raises(ParsingError):
-        evaluate(ast)
+def test_alias_table(weights):
+    prob, alias = alias_table(weights)
+    n = len(weights)
+    # the probability of every value, from its own column and the columns aliasing it
+    shares = [p / n for p in prob]
+    for i, a in enumerate(alias):
+        shares[a] += (1 - prob[i]) / n
+    total = sum(weights)
+    assert shares == pytest.approx([w / total for w in weights], abs=1e-12)
+
+
+def test_weighted_list():
+    values = [f'v{i}' for i in range(20_000)]
+    items = ', '.join(f"'{v}':{1000 if i == 7 else 1}" for i, v in enumerate(values))
+    spec = json.dumps({'f': f'str:[{items}]', 'n': "int:[1:1, 2:3]",
+                       'x': "float:[0.5:1, 1.5:1]"})
+    ast = parse(spec)
+    compiled = compile_schema(spec)
+
+    random.seed(1)
+    expected = [evaluate(ast) for _ in range(4000)]
+    random.seed(1)
+    assert [compiled() for _ in range(4000)] == expected
+
+    assert all(row['f'] in values for row in expected)
+    # v7 has 1000 out of 20999 of the weight
+    share = sum(row['f'] == 'v7' for row in expected) / len(expected)
+    assert 0.03 < share < 0.07
+    share = sum(row['n'] == 2 for row in expected) / len(expected)
+    assert 0.7 < share < 0.8
+    assert {row['x'] for row in expected} == {0.5, 1.5}
+
+
+NESTED_SPEC = json.dumps({
+    'id': 'int:rand',
+    'user': {'name': 'name:', 'tags': "array(0..3) of enum:['a', 'b']",
+             'address': {'city': "str:['Paris', 'Oslo']", 'zip': 'int:rand(1000, 9999)'}},
+    'items': 'array(1..4) of {"sku": "int:rand(1, 9)", "price": "float:rand(1, 2)", '
+             '"codes": "array(2) of int:rand"}',
+    'matrix': 'array(2) of array(0..2) of bool:',
+    'at': 'array(1) of timestamp:',
+})
+
+
+def check_nested(row):
+    assert list(row) == ['id', 'user', 'items', 'matrix', 'at']
+    assert len(row['user']['tags']) <= 3
+    assert set(row['user']['tags']) <= {'a', 'b'}
+    assert row['user']['address']['city'] in ('Paris', 'Oslo')
+    assert 1000 <= row['user']['address']['zip'] <= 9999
+    assert 1 <= len(row['items']) <= 4
+    for item in row['items']:
+        assert 1 <= item['sku'] <= 9
+        assert 1 <= item['price'] <= 2
+        assert len(item['codes']) == 2
+    assert len(row['matrix']) == 2
+    assert all(type(b) is bool for inner in row['matrix'] for b in inner)
+    assert type(row['at'][0]) is float
+
+
+def test_nested():
+    ast = parse(NESTED_SPEC)
+    compiled = compile_schema(NESTED_SPEC)
+
+    random.seed(1)
+    expected = [evaluate(ast) for _ in range(100)]
+    random.seed(1)
+    rows = [compiled() for _ in range(100)]
+    for row in rows:
+        check_nested(row)
+    for row in rows + expected:
+        row.pop('at')
+    assert rows == expected
+    # the lengths of the arrays vary
+    assert len({len(row['items']) for row in rows}) == 4
+
+
+BATCH_SPEC = '''{"date": "timestamp:", "name": "str:rand",
+    "type": "str:['client', 'partner']", "age": "int:rand(1, 90)",
+    "num": "int:rand", "ids": "int:[3, 4]", "w": "int:[5:1, 6:3]",
+    "s": "str:cat1", "n": "int:1", "e": "str:", "i": "int:"}'''
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def batch_backend(request, monkeypatch):
+    monkeypatch.setattr(interpreter, '_default_rng', None)
+    if request.param == 'python':
+        monkeypatch.setattr(interpreter, '_numpy', lambda: None)
+    elif interpreter._numpy() is None:
+        pytest.skip('NumPy is not installed')
+    return request.param
+
+
+def test_generate_batch_columns(batch_backend):
+    columns = generate_batch(BATCH_SPEC, 1000)
+    assert list(columns) == list(parse(BATCH_SPEC))
+    assert all(len(col) == 1000 for col in columns.values())
+    assert all(1 <= v <= 90 for v in columns['age'])
+    assert all(0 <= v <= 10000 for v in columns['num'])
+    assert set(columns['type']) == {'client', 'partner'}
+    assert set(columns['ids']) == {3, 4}
+    assert set(columns['w']) == {5, 6}
+    assert 650 < sum(v == 6 for v in columns['w']) < 850
+    assert set(columns['s']) == {'cat1'}
+    assert set(columns['e']) == {''}
+    assert set(columns['i']) == {None}
+
+
+def test_generate_batch_rows(batch_backend):
+    rows = list(generate_batch(BATCH_SPEC, 10, columnar=False))
+    assert len(rows) == 10
+    for row in rows:
+        assert list(row) == list(parse(BATCH_SPEC))
+        assert type(row['age']) is int
+        assert type(row['date']) is float
+        assert type(row['name']) is str
+        assert row['n'] == 1
+        # rows contain plain python values
+        json.dumps(row)
+
+
+def test_bind_is_reproducible():
+    compiled = compile_schema(BATCH_SPEC)
+    first = compiled.bind(random.Random(1), clock=lambda: 0.0)
+    second = compiled.bind(random.Random(1), clock=lambda: 0.0)
+    assert [first() for _ in range(10)] == [second() for _ in range(10)]
+
+
+def test_generate_batch_new_types(batch_backend):
+    rows = list(generate_batch(NEW_TYPES_SPEC, 1000, columnar=False))
+    for row in rows:
+        check_new_types(row)
+        json.dumps(row)
+    # every value of the small date range shows up
+    assert len({row['d'] for row in rows}) == 4
+
+    share = sum(row['tier'] == 'gold' for row in rows) / len(rows)
+    assert 0.15 < share < 0.35
+
+
+def test_generate_batch_nested(batch_backend):
+    columns = generate_batch(NESTED_SPEC, 100)
+    assert interpreter.column_length(columns['items']) == 100
+    rows = list(interpreter.iterate_rows(columns))
+    assert len(rows) == 100
+    for row in rows:
+        check_nested(row)
+        json.dumps(row)
+
+
+def test_generate_batch_seed(batch_backend):
+    def batch(seed):
+        return list(generate_batch(BATCH_SPEC, 10, columnar=False, rng=batch_rng(seed)))
+
+    first, second = batch(1), batch(1)
+    for row in first + second:
+        row.pop('date')
+    assert first == second
+
+
+def test_generate_batch_int64_bounds(batch_backend):
+    spec = '''{"min": "int:-9223372036854775808", "max": "int:9223372036854775807",
+        "rand": "int:rand(-9223372036854775808, 9223372036854775807)",
+        "list": "int:[-9223372036854775808, 9223372036854775807]",
+        "seq": "int:seq(9223372036854775798, 1)"}'''
+    rows = list(generate_batch(spec, 10, columnar=False))
+    assert {row['min'] for row in rows} == {interpreter.INT64_MIN}
+    assert {row['max'] for row in rows} == {interpreter.INT64_MAX}
+    assert all(interpreter.INT64_MIN <= row['rand'] <= interpreter.INT64_MAX for row in rows)
+    assert {row['list'] for row in rows} <= {interpreter.INT64_MIN, interpreter.INT64_MAX}
+    assert rows[-1]['seq'] == interpreter.INT64_MAX
+    assert compile_schema(spec).seq_rows == 10
+
+
+def test_generate_batch_continues_rows(batch_backend):
+    compiled = compile_schema(ROWS_SPEC)
+    rows = [row for first_row in (0, 6, 12)
+            for row in generate_batch(compiled, 6, columnar=False, first_row=first_row, key=3)]
+    assert [row['id'] for row in rows] == list(range(1, 19))
+    assert len({row['code'] for row in rows}) == len({row['user']['key'] for row in rows}) == 18
+
+
+def test_datetime_range(batch_backend):
+    spec = '''{"rand": "datetime:rand(0001-01-01, 9999-12-31T23:59:59)",
+        "seq": "datetime:seq(253402300700, 50)"}'''
+    compiled = compile_schema(spec)
+    assert compiled.seq_rows == 2
+
+    generate = compiled.bind()
+    rows = [generate(), generate(), *generate_batch(spec, 2, columnar=False)]
+    for row in rows:
+        for value in row.values():
+            datetime.datetime.fromisoformat(value.rstrip('Z'))
+
+    # the third row of seq is past the year 9999
+    generate = compiled.bind(first_row=2)
+    with pytest.raises(OverflowError, match='9999'):
+        generate()
+    with pytest.raises(OverflowError, match='9999'):
+        list(generate_batch(spec, 3, columnar=False))
+
+
+ROWS_SPEC = '''{"id": "int:seq", "n": "int:seq(10, -2)", "code": "int:unique(100, 1099)",
+    "user": {"key": "int:unique(0, 999)"}}'''
+
+
+def check_rows(rows, first_row=0):
+    assert [row['id'] for row in rows] == list(range(first_row + 1, first_row + len(rows) + 1))
+    assert [row['n'] for row in rows] == [10 - 2 * (first_row + i) for i in range(len(rows))]
+    assert len({row['code'] for row in rows}) == len(rows)
+    assert all(100 <= row['code'] <= 1099 for row in rows)
+    assert len({row['user']['key'] for row in rows}) == len(rows)
+
+
+def test_row_fields():
+    ast = parse(ROWS_SPEC)
+    compiled = compile_schema(ROWS_SPEC)
+    assert compiled.max_rows == 1000
+
+    generate = compiled.bind(first_row=0, key=7)
+    rows = [generate() for _ in range(1000)]
+    check_rows(rows)
+    assert rows == [evaluate(ast, row, key=7) for row in range(1000)]
+    # every value of the ranges is used once
+    assert sorted(row['code'] for row in rows) == list(range(100, 1100))
+
+    # rows are the same whichever position they are generated from
+    assert compiled.bind(first_row=500, key=7)() == rows[500]
+    with pytest.raises(IndexError):
+        compiled.bind(first_row=1000, key=7)()
+
+
+def test_generate_batch_row_fields(batch_backend):
+    compiled = compile_schema(ROWS_SPEC)
+    expected = compiled.bind(first_row=300, key=7)
+    columns = interpreter.generate_columns(compiled, 200, first_row=300, key=7)
+    rows = list(interpreter.iterate_rows(columns))
+    check_rows(rows, 300)
+    assert rows == [expected() for _ in range(200)]
+
+
+TIMES_SPEC = '''{"r": "timestamp:rand(2024-01-01, 2024-02-01)", "s": "timestamp:seq(100, 1.5)",
+    "d": "datetime:seq(2024-01-01T00:00, 0.25)", "n": "timestamp:", "dn": "datetime:rand"}'''
+
+
+def check_times(rows, first_row=0):
+    for i, row in enumerate(rows, first_row):
+        assert 1704067200 <= row['r'] <= 1706745600
+        assert row['s'] == 100 + 1.5 * i
+        seconds = 0.25 * i
+        assert row['d'] == f'2024-01-01T00:00:{int(seconds):02}.{round(seconds % 1 * 1e6):06}Z'
+        assert row['dn'].endswith('Z')
+
+
+def test_times():
+    ast = parse(TIMES_SPEC)
+    generate = compile_schema(TIMES_SPEC).bind(first_row=2)
+    random.seed(1)
+    rows = [generate() for _ in range(100)]
+    check_times(rows, 2)
+    random.seed(1)
+    expected = [evaluate(ast, row) for row in range(2, 102)]
+    for row in rows + expected:
+        row.pop('n')
+        row.pop('dn')
+    assert rows == expected
+
+
+def test_generate_batch_times(batch_backend):
+    compiled = compile_schema(TIMES_SPEC)
+    columns = interpreter.generate_columns(compiled, 100, clock=lambda: 1e9, first_row=5)
+    rows = list(interpreter.iterate_rows(columns))
+    check_times(rows, 5)
+    # the clock is read once per batch
+    assert {row['n'] for row in rows} == {1e9}
+    assert {row['dn'] for row in rows} == {'2001-09-09T01:46:40.000000Z'}
+
+
+def test_iso_time_matches_numpy():
+    np = pytest.importorskip('numpy')
+    seconds = np.random.default_rng(1).random(1000) * 4e9 - 1e9
+    micros = np.round(seconds * 1e6).astype(np.int64).astype('datetime64[us]')
+    expected = [text + 'Z' for text in np.datetime_as_string(micros, unit='us')]
+    assert [interpreter._iso_time(t) for t in seconds.tolist()] == expected
+
+
+def test_unsupported_time_modifiers_are_reported_once(caplog):
+    with caplog.at_level('WARNING'):
+        compiled = compile_schema('{"t": "timestamp:test", "n": "int:1"}')
+        rows = [compiled() for _ in range(100)]
+    assert len(caplog.records) == 1
+    assert all(type(row['t']) is float for row in rows)
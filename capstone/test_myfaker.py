@@ -1,6 +1,12 @@
 import pytest
 import myfaker
 from unittest.mock import patch
+import gzip
+import json
+import os
+import subprocess
+import sys
+import time
 import uuid
 from pathlib import Path
 
@@ -14,14 +20,28 @@ def temp_json_schema_file(tmp_path):
     return file_path
 
 
+class EchoGenerator:
+    '''Stands in for a compiled schema, generating the schema string itself'''
+    max_rows = seq_rows = None
+
+    def __init__(self, schema):
+        self.schema = schema
+
+    def __call__(self):
+        return self.schema
+
+    def bind(self, *args):
+        return self
+
+
 def test_read_schema_from_json_file(temp_json_schema_file, capsys):
     '''Test that the CLI app reads the schema file, processes it and prints the result
     '''
-    with patch('myfaker.generate_object') as mock_process:
-        # mock the interpreter function to return its input
-        mock_process.side_effect = lambda inp: inp
+    with patch('myfaker.compile_schema') as mock_process:
+        # mock the compiled generator to return the schema string
+        mock_process.side_effect = EchoGenerator
 
-        myfaker.run_cli(["out", "-s", str(temp_json_schema_file)])
+        myfaker.run_cli(["out", "-s", str(temp_json_schema_file), "--serializer=json"])
     captured = capsys.readouterr()
     assert captured.out == f'"{SCHEMA_FILE_CONTENTS}"\n'
 
@@ -62,26 +82,36 @@ def test_clear_path(output_dir_with_diverse_files, prefix, files_count, expected
     '''Test that files with the same prefix are deleted from the output directory
     when --clear-path is specified, and files-count > 0, but not when files-count == 0'''
     tmp_path, out_dir = output_dir_with_diverse_files
-    with patch('myfaker.generate_object') as mock_process:
-        mock_process.return_value = 'MOCK'
+    with patch('myfaker.compile_schema') as mock_process:
+        mock_process.return_value = EchoGenerator('MOCK')
 
         myfaker.run_cli([str(out_dir), "-s", '{}', '--file-name=test',
-                        '--clear-path', '--files-count', str(files_count)])
+                        '--clear-path', '--files-count', str(files_count),
+                        '--serializer=json'])
 
     remaining_files = list(out_dir.iterdir())
     assert len(remaining_files) == expected_remaining_files
 
 
+def test_invalid_schema_fails_before_clearing_files(tmp_path):
+    (tmp_path / 'test_0.jsonl').write_text('{}\n')
+    with pytest.raises(myfaker.ParsingError):
+        myfaker.run_cli([str(tmp_path), "-s", '{"n": "str:rand(1, 2)"}', '--file-name=test',
+                         '--files-count', '2', '--clear-path'])
+    assert [f.name for f in tmp_path.iterdir()] == ['test_0.jsonl']
+
+
 def test_saving_files(tmp_path):
     files_count = 13
 
     out_dir = tmp_path / 'out'
     out_dir.mkdir()
 
-    with patch('myfaker.generate_object') as mock_process:
-        mock_process.return_value = 'MOCK'
+    with patch('myfaker.compile_schema') as mock_process:
+        mock_process.return_value = EchoGenerator('MOCK')
         myfaker.run_cli([str(out_dir), "-s", '{}',
-                        '--file-name=test', '--files-count', str(files_count)])
+                        '--file-name=test', '--files-count', str(files_count),
+                        '--serializer=json'])
 
     files = list(out_dir.iterdir())
     assert len(files) == files_count
@@ -104,3 +134,458 @@ def test_multiprocessing(tmp_path):
 
     files = list(out_dir.iterdir())
     assert len(files) == files_count
+
+
+@pytest.mark.parametrize("options", [
+    [],
+    ['--buffer-size', '16'],
+    ['--flush-every', '3'],
+    ['--serializer', 'json'],
+])
+def test_file_contents(tmp_path, options):
+    out_dir = tmp_path / 'out'
+    out_dir.mkdir()
+
+    myfaker.run_cli([str(out_dir), "-s", '{"n": "int:rand(1, 1)", "s": "str:a"}',
+                     '--files-count', '2', '--data-lines', '10', *options])
+
+    files = list(out_dir.iterdir())
+    assert len(files) == 2
+    for f in files:
+        assert f.read_text() == '{"n": 1, "s": "a"}\n' * 10
+
+
+@pytest.mark.parametrize("option", ['--buffer-size=0', '--flush-every=-1', '--max-memory=-1'])
+def test_invalid_output_options(tmp_path, option):
+    with pytest.raises(myfaker.ArgumentError):
+        myfaker.run_cli([str(tmp_path), "-s", '{"n": "int:1"}', option])
+
+
+def test_split_lines():
+    assert myfaker.split_lines(10, 3) == [4, 3, 3]
+    assert myfaker.split_lines(2, 3) == [1, 1, 0]
+
+
+@pytest.mark.parametrize("files_count", [1, 2])
+def test_single_file_is_split_between_workers(tmp_path, monkeypatch, files_count):
+    monkeypatch.setattr(myfaker, 'MIN_SHARD_LINES', 10)
+
+    myfaker.generate_files_async(tmp_path, '{"n": "int:rand(1, 1)"}', 'test', 'count',
+                                 data_lines=55, files_count=files_count, num_processes=4)
+
+    files = sorted(tmp_path.iterdir())
+    assert [f.name for f in files] == [f'test_{i}.jsonl' for i in range(files_count)]
+    for f in files:
+        assert f.read_text() == '{"n": 1}\n' * 55
+
+
+def test_guided_chunks():
+    chunks = myfaker.guided_chunks(100, 4)
+    assert chunks[0] == (0, 12)
+    assert chunks[-1][1] == 100
+    # contiguous, with non-increasing sizes
+    assert all(a[1] == b[0] for a, b in zip(chunks, chunks[1:]))
+    sizes = [end - start for start, end in chunks]
+    assert sizes == sorted(sizes, reverse=True)
+
+    assert myfaker.guided_chunks(0, 4) == []
+    assert myfaker.guided_chunks(3, 8) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_worker_exceptions_are_raised(tmp_path):
+    with pytest.raises(myfaker.ParsingError):
+        myfaker.generate_files_async(tmp_path, '{"n": "bad:"}', 'test', 'count',
+                                     data_lines=1, files_count=4, num_processes=2)
+
+
+def test_worker_throughput_is_logged(tmp_path, caplog):
+    with caplog.at_level('INFO'):
+        myfaker.generate_files_async(tmp_path, '{"n": "int:1"}', 'test', 'count',
+                                     data_lines=10, files_count=20, num_processes=2)
+    assert len(list(tmp_path.iterdir())) == 20
+    worker_lines = [r.message for r in caplog.records if r.message.startswith('Worker')]
+    assert worker_lines
+    assert all('lines/s' in line for line in worker_lines)
+
+
+SEEDED_SCHEMA = '''{"name": "str:rand", "age": "int:rand(1, 90)",
+    "num": "int:rand", "type": "str:['client', 'partner', 'government']"}'''
+
+
+def test_split_lines_aligned():
+    assert myfaker.split_lines(25, 3, align=10) == [10, 10, 5]
+    assert myfaker.split_lines(5, 3, align=10) == [5, 0, 0]
+
+
+def read_files(directory):
+    return {f.name: f.read_text() for f in directory.iterdir()}
+
+
+def test_seed_output_does_not_depend_on_jobs(tmp_path, monkeypatch):
+    monkeypatch.setattr(myfaker, 'MIN_SHARD_LINES', 10)
+    monkeypatch.setattr(myfaker, 'SEED_BLOCK_LINES', 7)
+
+    outputs = []
+    for jobs in (1, 2, 4):
+        out_dir = tmp_path / str(jobs)
+        out_dir.mkdir()
+        if jobs == 1:
+            myfaker.generate_file(out_dir, SEEDED_SCHEMA, 'test', 'uuid', 45, seed=3)
+        else:
+            myfaker.generate_files_async(out_dir, SEEDED_SCHEMA, 'test', 'uuid',
+                                         data_lines=45, files_count=1,
+                                         num_processes=jobs, seed=3)
+        outputs.append(read_files(out_dir))
+
+    assert outputs[0] == outputs[1] == outputs[2]
+    assert len(list(outputs[0].values())[0].splitlines()) == 45
+
+
+def test_seed_many_files(tmp_path):
+    for name, seed in (('a', 1), ('b', 1), ('c', 2)):
+        out_dir = tmp_path / name
+        out_dir.mkdir()
+        myfaker.run_cli([str(out_dir), "-s", SEEDED_SCHEMA, '--files-count', '3',
+                         '--data-lines', '20', '--seed', str(seed)])
+
+    assert read_files(tmp_path / 'a') == read_files(tmp_path / 'b')
+    assert read_files(tmp_path / 'a') != read_files(tmp_path / 'c')
+
+
+def test_seed_stdout(tmp_path, capsys, monkeypatch):
+    # no default.ini in the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv('SOURCE_DATE_EPOCH', '1700000000')
+    schema = SEEDED_SCHEMA.replace('{', '{"date": "timestamp:", ', 1)
+
+    outputs = []
+    for _ in range(2):
+        myfaker.run_cli(["out", "-s", schema, '--files-count', '0', '--data-lines', '5',
+                         '--seed', '7'])
+        outputs.append(capsys.readouterr().out)
+
+    assert outputs[0] == outputs[1]
+    assert '"date": 1700000000.0' in outputs[0]
+
+
+def test_stdout_lines(capsys):
+    myfaker.run_cli(["out", "-s", '{"n": "int:1"}', '--data-lines', '2500',
+                     '--files-count', '0'])
+    assert capsys.readouterr().out == '{"n": 1}\n' * 2500
+
+
+def test_stdout_rate_limit(capsys):
+    start = time.monotonic()
+    myfaker.run_cli(["out", "-s", '{"n": "int:1"}', '--data-lines', '30',
+                     '--files-count', '0', '--rate', '100'])
+    assert time.monotonic() - start >= 0.25
+    assert capsys.readouterr().out == '{"n": 1}\n' * 30
+
+
+def test_endless_stdout_stops_on_closed_pipe():
+    proc = subprocess.Popen(
+        [sys.executable, 'myfaker.py', 'out', '-s', '{"n": "int:rand"}',
+         '--files-count', '0', '--data-lines', '-1'],
+        cwd=Path(myfaker.__file__).parent,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+    lines = [proc.stdout.readline() for _ in range(3)]
+    proc.stdout.close()
+    _, err = proc.communicate(timeout=30)
+
+    assert all(line.startswith(b'{"n": ') for line in lines)
+    assert proc.returncode == 0
+    assert b'Traceback' not in err
+    assert b'Output closed' in err
+
+
+@pytest.mark.parametrize("options", [
+    ['--data-lines', '-2'],
+    ['--data-lines', '-1', '--files-count', '1'],
+    ['--rate', '-1'],
+    ['--rate', '10', '--files-count', '1'],
+])
+def test_invalid_stdout_options(tmp_path, options):
+    with pytest.raises(myfaker.ArgumentError):
+        myfaker.run_cli([str(tmp_path), "-s", '{"n": "int:1"}', *options])
+
+
+def test_compressed_files(tmp_path, caplog):
+    with caplog.at_level('INFO'):
+        myfaker.run_cli([str(tmp_path), "-s", '{"n": "int:1"}', '--files-count', '2',
+                         '--data-lines', '100', '--compression', 'gzip',
+                         '--file-suffix', 'count'])
+
+    files = sorted(tmp_path.iterdir())
+    assert [f.name for f in files] == ['myfaker_data_0.jsonl.gz', 'myfaker_data_1.jsonl.gz']
+    for f in files:
+        assert gzip.decompress(f.read_bytes()) == b'{"n": 1}\n' * 100
+    assert 'ratio' in caplog.records[-1].message
+
+
+def test_compression_requires_files(tmp_path):
+    with pytest.raises(myfaker.ArgumentError):
+        myfaker.run_cli([str(tmp_path), "-s", '{"n": "int:1"}', '--files-count', '0',
+                         '--compression', 'gzip'])
+
+
+ROWS_SCHEMA = '{"id": "int:seq", "code": "int:unique(1, 1000)"}'
+
+
+@pytest.mark.parametrize("seed", [1, None])
+@pytest.mark.parametrize("files_count, fmt", [(1, 'jsonl'), (3, 'jsonl'), (2, 'csv')])
+def test_row_fields_across_workers(tmp_path, monkeypatch, files_count, fmt, seed):
+    monkeypatch.setattr(myfaker, 'MIN_SHARD_LINES', 10)
+    monkeypatch.setattr(myfaker, 'SEED_BLOCK_LINES', 10)
+
+    myfaker.generate_files_async(tmp_path, ROWS_SCHEMA, 'test', 'count', data_lines=45,
+                                 files_count=files_count, num_processes=4, seed=seed, fmt=fmt)
+
+    rows = []
+    for i in range(files_count):
+        text = (tmp_path / f'test_{i}.{fmt}').read_text()
+        if fmt == 'csv':
+            rows += [dict(zip(('id', 'code'), map(int, line.split(','))))
+                     for line in text.splitlines()[1:]]
+        else:
+            rows += [json.loads(line) for line in text.splitlines()]
+    # the rows continue from file to file
+    assert [row['id'] for row in rows] == list(range(1, 45 * files_count + 1))
+    assert len({row['code'] for row in rows}) == len(rows)
+
+
+def test_unique_fields_without_seed(tmp_path):
+    myfaker.run_cli([str(tmp_path), "-s", ROWS_SCHEMA, '--files-count', '4',
+                     '--data-lines', '250'])
+    codes = [json.loads(line)['code'] for f in tmp_path.iterdir()
+             for line in f.read_text().splitlines()]
+    assert sorted(codes) == list(range(1, 1001))
+
+    with pytest.raises(myfaker.ArgumentError):
+        myfaker.run_cli([str(tmp_path), "-s", ROWS_SCHEMA, '--files-count', '4',
+                         '--data-lines', '251'])
+
+
+def test_seq_fields_stay_64_bit(tmp_path):
+    schema = '{"id": "int:seq(9223372036854775800, 1)"}'
+    myfaker.run_cli([str(tmp_path), "-s", schema, '--files-count', '2', '--data-lines', '4'])
+
+    with pytest.raises(myfaker.ArgumentError):
+        myfaker.run_cli([str(tmp_path), "-s", schema, '--files-count', '2',
+                         '--data-lines', '5'])
+
+
+def test_ref_fields(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'users').mkdir()
+    (tmp_path / 'orders').mkdir()
+    myfaker.run_cli(['users', "-s", '{"id": "int:unique(1000, 9999)", "name": "name:"}',
+                     '--files-count', '2', '--data-lines', '20', '--file-name', 'users'])
+    myfaker.run_cli(['orders', "-s", '{"user": "int:ref(users/*.jsonl.id)", '
+                     '"name": "str:ref(users/users_*.jsonl.name)"}',
+                     '--files-count', '1', '--data-lines', '100', '--file-name', 'orders'])
+
+    users = [json.loads(line) for f in (tmp_path / 'users').glob('*.jsonl')
+             for line in f.read_text().splitlines()]
+    orders = [json.loads(line) for f in (tmp_path / 'orders').iterdir()
+              for line in f.read_text().splitlines()]
+    assert len(orders) == 100
+    assert {order['user'] for order in orders} <= {user['id'] for user in users}
+    assert {order['name'] for order in orders} <= {user['name'] for user in users}
+
+    with pytest.raises(myfaker.ParsingError):
+        myfaker.run_cli(['orders', "-s", '{"user": "int:ref(missing/*.jsonl.id)"}',
+                         '--files-count', '1'])
+
+
+def write_seeded_csv(tmp_path, monkeypatch, jobs):
+    monkeypatch.setattr(myfaker, 'MIN_SHARD_LINES', 10)
+    monkeypatch.setattr(myfaker, 'SEED_BLOCK_LINES', 10)
+
+    myfaker.generate_files_async(tmp_path, SEEDED_SCHEMA, 'test', 'count', data_lines=45,
+                                 files_count=1, num_processes=jobs, seed=1, fmt='csv')
+
+    lines = (tmp_path / 'test_0.csv').read_text().splitlines()
+    assert lines[0] == 'name,age,num,type'
+    assert len(lines) == 46
+    return lines
+
+
+@pytest.mark.parametrize("jobs", [1, 3])
+def test_csv_files(tmp_path, monkeypatch, jobs):
+    write_seeded_csv(tmp_path, monkeypatch, jobs)
+
+
+def test_csv_output_does_not_depend_on_jobs(tmp_path, monkeypatch):
+    outputs = []
+    for jobs in (1, 3):
+        out_dir = tmp_path / str(jobs)
+        out_dir.mkdir()
+        outputs.append(write_seeded_csv(out_dir, monkeypatch, jobs))
+    assert outputs[0] == outputs[1]
+
+
+def test_csv_stdout(capsys):
+    myfaker.run_cli(["out", "-s", '{"n": "int:1", "s": "str:a"}', '--data-lines', '3',
+                     '--files-count', '0', '--format', 'csv'])
+    assert capsys.readouterr().out == 'n,s\n1,a\n1,a\n1,a\n'
+
+
+def test_parquet_requires_files(tmp_path):
+    pytest.importorskip('pyarrow')
+    with pytest.raises(myfaker.ArgumentError):
+        myfaker.run_cli([str(tmp_path), "-s", '{"n": "int:1"}', '--files-count', '0',
+                         '--format', 'parquet'])
+
+
+def test_parquet_files(tmp_path):
+    pq = pytest.importorskip('pyarrow.parquet')
+    myfaker.run_cli([str(tmp_path), "-s", '{"n": "int:1"}', '--files-count', '2',
+                     '--data-lines', '100', '--format', 'parquet', '--compression', 'zstd'])
+
+    files = list(tmp_path.iterdir())
+    assert len(files) == 2
+    for f in files:
+        assert f.suffix == '.parquet'
+        assert pq.read_table(f).column('n').to_pylist() == [1] * 100
+
+
+def test_plan_memory():
+    generator = myfaker.compile_schema(SEEDED_SCHEMA)
+    small_rows, small_buffer = myfaker.plan_memory(generator, 1 << 20)
+    large_rows, large_buffer = myfaker.plan_memory(generator, 1 << 30)
+
+    assert 1 <= small_rows < large_rows == myfaker.CHUNK_ROWS
+    assert small_buffer < large_buffer
+    # the budget is shared between jobs
+    assert myfaker.plan_memory(generator, 1 << 20, jobs=4)[0] < small_rows
+
+
+def peak_rss_mb(args: list, **kwargs) -> float:
+    '''Runs myfaker in a subprocess and returns its peak RSS'''
+    proc = subprocess.Popen([sys.executable, 'myfaker.py', *args],
+                            cwd=Path(myfaker.__file__).parent,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **kwargs)
+    _, status, usage = os.wait4(proc.pid, 0)
+    assert status == 0
+    # kilobytes on Linux
+    return usage.ru_maxrss / 1024
+
+
+@pytest.mark.skipif(not hasattr(os, 'wait4'), reason='needs os.wait4')
+def test_memory_does_not_grow_with_output_size():
+    # the peak RSS of the forked test process is inherited through exec,
+    # so it is compared with a small run instead of an absolute number
+    args = ['out', '-s', '{"n": "int:1", "s": "str:a"}', '--files-count', '0', '--max-memory', '16']
+    baseline = peak_rss_mb([*args, '--data-lines', '1000'])
+    rss = peak_rss_mb([*args, '--data-lines', '10000000'])
+    assert rss < baseline + 32
+
+
+@pytest.mark.skipif(not hasattr(os, 'wait4'), reason='needs os.wait4')
+def test_memory_files_mode(tmp_path):
+    args = [str(tmp_path), '-s', '{"n": "int:rand", "s": "str:rand"}', '--files-count', '2',
+            '--format', 'csv', '--compression', 'gzip', '--max-memory', '16', '-j', '2']
+    baseline = peak_rss_mb([*args, '--data-lines', '1000', '--file-name', 'small'])
+    rss = peak_rss_mb([*args, '--data-lines', '500000'])
+    assert rss < baseline + 32
+
+
+@pytest.mark.parametrize("files_count", [0, 1])
+def test_max_memory_with_row_fields(tmp_path, capsys, files_count):
+    myfaker.run_cli([str(tmp_path), "-s", '{"id": "int:seq", "u": "int:unique(1, 10)"}',
+                     '--files-count', str(files_count), '--data-lines', '10',
+                     '--max-memory', '16', '--file-name', 'test', '--file-suffix', 'count'])
+
+    if files_count:
+        lines = (tmp_path / 'test_0.jsonl').read_text().splitlines()
+    else:
+        lines = capsys.readouterr().out.splitlines()
+    rows = [json.loads(line) for line in lines]
+    assert [row['id'] for row in rows] == list(range(1, 11))
+    assert sorted(row['u'] for row in rows) == list(range(1, 11))
+
+
+def test_stats_report(tmp_path, caplog, capsys):
+    report_path = tmp_path / 'stats.json'
+    with caplog.at_level('INFO'):
+        myfaker.run_cli([str(tmp_path), "-s", SEEDED_SCHEMA, '--files-count', '2',
+                         '--data-lines', '100', '--stats', '--stats-file', str(report_path)])
+
+    data = json.loads(report_path.read_text())
+    assert data['lines'] == 200
+    assert data['bytes_generated'] == data['bytes_written'] == \
+        sum(f.stat().st_size for f in tmp_path.glob('myfaker_data_*'))
+    assert set(data['stages']) == {'parse', 'evaluate', 'serialize', 'write'}
+    assert data['stages']['evaluate'] > 0
+    assert [w['lines'] for w in data['workers']] == [200]
+
+    assert any(r.message.startswith('Time per stage') for r in caplog.records)
+    # the last progress line
+    assert '200/200 lines (100%)' in capsys.readouterr().err
+
+
+def test_stats_report_of_workers(tmp_path):
+    workers = myfaker.generate_files_async(tmp_path, SEEDED_SCHEMA, 'test', 'count',
+                                           data_lines=10, files_count=6, num_processes=2)
+    assert sum(stats.rows for stats in workers.values()) == 60
+    assert sum(stats.tasks for stats in workers.values()) == len(myfaker.guided_chunks(6, 2))
+
+
+@pytest.mark.parametrize("fmt", ['csv', 'parquet'])
+def test_stats_of_other_formats(tmp_path, fmt):
+    if fmt == 'parquet':
+        pytest.importorskip('pyarrow')
+    stats = myfaker.Stats()
+    myfaker.generate_file(tmp_path, SEEDED_SCHEMA, 'test', 'count', 100, fmt=fmt, stats=stats)
+    assert stats.rows == 100
+    assert stats.bytes_written == (tmp_path / f'test_0.{fmt}').stat().st_size
+    assert stats.times['evaluate'] > 0
+
+
+def test_import_is_side_effect_free(tmp_path):
+    # a config file which would be read by an import-time parser
+    (tmp_path / 'default.ini').write_text('[DEFAULT]\nfiles_count = 3\n')
+    code = (
+        'import logging, sys, myfaker\n'
+        'lazy = ["argparse", "configparser", "multiprocessing", "concurrent.futures",\n'
+        '        "uuid", "gzip", "bz2"]\n'
+        'print([m for m in lazy if m in sys.modules])\n'
+        'print(logging.getLogger().handlers)\n'
+    )
+    env = {**os.environ, 'PYTHONPATH': str(Path(myfaker.__file__).parent)}
+    out = subprocess.run([sys.executable, '-c', code], cwd=tmp_path, env=env,
+                         capture_output=True, text=True, check=True).stdout
+    assert out.splitlines() == ['[]', '[]']
+
+
+def test_config_file_is_read_when_running(tmp_path, monkeypatch):
+    (tmp_path / 'default.ini').write_text('[DEFAULT]\nfiles_count = 2\nfile_suffix = count\n')
+    monkeypatch.chdir(tmp_path)
+    myfaker.run_cli([str(tmp_path), '-s', '{"n": "int:1"}'])
+    assert sorted(f.name for f in tmp_path.glob('*.jsonl')) == ['myfaker_data_0.jsonl',
+                                                                 'myfaker_data_1.jsonl']
+
+
+@pytest.mark.parametrize("fmt", ['csv', 'parquet'])
+def test_seeded_columns_do_not_depend_on_batch_size(tmp_path, monkeypatch, fmt):
+    pq = pytest.importorskip('pyarrow.parquet') if fmt == 'parquet' else None
+    monkeypatch.setattr(myfaker, 'MIN_SHARD_LINES', 10)
+    monkeypatch.setattr(myfaker, 'SEED_BLOCK_LINES', 20)
+    schema = SEEDED_SCHEMA.replace('{', '{"tags": "array(0..3) of int:rand(1, 9)", ', 1)
+
+    outputs = []
+    # --max-memory makes the batches smaller with more jobs, --flush-every too
+    for options in ([], ['-j', '3', '--max-memory', '1'], ['--flush-every', '7'],
+                    ['-j', '2', '--max-memory', '1', '--flush-every', '3']):
+        out_dir = tmp_path / str(len(outputs))
+        out_dir.mkdir()
+        myfaker.run_cli([str(out_dir), "-s", schema, '--files-count', '1', '--data-lines', '95',
+                         '--file-name', 'test', '--file-suffix', 'count', '--seed', '5',
+                         '--format', fmt, *options])
+        if pq:
+            outputs.append(pq.read_table(out_dir / 'test_0.parquet').to_pylist())
+        else:
+            outputs.append(read_files(out_dir))
+
+    assert all(output == outputs[0] for output in outputs)
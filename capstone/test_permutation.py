@@ -0,0 +1,28 @@
+from permutation import Permutation, permutation
+
+import pytest
+
+
+@pytest.mark.parametrize('size', [1, 2, 3, 10, 255, 256, 1000, 4097])
+def test_bijection(size):
+    p = Permutation(size, 'key')
+    assert sorted(p(i) for i in range(size)) == list(range(size))
+
+
+def test_keys_choose_the_permutation():
+    values = [permutation(1000, key)(0) for key in range(20)]
+    assert len(set(values)) > 10
+    assert permutation(1000, 'a') is permutation(1000, 'a')
+
+
+def test_array_matches_scalar():
+    np = pytest.importorskip('numpy')
+    p = Permutation(5000, 'key')
+    indices = np.arange(5000)
+    assert p.array(indices, np).tolist() == [p(i) for i in range(5000)]
+
+
+@pytest.mark.parametrize('i', [-1, 10])
+def test_out_of_range(i):
+    with pytest.raises(IndexError):
+        Permutation(10, 'key')(i)
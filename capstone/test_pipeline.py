@@ -0,0 +1,57 @@
+import threading
+import time
+
+import pytest
+
+from pipeline import pipelined, run_pipeline
+
+
+def test_stages_are_applied_in_order():
+    out = []
+    run_pipeline(range(100), [lambda x: x * 2, lambda x: x + 1], out.append)
+    assert out == [x * 2 + 1 for x in range(100)]
+
+
+def test_source_only():
+    assert list(pipelined(iter('abc'))) == ['a', 'b', 'c']
+
+
+def test_exceptions_are_raised():
+    def fail(x):
+        if x == 5:
+            raise ValueError('bad item')
+        return x
+
+    with pytest.raises(ValueError, match='bad item'):
+        list(pipelined(range(10), [fail]))
+
+    def source():
+        yield 1
+        raise KeyError('source')
+
+    with pytest.raises(KeyError):
+        list(pipelined(source(), [str]))
+
+
+def test_queues_are_bounded():
+    produced = []
+
+    def source():
+        for i in range(1000):
+            produced.append(i)
+            yield i
+
+    items = pipelined(source(), [lambda x: x], queue_size=2)
+    assert next(items) == 0
+    time.sleep(0.3)
+    # two queues of two items, plus one item held by each thread
+    assert len(produced) <= 8
+    items.close()
+
+
+def test_closing_stops_the_threads():
+    threads = threading.active_count()
+    items = pipelined(iter(range(10 ** 9)), [str, int])
+    next(items)
+    items.close()
+    assert threading.active_count() == threads
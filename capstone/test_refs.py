@@ -0,0 +1,81 @@
+import gzip
+import json
+
+import pytest
+
+import interpreter
+import refs
+
+
+@pytest.fixture
+def users(tmp_path, monkeypatch):
+    monkeypatch.setattr(refs, '_indexes', {})
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'users').mkdir()
+    for k in range(2):
+        with open(tmp_path / 'users' / f'part{k}.jsonl', 'w') as f:
+            for i in range(k * 50, k * 50 + 50):
+                f.write(json.dumps({'id': i, 'name': f'user {i}', 'user': {'score': i / 2}}) + '\n')
+    return tmp_path
+
+
+@pytest.mark.parametrize(
+    'field, field_type, expected',
+    [
+        ('id', 'int', list(range(100))),
+        ('name', 'str', [f'user {i}' for i in range(100)]),
+        ('user.score', 'float', [i / 2 for i in range(100)]),
+    ])
+def test_index(users, field, field_type, expected):
+    index = refs.open_index('users/*.jsonl', field, field_type)
+    assert len(index) == 100
+    assert [index[i] for i in range(100)] == expected
+    assert index.take([3, 0]) == [expected[3], expected[0]]
+
+
+def test_index_take_numpy(users):
+    np = pytest.importorskip('numpy')
+    for field, field_type in [('id', 'int'), ('name', 'str')]:
+        index = refs.open_index('users/*.jsonl', field, field_type)
+        assert index.take(np.array([5, 7]), np).tolist() == [index[5], index[7]]
+
+
+def test_index_is_rebuilt_when_files_change(users):
+    refs.open_index('users/*.jsonl', 'id', 'int')
+    with open(users / 'users' / 'part1.jsonl', 'a') as f:
+        f.write('{"id": 100}\n')
+    assert len(refs.open_index('users/*.jsonl', 'id', 'int')) == 101
+    assert len(list((users / 'users' / refs.INDEX_DIRECTORY).iterdir())) == 2
+
+
+def test_evaluate_opens_the_index_once(users, monkeypatch):
+    monkeypatch.setattr(interpreter, '_evaluated_refs', {})
+    calls = []
+    index_path = refs.index_path
+    monkeypatch.setattr(refs, 'index_path', lambda *args: calls.append(args) or index_path(*args))
+
+    ast = interpreter.parse('{"user": "int:ref(users/*.jsonl.id)"}')
+    assert all(0 <= interpreter.evaluate(ast)['user'] < 100 for _ in range(50))
+    assert len(calls) == 1
+
+
+def test_csv_and_compressed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / 'a.csv').write_text('id,name\n1,x\n2,y\n')
+    with gzip.open(tmp_path / 'b.jsonl.gz', 'wt') as f:
+        f.write('{"id": 3}\n')
+    assert refs.open_index('a.csv', 'name', 'str').take([0, 1]) == ['x', 'y']
+    assert refs.open_index('a.csv', 'id', 'int')[1] == 2
+    assert refs.open_index('b.jsonl.gz', 'id', 'int')[0] == 3
+
+
+@pytest.mark.parametrize(
+    'pattern, field, field_type',
+    [
+        ('missing/*.jsonl', 'id', 'int'),
+        ('users/*.jsonl', 'email', 'str'),
+        ('users/*.jsonl', 'name', 'int'),
+    ])
+def test_errors(users, pattern, field, field_type):
+    with pytest.raises(refs.RefError):
+        refs.open_index(pattern, field, field_type)
@@ -0,0 +1,59 @@
+import json
+
+import pytest
+
+from interpreter import compile_schema
+from serializers import make_serializer, schema_serializer, SerializerError
+
+SPECS = [
+    '''{"date": "timestamp:", "name": "str:rand",
+        "type": "str:['client', 'partner', 'gov\\u00e9rnment']",
+        "age": "int:rand(1, 90)", "num": "int:rand", "ids": "int:[3, -4]",
+        "s": "str:cat1", "n": "int:1", "e": "str:", "i": "int:"}''',
+
+    # keys and values that need escaping
+    '''{"k\\"ey {1}": "str:['a\\\\\\\\b', '%s', '{x}']", "\\u00fc": "int:5"}''',
+
+    '''{"only": "str:rand"}''',
+
+    '''{"f": "float:rand(-1, 1)", "fl": "float:[1, 2.5]", "fc": "float:2", "fe": "float:",
+        "b": "bool:", "d": "date:", "e": "email:", "n": "name:",
+        "t": "enum:['gold':1, 'silv\\u00e9r':3]"}''',
+
+    # nested objects and arrays
+    '''{"id": "int:rand", "c": {"k": "int:1", "e": "str:"}, "user": {"n": "name:",
+        "tags": "array(0..3) of enum:['a', 'b']"}, "m": "array(0..2) of array(1..2) of float:rand",
+        "items": "array(2) of {\\"sku\\": \\"int:rand\\", \\"k\\": \\"str:x\\"}"}''',
+
+    # weighted lists
+    '''{"s": "str:['a b':1, 'c':2]", "i": "int:[1:1, -2:2]", "f": "float:[0.5:1, 2:1]"}''',
+
+    # fields depending on the row
+    '''{"id": "int:seq", "n": "int:seq(0, -3)", "u": {"code": "int:unique(-50, 50)"}}''',
+
+    # times
+    '''{"t": "timestamp:rand(2024-01-01, 2025-01-01)", "s": "timestamp:seq(0, 0.1)",
+        "d": "datetime:", "ds": "datetime:seq(2024-01-01T12:00, 1)"}''',
+]
+
+
+@pytest.mark.parametrize("spec", SPECS)
+def test_schema_serializer_matches_json(spec):
+    compiled = compile_schema(spec)
+    serialize = schema_serializer(compiled)
+    for _ in range(100):
+        obj = compiled()
+        assert serialize(obj).encode() == json.dumps(obj).encode()
+
+
+def test_orjson_serializer():
+    pytest.importorskip('orjson')
+    compiled = compile_schema(SPECS[0])
+    serialize = make_serializer(compiled, 'orjson')
+    obj = compiled()
+    assert json.loads(serialize(obj)) == obj
+
+
+def test_unknown_serializer():
+    with pytest.raises(SerializerError):
+        make_serializer(compile_schema(SPECS[0]), 'xml')
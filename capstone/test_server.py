@@ -0,0 +1,121 @@
+import concurrent.futures
+import io
+import json
+import multiprocessing
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+
+import pytest
+
+import client
+import myfaker
+import server
+from interpreter import compile_schema
+
+SCHEMA = '{"name": "str:rand", "age": "int:rand(1, 90)", "type": "str:[\'a\', \'b\']"}'
+
+
+@pytest.fixture(scope='module')
+def socket_path():
+    # socket paths are limited to about 100 characters
+    directory = tempfile.mkdtemp()
+    path = str(Path(directory) / 'myfaker.sock')
+    pool = multiprocessing.Pool(2)
+    srv = server.Server(path, pool, jobs=2)
+    thread = threading.Thread(target=srv.serve_forever, daemon=True)
+    thread.start()
+    yield path
+    srv.shutdown()
+    srv.server_close()
+    pool.terminate()
+    shutil.rmtree(directory)
+
+
+def request(path, *args):
+    out = io.BytesIO()
+    status = client.request(['out', '-n', '0', *args], path, out)
+    return status, out.getvalue()
+
+
+def local_output(*args):
+    args = myfaker.parse_cli(['out', '-n', '0', *args])
+    out = io.BytesIO()
+    myfaker.write_stream(out, args.schema, args.data_lines, args.serializer, args.seed,
+                         fmt=args.format)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("fmt", ['jsonl', 'csv'])
+def test_seeded_output_is_the_same_as_myfaker(socket_path, fmt):
+    args = ['-s', SCHEMA, '--data-lines', '500', '--seed', '3', '--format', fmt]
+    status, data = request(socket_path, *args)
+    assert status == 0
+    assert data == local_output(*args)
+    assert len(data.splitlines()) == 500 + (fmt == 'csv')
+
+
+@pytest.mark.parametrize("fmt", ['jsonl', 'csv'])
+def test_worker_pool(socket_path, monkeypatch, fmt):
+    monkeypatch.setattr(server, 'POOL_MIN_LINES', 0)
+    # so that -j 2 isn't limited on small machines
+    monkeypatch.setattr(myfaker.os, 'cpu_count', lambda: 4)
+    args = ['-s', SCHEMA, '--data-lines', '25000', '--seed', '3', '--format', fmt]
+
+    status, data = request(socket_path, *args, '-j', '2')
+    assert status == 0
+    assert data == local_output(*args)
+
+
+def test_concurrent_requests(socket_path):
+    # unseeded requests share the UUID buffer across the server threads
+    args = ['-s', SCHEMA, '--data-lines', '20000']
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        results = list(executor.map(lambda _: request(socket_path, *args), range(8)))
+
+    names = [json.loads(line)['name'] for status, data in results for line in data.splitlines()]
+    assert [status for status, _ in results] == [0] * 8
+    assert len(set(names)) == len(names) == 8 * 20000
+
+
+def test_schemas_stay_compiled(socket_path):
+    request(socket_path, '-s', SCHEMA, '--data-lines', '1')
+    hits = compile_schema.cache_info().hits
+    request(socket_path, '-s', SCHEMA, '--data-lines', '1')
+    assert compile_schema.cache_info().hits > hits
+
+
+def test_errors(socket_path, capsys):
+    assert request(socket_path, '-s', '{"n": "bad:"}') == (1, b'')
+    assert 'Syntax error' in capsys.readouterr().err
+
+    assert request(socket_path, '-s', '{"n": "int:1"}', '--rate', '-1') == (1, b'')
+    assert 'Argument error' in capsys.readouterr().err
+
+
+def test_files_and_usage_errors_run_locally(socket_path):
+    assert request(socket_path, '-s', SCHEMA, '--files-count', '1')[0] is None
+    assert request(socket_path, '-s', SCHEMA, '--stats')[0] is None
+    assert request(socket_path)[0] is None
+    # the files of ref fields are relative to the client
+    assert request(socket_path, '-s', '{"n": "int:ref(users/*.jsonl.id)"}')[0] is None
+
+
+def test_unique_fields_with_worker_pool(socket_path, monkeypatch):
+    monkeypatch.setattr(server, 'POOL_MIN_LINES', 0)
+    monkeypatch.setattr(myfaker.os, 'cpu_count', lambda: 4)
+    status, data = request(socket_path, '-s', '{"id": "int:seq", "code": "int:unique(1, 30000)"}',
+                           '--data-lines', '25000', '-j', '2')
+    assert status == 0
+    rows = [json.loads(line) for line in data.splitlines()]
+    assert [row['id'] for row in rows] == list(range(1, 25001))
+    assert len({row['code'] for row in rows}) == 25000
+
+
+def test_client_runs_locally_without_server(monkeypatch, tmp_path):
+    calls = []
+    monkeypatch.setenv('MYFAKER_SOCKET', str(tmp_path / 'missing.sock'))
+    monkeypatch.setattr(client, 'run_locally', calls.append)
+    client.main(['out', '-s', SCHEMA])
+    assert calls == [['out', '-s', SCHEMA]]
@@ -0,0 +1,144 @@
+import bz2
+import gzip
+import io
+import os
+
+import pytest
+
+from sinks import FileSink, StreamSink, concatenate_parts
+from sinks import open_sink, compressor, CompressionError
+
+
+def test_rows_are_written_on_close(tmp_path):
+    path = tmp_path / 'out.jsonl'
+    with FileSink(path) as sink:
+        sink.write_rows(['1', '2'])
+        sink.write_rows(['3'])
+        # everything fits in the buffer
+        assert path.read_text() == ''
+    assert path.read_text() == '1\n2\n3\n'
+    assert sink.write_calls == 1
+    assert sink.rows == 3
+    assert sink.bytes_written == 6
+
+
+def test_buffer_size(tmp_path):
+    path = tmp_path / 'out.jsonl'
+    with FileSink(path, buffer_size=4) as sink:
+        sink.write_rows(['1'])
+        assert path.read_text() == ''
+        sink.write_rows(['2'])
+        assert path.read_text() == '1\n2\n'
+    assert sink.write_calls == 1
+
+
+def test_flush_every(tmp_path):
+    path = tmp_path / 'out.jsonl'
+    with FileSink(path, flush_every=2) as sink:
+        sink.write_rows(['1'])
+        assert path.read_text() == ''
+        sink.write_rows(['2'])
+        assert path.read_text() == '1\n2\n'
+        sink.write_rows(['3'])
+    assert path.read_text() == '1\n2\n3\n'
+
+
+def test_appends_to_existing_file(tmp_path):
+    path = tmp_path / 'out.jsonl'
+    path.write_text('0\n')
+    with FileSink(path) as sink:
+        sink.write_rows(['1'])
+    assert path.read_text() == '0\n1\n'
+
+
+def make_parts(tmp_path, count):
+    parts = []
+    for k in range(count):
+        part = tmp_path / f'part{k}'
+        part.write_text(f'{k}\n' * 1000)
+        parts.append(part)
+    return parts
+
+
+def test_concatenate_parts(tmp_path):
+    path = tmp_path / 'out.jsonl'
+    path.write_text('start\n')
+    concatenate_parts(path, make_parts(tmp_path, 3))
+
+    assert path.read_text() == 'start\n' + '0\n' * 1000 + '1\n' * 1000 + '2\n' * 1000
+    assert list(tmp_path.iterdir()) == [path]
+
+
+def test_concatenate_parts_fallback(tmp_path, monkeypatch):
+    def unsupported(*args):
+        raise OSError('not supported')
+
+    monkeypatch.setattr(os, 'copy_file_range', unsupported, raising=False)
+    monkeypatch.setattr(os, 'sendfile', unsupported, raising=False)
+
+    path = tmp_path / 'out.jsonl'
+    concatenate_parts(path, make_parts(tmp_path, 2))
+    assert path.read_text() == '0\n' * 1000 + '1\n' * 1000
+
+
+def test_stream_sink():
+    stream = io.BytesIO()
+    with StreamSink(stream, buffer_size=8) as sink:
+        sink.write_rows(['1'])
+        assert stream.getvalue() == b''
+        sink.write_rows(['22', '333'])
+        assert stream.getvalue() == b'1\n22\n333\n'
+        sink.write_rows(['4'])
+    assert stream.getvalue() == b'1\n22\n333\n4\n'
+    assert not stream.closed
+    assert sink.write_calls == 2
+
+
+def decompress(path, compression):
+    data = path.read_bytes()
+    if compression == 'gzip':
+        return gzip.decompress(data)
+    if compression == 'bz2':
+        return bz2.decompress(data)
+    zstandard = pytest.importorskip('zstandard')
+    # read all the frames
+    return zstandard.ZstdDecompressor().decompressobj(read_across_frames=True).decompress(data)
+
+
+@pytest.fixture(params=['gzip', 'bz2', 'zstd'])
+def compression(request):
+    try:
+        compressor(request.param)
+    except CompressionError:
+        pytest.skip(f'{request.param} is not available')
+    return request.param
+
+
+def test_compressed_sink(tmp_path, compression):
+    path = tmp_path / 'out.jsonl'
+    lines = [str(i) for i in range(10000)]
+    with open_sink(path, compression, buffer_size=100) as sink:
+        for i in range(0, 10000, 10):
+            sink.write_rows(lines[i:i + 10])
+
+    assert decompress(path, compression) == ('\n'.join(lines) + '\n').encode()
+    assert sink.raw_bytes == len('\n'.join(lines)) + 1
+    assert sink.bytes_written == path.stat().st_size < sink.raw_bytes
+
+
+def test_compressed_parts_can_be_concatenated(tmp_path, compression):
+    parts = []
+    for k in range(3):
+        part = tmp_path / f'part{k}'
+        with open_sink(part, compression) as sink:
+            sink.write_rows([str(k)] * 100)
+        parts.append(part)
+
+    path = tmp_path / 'out'
+    concatenate_parts(path, parts)
+    assert decompress(path, compression) == b'0\n' * 100 + b'1\n' * 100 + b'2\n' * 100
+
+
+def test_unknown_compression():
+    with pytest.raises(CompressionError):
+        compressor('lzma')
@@ -0,0 +1,76 @@
+import io
+import json
+import pickle
+
+from stats import Stats, Progress, per_worker, progress_line, report, show_progress, write_report
+
+
+def test_stage_timers():
+    stats = Stats()
+    with stats.measure('write'):
+        pass
+    assert stats.timed('serialize', lambda x: x * 2)(3) == 6
+    assert list(stats.time_producer('evaluate', range(3))) == [0, 1, 2]
+    assert list(stats.time_consumer('write', 'ab')) == ['a', 'b']
+
+    assert set(stats.times) == {'parse', 'evaluate', 'serialize', 'write'}
+    assert all(seconds > 0 for stage, seconds in stats.times.items() if stage != 'parse')
+
+
+def test_counts_and_progress():
+    progress = Progress()
+    stats = Stats(progress)
+    stats.count(10, 100)
+    stats.count(5, 50)
+    assert (stats.rows, stats.raw_bytes) == (15, 150)
+    assert progress.get() == (15, 150)
+
+    # the shared counters are not sent back from the workers
+    assert pickle.loads(pickle.dumps(stats)).progress is None
+
+
+def test_per_worker_and_report():
+    results = []
+    for pid, rows in [(2, 10), (1, 20), (2, 30)]:
+        stats = Stats()
+        stats.count(rows, rows * 10)
+        stats.tasks, stats.elapsed = 1, 1.0
+        results.append((pid, stats))
+
+    workers = per_worker(results)
+    assert list(workers) == [1, 2]
+    assert (workers[2].rows, workers[2].tasks, workers[2].elapsed) == (40, 2, 2.0)
+
+    total = Stats()
+    for stats in workers.values():
+        total.add(stats)
+    total.elapsed = 2.0
+    data = report(total, workers, {'jobs': 2})
+    assert data['lines'] == 60
+    assert data['lines_per_second'] == 30
+    assert [w['lines'] for w in data['workers']] == [20, 40]
+    assert json.loads(json.dumps(data)) == data
+
+
+def test_write_report(tmp_path, capsys):
+    path = tmp_path / 'stats.json'
+    write_report({'lines': 1}, str(path))
+    assert json.loads(path.read_text()) == {'lines': 1}
+
+    write_report({'lines': 2})
+    assert json.loads(capsys.readouterr().err) == {'lines': 2}
+
+
+def test_progress_line():
+    assert progress_line(500, 2_000_000, 2.0, 1000) == \
+        '500/1,000 lines (50%), 2.0 MB in 2.0 s (250 lines/s, 1.0 MB/s)'
+    assert progress_line(500, 0, 1.0).startswith('500 lines,')
+
+
+def test_show_progress():
+    progress = Progress()
+    out = io.StringIO()
+    with show_progress(progress, 20, out, interval=0.01):
+        progress.add(20, 100)
+    lines = out.getvalue().splitlines()
+    assert lines[-1].startswith('20/20 lines (100%)')
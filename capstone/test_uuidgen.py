@@ -0,0 +1,43 @@
+import concurrent.futures
+import random
+import uuid
+
+from uuidgen import format_uuids, random_uuids, uuid_stream, next_uuid
+
+
+def test_format_uuids():
+    data = bytes(range(32))
+    assert format_uuids(data) == [
+        str(uuid.UUID(bytes=data[:16], version=4)),
+        str(uuid.UUID(bytes=data[16:], version=4)),
+    ]
+
+
+def test_random_uuids_are_valid():
+    values = random_uuids(1000)
+    assert len(values) == len(set(values)) == 1000
+    for value in values:
+        parsed = uuid.UUID(value)
+        assert str(parsed) == value
+        assert parsed.version == 4
+        assert parsed.variant == uuid.RFC_4122
+
+
+def test_seeded_stream_is_reproducible():
+    def first(seed, count):
+        stream = uuid_stream(random.Random(seed).randbytes, batch_size=8)
+        return [next(stream) for _ in range(count)]
+
+    assert first(1, 20) == first(1, 20)
+    assert first(1, 20) != first(2, 20)
+
+
+def test_next_uuid():
+    assert next_uuid() != next_uuid()
+
+
+def test_next_uuid_from_threads():
+    with concurrent.futures.ThreadPoolExecutor(4) as executor:
+        batches = list(executor.map(lambda _: [next_uuid() for _ in range(10_000)], range(8)))
+    values = [value for batch in batches for value in batch]
+    assert len(set(values)) == len(values) == 80_000
@@ -0,0 +1,67 @@
+'''
+Bulk generation of random UUID-shaped strings for "str:rand" fields.
+
+uuid.uuid4() calls os.urandom and builds a UUID object for every value.
+Here the random bytes for a whole batch are read at once and formatted
+into strings with a handful of slice operations over the entire batch.
+
+The randomness source is a function taking a byte count (like os.urandom),
+so a seeded random.Random(seed).randbytes gives reproducible output.
+'''
+import os
+from typing import Callable, Iterator
+
+BATCH_SIZE = 4096
+
+# sets the version nibble to 4 and the variant bits to 10 (RFC 4122)
+_VERSION = bytes((b & 0x0f) | 0x40 for b in range(256))
+_VARIANT = bytes((b & 0x3f) | 0x80 for b in range(256))
+
+# positions of the 32 hex digits in a 36 character UUID string
+_HEX_POSITIONS = [i for i in range(36) if i not in (8, 13, 18, 23)]
+
+
+def format_uuids(data: bytes) -> list[str]:
+    '''Formats every 16 bytes of data as a version 4 UUID string'''
+    n = len(data) // 16
+    data = bytearray(data[:n * 16])
+    data[6::16] = data[6::16].translate(_VERSION)
+    data[8::16] = data[8::16].translate(_VARIANT)
+    digits = data.hex().encode()
+
+    # every UUID takes 36 characters plus a separator
+    out = bytearray(b'-' * (37 * n))
+    out[36::37] = b' ' * n
+    for i, pos in enumerate(_HEX_POSITIONS):
+        out[pos::37] = digits[i::32]
+    return out.decode().split()
+
+
+def random_uuids(n: int, randbytes: Callable[[int], bytes] = os.urandom) -> list[str]:
+    '''Returns n random UUID strings, reading all the entropy at once'''
+    return format_uuids(randbytes(16 * n))
+
+
+def uuid_stream(randbytes: Callable[[int], bytes] = os.urandom,
+                batch_size: int = BATCH_SIZE) -> Iterator[str]:
+    '''Yields UUID strings one by one, generating them batch_size at a time'''
+    while True:
+        yield from random_uuids(batch_size, randbytes)
+
+
+_buffer = []
+
+
+def next_uuid() -> str:
+    '''Next UUID of the shared buffer for unseeded generation.
+    Safe to call from several threads: list.pop is atomic, and a thread
+    finding the buffer empty refills it.'''
+    while True:
+        try:
+            return _buffer.pop()
+        except IndexError:
+            _buffer.extend(random_uuids(BATCH_SIZE))
+
+
+# forked processes must not hand out the UUIDs that were already buffered in the parent
+os.register_at_fork(after_in_child=_buffer.clear)
@@ -0,0 +1,41 @@
+'''
+Word lists for the "name" and "email" field types.
+
+Every possible value is formatted once into a table, so generating a
+name or an email is a single random choice from the table, in the
+row-at-a-time and in the batch generation paths alike.
+'''
+import functools
+
+FIRST_NAMES = (
+    'Alice', 'Amelia', 'Anna', 'Ava', 'Benjamin', 'Carlos', 'Charlotte', 'Chen',
+    'Daniel', 'David', 'Elena', 'Emma', 'Ethan', 'Fatima', 'Grace', 'Hannah',
+    'Hiroshi', 'Isabella', 'Ivan', 'Jack', 'James', 'Julia', 'Kenji', 'Laura',
+    'Leo', 'Liam', 'Lucas', 'Maria', 'Mateo', 'Mia', 'Mohammed', 'Noah',
+    'Nora', 'Olivia', 'Omar', 'Oscar', 'Priya', 'Rafael', 'Rosa', 'Samuel',
+    'Sara', 'Sofia', 'Thomas', 'Victor', 'William', 'Yara', 'Yusuf', 'Zoe',
+)
+
+LAST_NAMES = (
+    'Adams', 'Ahmed', 'Anderson', 'Brown', 'Clark', 'Costa', 'Davis', 'Dubois',
+    'Garcia', 'Gonzalez', 'Green', 'Hall', 'Harris', 'Hernandez', 'Ito', 'Jackson',
+    'Johnson', 'Jones', 'Kim', 'King', 'Kowalski', 'Lee', 'Lewis', 'Lopez',
+    'Martin', 'Martinez', 'Miller', 'Moore', 'Muller', 'Nguyen', 'Novak', 'Patel',
+    'Perez', 'Petrov', 'Robinson', 'Rossi', 'Sanchez', 'Silva', 'Singh', 'Smith',
+    'Suzuki', 'Taylor', 'Thomas', 'Thompson', 'Walker', 'White', 'Williams', 'Wilson',
+)
+
+EMAIL_DOMAINS = ('example.com', 'example.net', 'example.org', 'mail.test', 'corp.test')
+
+
+@functools.cache
+def name_table() -> tuple[str, ...]:
+    '''Every "First Last" name'''
+    return tuple(f'{first} {last}' for first in FIRST_NAMES for last in LAST_NAMES)
+
+
+@functools.cache
+def email_table() -> tuple[str, ...]:
+    '''Every "first.last@domain" address'''
+    return tuple(f'{first.lower()}.{last.lower()}@{domain}'
+                 for first in FIRST_NAMES for last in LAST_NAMES for domain in EMAIL_DOMAINS)